@@ -147,6 +147,8 @@ class GlobalRecordingService {
             'no_token', // FCM token for notifications (fallback if null)
         'isNotified':
             false, // Whether estimated time notification has been sent
+        'startedAt':
+            ServerValue.timestamp, // Identifies this recording session for notification dedup
       };
 
       await _database.ref(mechanicId).set(recordingData);
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+MechLink Adaptive Interval
+Poll intervals that back off while nothing changes and tighten ahead of known deadlines
+"""
+
+import random
+from typing import Dict, Any, Optional
+
+class AdaptiveInterval:
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0, jitter: float = 0.1):
+        """Wait min_interval between busy polls, multiplying by backoff per idle poll up to max_interval
+
+        Every interval is spread by +/- jitter (a fraction) so instances started together drift apart,
+        capped at the next deadline, then clamped to [min_interval, max_interval].
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.current = min_interval
+
+        # Statistics
+        self.idle_polls = 0
+        self.last_interval = min_interval
+
+    def next_interval(self, busy: bool, deadline_in: Optional[float] = None) -> float:
+        """Seconds until the next poll; deadline_in (seconds to the next known deadline) caps it"""
+        if busy:
+            self.current = self.min_interval
+            self.idle_polls = 0
+        else:
+            self.current = min(self.max_interval, self.current * self.backoff)
+            self.idle_polls += 1
+
+        # Jitter first, so a deadline is never overshot by up to jitter
+        interval = self.current * (1 + random.uniform(-self.jitter, self.jitter))
+        if deadline_in is not None:
+            interval = min(interval, deadline_in)
+        self.last_interval = min(self.max_interval, max(self.min_interval, interval))
+        return self.last_interval
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get interval statistics"""
+        return {
+            'last_interval': round(self.last_interval, 3),
+            'idle_polls': self.idle_polls
+        }
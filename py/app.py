@@ -1,14 +1,96 @@
 # app.py
+import argparse
 import multiprocessing
+import time
 import task_notification_service
 import task_monitoring_service
+from backends import create_backend
+import metrics
+from structured_logging import configure_logging, get_logger, shutdown_logging
+from recordings_mirror import RecordingsMirror, RecordingsFeed
+from rtdb_write_buffer import RTDBWriteBuffer
+from state_checkpoint import open_checkpoint
+from shard_coordinator import open_shard
 
-if __name__ == "__main__":
-    p1 = multiprocessing.Process(target=task_notification_service.main)
-    p2 = multiprocessing.Process(target=task_monitoring_service.main)
+logger = get_logger('app')
+
+def run_combined(streaming: bool = True, backend_name: str = None, metrics_port: int = None, shard: bool = False, worker_id: str = None):
+    """Run both services in one process on one backend, one recordings feed, one RTDB write buffer and one shard lease"""
+    logger.info("Starting MechLink Services (combined)")
+
+    backend = create_backend(backend_name)
+    db_ref, firestore_client = backend.db_ref, backend.firestore_client
+    write_buffer = RTDBWriteBuffer(db_ref)
+    mirror = RecordingsMirror()
+    feed = RecordingsFeed(db_ref, mirror, streaming=streaming)
+    shard_coordinator = open_shard(db_ref, shard, worker_id)
+
+    # With MECHLINK_CHECKPOINT_DIR set, each service persists its state there and resumes from it on restart
+    monitoring_service = task_monitoring_service.TaskMonitoringService(
+        db_ref=db_ref, firestore_client=firestore_client, write_buffer=write_buffer, recordings_mirror=mirror,
+        shard=shard_coordinator, checkpoint=open_checkpoint('monitoring')
+    )
+    notification_service = task_notification_service.TaskNotificationService(
+        db_ref=db_ref, firestore_client=firestore_client, write_buffer=write_buffer, recordings_mirror=mirror,
+        messaging_transport=backend.messaging_transport, shard=shard_coordinator, checkpoint=open_checkpoint('notification')
+    )
+
+    try:
+        if metrics_port is not None:
+            metrics.REGISTRY.start_http_server(metrics_port)
+        write_buffer.start()
+        feed.start()
+        monitoring_service.start_monitoring()
+        notification_service.start_monitoring()
+
+        # Keep the main thread alive
+        while True:
+            time.sleep(300)  # Print stats every 5 minutes
+            logger.info("Feed stats", extra={'stats': feed.get_statistics()})
+            logger.info("Monitoring service stats", extra={'stats': monitoring_service.get_statistics()})
+            logger.info("Notification service stats", extra={'stats': notification_service.get_statistics()})
+
+    except KeyboardInterrupt:
+        logger.info("Shutting down MechLink Services")
+        notification_service.stop_monitoring()
+        monitoring_service.stop_monitoring()
+        feed.stop()
+        write_buffer.stop()
+        for checkpoint in (monitoring_service.checkpoint, notification_service.checkpoint):
+            if checkpoint:
+                checkpoint.close()
+        metrics.REGISTRY.stop_http_server()
+        logger.info("MechLink Services stopped")
+
+def run_processes(shard: bool = False, worker_id: str = None):
+    """Run each service in its own process with its own Firebase app (previous layout); both hold the same shard lease"""
+    p1 = multiprocessing.Process(target=task_notification_service.main, kwargs={'shard': shard, 'worker_id': worker_id})
+    p2 = multiprocessing.Process(target=task_monitoring_service.main, kwargs={'shard': shard, 'worker_id': worker_id})
 
     p1.start()
     p2.start()
 
     p1.join()
     p2.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MechLink services")
+    parser.add_argument('--mode', choices=['combined', 'processes'], default='combined',
+                        help="combined: one process sharing Firebase clients (default); processes: one process per service")
+    parser.add_argument('--polling', action='store_true', help="Poll the recordings tree every second instead of streaming it (combined mode)")
+    parser.add_argument('--backend', choices=['firebase', 'fake'], help="Backend for combined mode (default: $MECHLINK_BACKEND or firebase)")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (combined mode)")
+    parser.add_argument('--shard', action='store_true', help="Split mechanics with the other sharded workers (also: MECHLINK_SHARD=1)")
+    parser.add_argument('--worker-id', help="Stable shard worker ID, the same after a restart (default: $MECHLINK_WORKER_ID or the host name)")
+    args = parser.parse_args()
+
+    if args.mode == 'combined':
+        configure_logging()
+        try:
+            run_combined(streaming=not args.polling, backend_name=args.backend, metrics_port=args.metrics_port,
+                         shard=args.shard, worker_id=args.worker_id)
+        finally:
+            shutdown_logging()
+    else:
+        # Each service process configures its own logging
+        run_processes(shard=args.shard, worker_id=args.worker_id)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+MechLink Async Service Runtime
+Runs a blocking service tick at a fixed rate from an asyncio event loop, fanning its Admin SDK calls out to a thread pool
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from structured_logging import get_logger
+
+logger = get_logger('runtime')
+
+# Concurrent blocking calls allowed per backend
+DEFAULT_CONCURRENCY = {
+    'rtdb': 8,
+    'firestore': 8
+}
+
+class AsyncServiceRuntime:
+    def __init__(self, name: str, max_workers: int = 16, concurrency: Optional[Dict[str, int]] = None):
+        """Initialize the runtime (the event loop starts with start())"""
+        self.name = name
+        self.max_workers = max_workers
+        self.concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.main_task: Optional[asyncio.Task] = None
+        self.thread = None
+        self.started = threading.Event()
+
+        # Counters
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.last_tick_seconds = 0.0
+        self.max_tick_seconds = 0.0
+
+    def start(self, tick: Callable[[], Any], interval: float):
+        """Run the blocking tick in the thread pool every interval seconds, scheduled by a dedicated event loop thread"""
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run_loop, args=(tick, interval), name=self.name, daemon=True)
+        self.thread.start()
+        self.started.wait(timeout=10)
+
+    def stop(self, timeout: float = 10):
+        """Cancel the tick loop and wait for the event loop to finish"""
+        if self.loop and self.main_task:
+            self.loop.call_soon_threadsafe(self.main_task.cancel)
+        if self.thread:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    async def run_blocking(self, backend: str, function: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call in the thread pool, bounded by the backend's semaphore"""
+        async with self.semaphores[backend]:
+            return await self.loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    def map_blocking(self, backend: str, function: Callable, items: Iterable) -> List[Any]:
+        """From a tick: call function on every item concurrently, at most the backend's limit at once, and wait for the results"""
+        items = list(items)
+        if not items:
+            return []
+
+        async def gather():
+            return await asyncio.gather(*(self.run_blocking(backend, function, item) for item in items))
+        return asyncio.run_coroutine_threadsafe(gather(), self.loop).result()
+
+    def _run_loop(self, tick: Callable[[], Any], interval: float):
+        """Thread target: own the event loop until the tick loop is cancelled"""
+        try:
+            asyncio.run(self._main(tick, interval))
+        except Exception as e:
+            logger.exception("Error in runtime: %s", e, extra={'runtime': self.name})
+
+    async def _main(self, tick: Callable[[], Any], interval: float):
+        """Set up loop resources and run ticks until cancelled"""
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self.semaphores = {backend: asyncio.Semaphore(limit) for backend, limit in self.concurrency.items()}
+        self.main_task = asyncio.current_task()
+        self.started.set()
+
+        try:
+            await self._tick_at_fixed_rate(tick, interval)
+        except asyncio.CancelledError:
+            logger.info("Runtime cancelled", extra={'runtime': self.name})
+        finally:
+            self.executor.shutdown(wait=True)
+
+    async def _tick_at_fixed_rate(self, tick: Callable[[], Any], interval: float):
+        """Tick on a fixed schedule so slow ticks don't push every later tick back"""
+        next_tick = self.loop.time()
+        while True:
+            started = time.perf_counter()
+            try:
+                running = self.loop.run_in_executor(self.executor, tick)
+                await asyncio.shield(running)
+            except asyncio.CancelledError:
+                # Let the running tick finish first - its map_blocking calls still need this loop and pool
+                await asyncio.wait([running])
+                raise
+            except Exception as e:
+                logger.exception("Error in tick: %s", e, extra={'runtime': self.name})
+
+            elapsed = time.perf_counter() - started
+            self.ticks += 1
+            self.last_tick_seconds = elapsed
+            self.max_tick_seconds = max(self.max_tick_seconds, elapsed)
+
+            next_tick += interval
+            now = self.loop.time()
+            if now > next_tick:
+                # Overran - skip the ticks that were missed instead of running them back to back
+                missed = int((now - next_tick) // interval) + 1
+                self.missed_ticks += missed
+                next_tick += missed * interval
+            await asyncio.sleep(next_tick - now)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get tick statistics"""
+        return {
+            'ticks': self.ticks,
+            'missed_ticks': self.missed_ticks,
+            'last_tick_ms': round(self.last_tick_seconds * 1000, 2),
+            'max_tick_ms': round(self.max_tick_seconds * 1000, 2)
+        }
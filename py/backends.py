@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+MechLink Backends
+The live Firebase project or in-memory fakes behind one interface, so services can run and be load-tested offline
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+import firebase_setup
+from fake_firebase import FakeDatabase, FakeFirestore, FakeMessagingTransport, LatencyModel
+from notification_dispatcher import FcmTransport
+
+class FirebaseBackend:
+    name = 'firebase'
+
+    def __init__(self, credential_path: Optional[str] = None, database_url: Optional[str] = None):
+        """Connect to Firebase (credentials and URL default to the MECHLINK_* environment, then the production project)"""
+        self.app, self.db_ref, self.firestore_client = firebase_setup.initialize_firebase(credential_path, database_url)
+        self.messaging_transport = FcmTransport(self.app)
+
+    def get_call_counts(self) -> Dict[str, Dict[str, int]]:
+        """Backend call counters (not tracked for the live project)"""
+        return {}
+
+class FakeBackend:
+    name = 'fake'
+
+    def __init__(self, recordings: Optional[Dict[str, Any]] = None, collections: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None,
+                 rtdb_latency: Optional[LatencyModel] = None, firestore_latency: Optional[LatencyModel] = None,
+                 fcm_latency: Optional[LatencyModel] = None):
+        """In-memory Realtime Database, Firestore and FCM with optional per-call latency"""
+        self.database = FakeDatabase(recordings, rtdb_latency)
+        self.firestore = FakeFirestore(collections, firestore_latency)
+        self.db_ref = self.database.reference()
+        self.firestore_client = self.firestore
+        self.messaging_transport = FakeMessagingTransport(fcm_latency)
+
+    def get_call_counts(self) -> Dict[str, Dict[str, int]]:
+        """Backend calls made so far, by backend and method"""
+        return {
+            'rtdb': self.database.call_counts(),
+            'firestore': self.firestore.call_counts(),
+            'fcm': self.messaging_transport.call_counts()
+        }
+
+BACKENDS = {
+    'firebase': FirebaseBackend,
+    'fake': FakeBackend
+}
+
+def create_backend(name: Optional[str] = None):
+    """Create the backend named by name or MECHLINK_BACKEND (default: firebase)"""
+    name = name or os.environ.get('MECHLINK_BACKEND', 'firebase')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}' (expected one of: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[name]()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+MechLink Service Benchmarks
+Offline benchmarks for the monitoring and notification services using the in-memory Firebase fakes
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Sequence
+
+from backends import FakeBackend
+from fake_firebase import FakeDatabase, LatencyModel
+import metrics
+from recordings_mirror import RecordingsMirror, RecordingsSnapshotFetcher
+from rtdb_write_buffer import RTDBWriteBuffer
+from task_monitoring_service import TaskMonitoringService
+from task_notification_service import TaskNotificationService
+from tracked_recording import TrackedRecording, BACKGROUND
+
+def _make_recordings(count: int) -> Dict[str, Any]:
+    """Build a synthetic fleet of running recordings"""
+    return {
+        f"mechanic_{i:05d}": {
+            'taskId': f"task_{i:05d}",
+            'jobId': f"job_{i % 500:03d}",
+            'duration': i % 3600,
+            'status': 'running',
+            'deviceId': f"device_{i:05d}",
+            'isNotified': False
+        }
+        for i in range(count)
+    }
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    """Summarize tick timings in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3)
+    }
+
+def _legacy_sleep_scan(tracked: Dict[str, Dict[str, Any]], recordings: Dict[str, Any], current_time: datetime, timeout: float):
+    """The previous per-tick pass: compare every running recording against its tracked state"""
+    for mechanic_id, recording_data in recordings.items():
+        if isinstance(recording_data, dict) and recording_data.get('status') == 'running':
+            entry = tracked[mechanic_id]
+            duration = recording_data.get('duration', 0)
+            if duration != entry['lastDuration']:
+                entry['lastDuration'] = duration
+                entry['lastUpdateTime'] = current_time
+                continue
+            time_since_update = (current_time - entry['lastUpdateTime']).total_seconds()
+            if time_since_update >= timeout and not entry['isBackgroundRecording']:
+                entry['isBackgroundRecording'] = True
+
+def bench_sleep_detection(recordings: int = 10000, ticks: int = 50, active_fraction: float = 0.01) -> Dict[str, Any]:
+    """Tick cost of sleep detection: full scan vs deadline scheduler"""
+    fleet = _make_recordings(recordings)
+    active = max(1, int(recordings * active_fraction))
+
+    # Previous layout: scan every recording on every tick
+    current_time = datetime.now()
+    tracked = {
+        mechanic_id: {'lastDuration': data['duration'], 'lastUpdateTime': current_time, 'isBackgroundRecording': False}
+        for mechanic_id, data in fleet.items()
+    }
+    scan_samples = []
+    for tick in range(ticks):
+        for i in range(active):
+            fleet[f"mechanic_{(tick * active + i) % recordings:05d}"]['duration'] += 1
+        started = time.perf_counter()
+        _legacy_sleep_scan(tracked, fleet, datetime.now(), 5)
+        scan_samples.append(time.perf_counter() - started)
+
+    # Deadline scheduler: a tick only touches changed or due recordings
+    database = FakeDatabase(_make_recordings(recordings))
+    service = TaskMonitoringService(db_ref=database.reference(), streaming=True)
+    service.listener = service.db_ref.listen(service.recordings_mirror.on_event)
+    service._check_recordings()
+
+    scheduler_samples = []
+    for tick in range(ticks):
+        for i in range(active):
+            mechanic_id = f"mechanic_{(tick * active + i) % recordings:05d}"
+            duration = service.recordings_mirror.get(mechanic_id)['duration']
+            database.reference(mechanic_id).child('duration').set(duration + 1)
+        started = time.perf_counter()
+        service._check_recordings()
+        scheduler_samples.append(time.perf_counter() - started)
+    service.listener.close()
+
+    return {
+        'recordings': recordings,
+        'changed_per_tick': active,
+        'full_scan': _summarize(scan_samples),
+        'deadline_scheduler': _summarize(scheduler_samples)
+    }
+
+def _measure_allocation(build) -> Any:
+    """Build a structure and return it with the bytes it allocated"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = build()
+        return value, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def bench_tracked_state(recordings: int = 50000, ticks: int = 20, active_fraction: float = 0.5,
+                        sleep_timeout: float = 5) -> Dict[str, Any]:
+    """Memory and tick time of tracked recording state: dicts with datetime vs slotted records
+
+    Both layouts scan the whole table for sleeping apps (see bench_sleep_detection for the scheduler the service uses instead);
+    recordings outside the active fraction stopped updating sleep_timeout ago, so the first tick finds them asleep.
+    """
+    fleet = _make_recordings(recordings)
+    active = [mechanic_id for i, mechanic_id in enumerate(fleet) if i < recordings * active_fraction]
+    asleep = len(fleet) - len(active)
+
+    # Previous layout: six-key dict per mechanic with a datetime timestamp, and a scan of the table every tick
+    last_seen = datetime.now() - timedelta(seconds=sleep_timeout)
+    dict_state, dict_bytes = _measure_allocation(lambda: {
+        mechanic_id: {
+            'taskId': data['taskId'], 'lastDuration': data['duration'], 'lastUpdateTime': last_seen,
+            'isBackgroundRecording': False, 'deviceId': data['deviceId'], 'isNotified': data['isNotified']
+        }
+        for mechanic_id, data in fleet.items()
+    })
+    dict_samples, dict_detected = [], 0
+    for tick in range(ticks):
+        started = time.perf_counter()
+        current_time = datetime.now()
+        for mechanic_id in active:
+            entry = dict_state[mechanic_id]
+            entry['lastDuration'] += 1
+            entry['lastUpdateTime'] = current_time
+        for mechanic_id, entry in dict_state.items():
+            if not entry['isBackgroundRecording'] and (current_time - entry['lastUpdateTime']).total_seconds() >= sleep_timeout:
+                entry['isBackgroundRecording'] = True
+                dict_detected += 1
+        dict_samples.append(time.perf_counter() - started)
+
+    # Slotted records with monotonic timestamps and packed status bits, scanned the same way
+    last_seen = time.monotonic() - sleep_timeout
+    slots_state, slots_bytes = _measure_allocation(lambda: {
+        mechanic_id: TrackedRecording(data['taskId'], data['deviceId'], data['duration'], last_seen, data['isNotified'])
+        for mechanic_id, data in fleet.items()
+    })
+    slots_samples, slots_detected = [], 0
+    for tick in range(ticks):
+        started = time.perf_counter()
+        current_time = time.monotonic()
+        for mechanic_id in active:
+            tracked = slots_state[mechanic_id]
+            tracked.last_duration += 1
+            tracked.last_update = current_time
+        cutoff = current_time - sleep_timeout
+        for tracked in slots_state.values():
+            if not tracked.flags & BACKGROUND and tracked.last_update <= cutoff:
+                tracked.flags |= BACKGROUND
+                slots_detected += 1
+        slots_samples.append(time.perf_counter() - started)
+
+    return {
+        'recordings': recordings,
+        'updated_per_tick': len(active),
+        'asleep': asleep,
+        'dict_datetime': {'bytes_per_recording': round(dict_bytes / recordings, 1), 'asleep_detected': dict_detected, **_summarize(dict_samples)},
+        'slots_monotonic': {'bytes_per_recording': round(slots_bytes / recordings, 1), 'asleep_detected': slots_detected, **_summarize(slots_samples)}
+    }
+
+def _build_fleet(mechanics: int, seconds: float, rng: random.Random, started_at: float):
+    """Recordings, Firestore collections and expected exceedance times for a synthetic fleet
+
+    Every tenth task reaches its estimated time during the run; the rest never do.
+    """
+    recordings, tasks, mechanic_docs, deadlines = {}, {}, {}, {}
+    for i in range(mechanics):
+        mechanic_id, task_id = f"mechanic_{i:05d}", f"task_{i:05d}"
+        duration = rng.randrange(0, 3600)
+        if i % 10 == 0:
+            remaining = rng.randrange(3, max(4, int(seconds) - 2))
+            deadlines[mechanic_id] = started_at + remaining
+        else:
+            remaining = 10 * 3600
+        recordings[mechanic_id] = {
+            'taskId': task_id, 'jobId': f"job_{i % 500:03d}", 'duration': duration,
+            'status': 'running', 'deviceId': f"token_{i:05d}", 'isNotified': False,
+            'startedAt': int((started_at - duration) * 1000)
+        }
+        tasks[task_id] = {'title': f"Task {i}", 'estimatedTime': duration + remaining, 'status': 'inProgress'}
+        mechanic_docs[mechanic_id] = {'name': f"Mechanic {i}"}
+    return recordings, {'tasks': tasks, 'mechanics': mechanic_docs}, deadlines
+
+def _count_calls(backend: FakeBackend) -> int:
+    """Total backend calls made so far"""
+    return sum(sum(calls.values()) for calls in backend.get_call_counts().values())
+
+def _run_fleet(mechanics: int, seconds: float, sleep_churn: float, seed: int) -> Dict[str, Any]:
+    """Drive both services against a latency-modelled fake backend for a number of one-second ticks"""
+    rng = random.Random(seed)
+    started_at = time.time()
+    recordings, collections, deadlines = _build_fleet(mechanics, seconds, rng, started_at)
+    base_durations = {mechanic_id: data['duration'] for mechanic_id, data in recordings.items()}
+    backend = FakeBackend(recordings, collections,
+                          rtdb_latency=LatencyModel(0.002, 0.003), firestore_latency=LatencyModel(0.005, 0.01),
+                          fcm_latency=LatencyModel(0.02, 0.03))
+
+    # Combined layout: one mirror and write buffer shared by both services
+    mirror = RecordingsMirror()
+    listener = backend.db_ref.listen(mirror.on_event)
+    write_buffer = RTDBWriteBuffer(backend.db_ref)
+    monitoring = TaskMonitoringService(db_ref=backend.db_ref, firestore_client=backend.firestore_client,
+                                       write_buffer=write_buffer, recordings_mirror=mirror)
+    notification = TaskNotificationService(db_ref=backend.db_ref, firestore_client=backend.firestore_client,
+                                           write_buffer=write_buffer, messaging_transport=backend.messaging_transport,
+                                           recordings_mirror=mirror)
+    notification.notification_dispatcher.start()
+
+    awake = set(recordings)
+    asleep = set()
+    monitoring_samples, notification_samples, calls_per_tick = [], [], []
+    for tick in range(int(seconds)):
+        tick_started = time.monotonic()
+
+        # App-sleep churn: some awake apps fall asleep and some sleeping apps wake up
+        falling_asleep = rng.sample(sorted(awake), int(len(awake) * sleep_churn))
+        waking_up = rng.sample(sorted(asleep), int(len(asleep) * sleep_churn))
+        awake.difference_update(falling_asleep)
+        awake.update(waking_up)
+        asleep.difference_update(waking_up)
+        asleep.update(falling_asleep)
+
+        # Awake apps write their own duration (not counted as service calls)
+        elapsed = int(time.time() - started_at)
+        backend.database.update([], {f"{mechanic_id}/duration": base_durations[mechanic_id] + elapsed for mechanic_id in awake})
+
+        calls_before = _count_calls(backend)
+        started = time.perf_counter()
+        monitoring._check_recordings()
+        monitoring_samples.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        notification._tick()
+        notification_samples.append(time.perf_counter() - started)
+        calls_per_tick.append(_count_calls(backend) - calls_before)
+
+        time.sleep(max(0, tick_started + 1 - time.monotonic()))
+
+    notification.notification_dispatcher.stop()
+    listener.close()
+
+    transport = backend.messaging_transport
+    lateness = [
+        sent_at - deadlines[message.data['mechanicId']]
+        for message, sent_at in zip(transport.sent, transport.sent_at)
+        if message.data['mechanicId'] in deadlines
+    ]
+    return {
+        'mechanics': mechanics,
+        'monitoring_tick': _summarize(monitoring_samples),
+        'notification_tick': _summarize(notification_samples),
+        'backend_calls_per_tick': {'mean': round(statistics.mean(calls_per_tick), 1), 'max': max(calls_per_tick)},
+        'notifications': f"{len(lateness)}/{len(deadlines)}",
+        'lateness': _summarize(lateness) if lateness else None
+    }
+
+def bench_fleet(sizes: Sequence[int] = (100, 1000, 10000, 50000), seconds: float = 15, sleep_churn: float = 0.02) -> Dict[str, Any]:
+    """Both services end to end on synthetic fleets: tick latency, backend calls per tick and notification lateness"""
+    return {f"{size}_mechanics": _run_fleet(size, seconds, sleep_churn, seed=size) for size in sizes}
+
+def _rtdb_payload_bytes() -> float:
+    """RTDB bytes read so far, over every read method"""
+    return sum(metrics.PAYLOAD_BYTES.get(backend='rtdb', method=method) for method in ('get', 'get_shallow', 'get_if_changed'))
+
+def bench_snapshot_fetch(recordings: int = 10000, ticks: int = 10, running_fraction: float = 0.3, idle_ticks: int = 2) -> Dict[str, Any]:
+    """Steady-state bytes, requests and time per one-second poll: whole-tree get() vs root-ETag fetches vs
+    per-recording ETag fetches vs a streaming listener
+
+    Every running app writes its duration each second, so the tree changes between every busy poll; the
+    idle_ticks polls after every recording stopped (e.g. overnight) see no change at all.
+    """
+    backend = FakeBackend(recordings=_make_recordings(recordings))
+    mechanic_ids = list(backend.database.read([]))
+    running = random.Random(recordings).sample(mechanic_ids, int(recordings * running_fraction))
+    fetchers = {'tree_fetcher': RecordingsSnapshotFetcher(backend.db_ref), 'per_node_fetcher': RecordingsSnapshotFetcher(backend.db_ref, per_node=True)}
+    for fetcher in fetchers.values():
+        fetcher.fetch()
+    streamed = []
+    listener = backend.db_ref.listen(lambda event: streamed.append(metrics.payload_size(event.data)))
+
+    phases = {'busy': ticks, 'idle': idle_ticks}
+    results = {phase: {name: {'bytes': [], 'requests': [], 'seconds': []} for name in ['full_get', *fetchers, 'streaming']} for phase in phases}
+    def measure(phase, name, read):
+        started, read_before, calls_before = time.perf_counter(), _rtdb_payload_bytes(), _count_calls(backend)
+        read()
+        results[phase][name]['seconds'].append(time.perf_counter() - started)
+        results[phase][name]['bytes'].append(_rtdb_payload_bytes() - read_before)
+        results[phase][name]['requests'].append(_count_calls(backend) - calls_before)
+
+    for phase, phase_ticks in phases.items():
+        if phase == 'idle':
+            # Every app stops recording; the fetchers catch up once before the quiet polls are measured
+            backend.db_ref.update({f"{mechanic_id}/status": 'stopped' for mechanic_id in running})
+            for fetcher in fetchers.values():
+                fetcher.fetch()
+        for tick in range(phase_ticks):
+            streamed.clear()
+            if phase == 'busy':
+                backend.db_ref.update({f"{mechanic_id}/duration": tick + 1 for mechanic_id in running})
+            measure(phase, 'full_get', lambda: metrics.record_payload('rtdb', 'get', backend.db_ref.get()))
+            for name, fetcher in fetchers.items():
+                measure(phase, name, fetcher.fetch)
+            # Events pushed down the open stream during the second, with no requests
+            for name, values in (('bytes', [sum(streamed)]), ('requests', [0]), ('seconds', [0.0])):
+                results[phase]['streaming'][name].extend(values)
+    listener.close()
+    for fetcher in fetchers.values():
+        fetcher.close()
+
+    return {
+        'recordings': recordings,
+        'running': len(running),
+        **{phase: {name: {'bytes_per_tick': int(statistics.mean(result['bytes'])), 'requests_per_tick': statistics.mean(result['requests']),
+                          **_summarize(result['seconds'])} for name, result in phase_results.items()}
+           for phase, phase_results in results.items()}
+    }
+
+BENCHMARKS = {
+    'sleep-detection': bench_sleep_detection,
+    'tracked-state': bench_tracked_state,
+    'fleet': bench_fleet,
+    'snapshot-fetch': bench_snapshot_fetch
+}
+
+def main():
+    """Run the selected benchmarks and print their results"""
+    parser = argparse.ArgumentParser(description="MechLink service benchmarks")
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run (default: all of {', '.join(sorted(BENCHMARKS))})")
+    parser.add_argument('--fleet-sizes', help="Comma-separated fleet sizes for the fleet benchmark (default: 100,1000,10000,50000)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        kwargs = {}
+        if name == 'fleet' and args.fleet_sizes:
+            kwargs['sizes'] = [int(size) for size in args.fleet_sizes.split(',')]
+        print(f"{name}: {BENCHMARKS[name](**kwargs)}")
+
+if __name__ == "__main__":
+    main()
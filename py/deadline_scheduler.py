@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+MechLink Deadline Scheduler
+Min-heap of per-key deadlines with lazy invalidation, so a tick only touches entries that are due
+"""
+
+import heapq
+import itertools
+import threading
+from typing import Dict, Any, Hashable, List, Optional, Tuple
+
+class DeadlineScheduler:
+    def __init__(self):
+        """Initialize an empty scheduler"""
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.entries: Dict[Hashable, Tuple[float, int]] = {}
+        self.lock = threading.Lock()
+        self._sequence = itertools.count()
+
+        # Rebuild the heap once stale entries outnumber live ones by this factor
+        self.compaction_ratio = 2
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set (or move) the deadline for a key"""
+        with self.lock:
+            sequence = next(self._sequence)
+            self.entries[key] = (deadline, sequence)
+            heapq.heappush(self.heap, (deadline, sequence, key))
+
+            # Moving a deadline leaves the old heap entry behind; drop them in bulk when they pile up
+            if len(self.heap) > self.compaction_ratio * len(self.entries) + 64:
+                self._compact()
+
+    def cancel(self, key: Hashable):
+        """Remove the deadline for a key (its heap entry is discarded lazily)"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def pop_due(self, now: float) -> List[Hashable]:
+        """Remove and return every key whose deadline is at or before now"""
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, sequence, key = heapq.heappop(self.heap)
+                if self.entries.get(key) == (deadline, sequence):
+                    del self.entries[key]
+                    due.append(key)
+        return due
+
+    def next_deadline(self) -> Optional[float]:
+        """Get the earliest live deadline, if any"""
+        with self.lock:
+            while self.heap:
+                deadline, sequence, key = self.heap[0]
+                if self.entries.get(key) == (deadline, sequence):
+                    return deadline
+                heapq.heappop(self.heap)
+            return None
+
+    def get_deadline(self, key: Hashable) -> Optional[float]:
+        """Get the current deadline for a key"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[0] if entry else None
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get scheduler statistics"""
+        with self.lock:
+            return {
+                'scheduled': len(self.entries),
+                'heap_size': len(self.heap)
+            }
+
+    def _compact(self):
+        """Rebuild the heap from live entries only"""
+        self.heap = [(deadline, sequence, key) for key, (deadline, sequence) in self.entries.items()]
+        heapq.heapify(self.heap)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+MechLink Dedup Simulation
+Runs several notification workers against one shared in-memory backend and checks every exceedance
+is pushed exactly once, including when a Firestore commit fails or a worker crashes after claiming
+"""
+
+import argparse
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Any, List
+
+from backends import FakeBackend
+from notification_dedup import CLAIMS_COLLECTION, NotificationDedupIndex, notification_key
+from task_notification_service import TaskNotificationService
+
+def _make_exceedances(count: int, prefix: str = 'mechanic') -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Running recordings already past their task's estimatedTime, with their tasks and mechanics"""
+    now_ms = int(time.time() * 1000)
+    recordings, tasks, mechanics = {}, {}, {}
+    for i in range(count):
+        mechanic_id, task_id = f"{prefix}_{i:04d}", f"task_{prefix}_{i:04d}"
+        recordings[mechanic_id] = {
+            'taskId': task_id, 'duration': 120, 'status': 'running', 'deviceId': f"token_{i:04d}",
+            'isNotified': False, 'startedAt': now_ms - 120000
+        }
+        tasks[task_id] = {'title': f"Task {i}", 'estimatedTime': 60, 'status': 'inProgress'}
+        mechanics[mechanic_id] = {'name': f"Mechanic {i}"}
+    return {'recordings': recordings, 'tasks': tasks, 'mechanics': mechanics}
+
+def _make_worker(backend: FakeBackend, claim_lease: float = 60) -> TaskNotificationService:
+    """A notification worker on the shared backend with its own dispatcher and dedup fast path"""
+    service = TaskNotificationService(db_ref=backend.db_ref, firestore_client=backend.firestore_client,
+                                      messaging_transport=backend.messaging_transport)
+    service.dedup_index.claim_lease = timedelta(seconds=claim_lease)
+    service.notification_dispatcher.start()
+    return service
+
+def _run_full_checks(workers: List[TaskNotificationService], cycles: int):
+    """Every worker runs a full check at the same moment, cycles times over"""
+    barrier = threading.Barrier(len(workers))
+
+    def run(service: TaskNotificationService):
+        for _ in range(cycles):
+            barrier.wait()
+            service.next_full_check = 0
+            service._tick()
+
+    threads = [threading.Thread(target=run, args=(service,)) for service in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for service in workers:
+        service.notification_dispatcher.flush()
+
+def _count_documents(backend: FakeBackend, collection: str) -> int:
+    """Documents in a fake Firestore collection"""
+    return sum(1 for _ in backend.firestore_client.collection(collection).stream())
+
+def _outcome(backend: FakeBackend) -> Dict[str, Any]:
+    """What the workers left behind: claims, records, flags and pushes"""
+    claims = [claim.to_dict() for claim in backend.firestore_client.collection(CLAIMS_COLLECTION).stream()]
+    recordings = backend.database.read([]) or {}
+    pushed = [message.data['mechanicId'] for message in backend.messaging_transport.sent]
+    return {
+        'claims': len(claims),
+        'committed_claims': sum(1 for claim in claims if claim.get('committed')),
+        'notification_records': _count_documents(backend, 'notifications'),
+        'flagged': sum(1 for recording in recordings.values() if isinstance(recording, dict) and recording.get('notifiedThresholds')),
+        'pushes': len(pushed),
+        'pushed_more_than_once': sorted({mechanic_id for mechanic_id in pushed if pushed.count(mechanic_id) > 1})
+    }
+
+def _stop(workers: List[TaskNotificationService]):
+    """Stop every worker's dispatcher"""
+    for service in workers:
+        service.notification_dispatcher.stop()
+
+def simulate_race(workers: int = 3, exceedances: int = 50, cycles: int = 3) -> Dict[str, Any]:
+    """All workers see every exceedance at once; exactly one of them may push each"""
+    fleet = _make_exceedances(exceedances)
+    backend = FakeBackend(fleet['recordings'], {'tasks': fleet['tasks'], 'mechanics': fleet['mechanics']})
+    services = [_make_worker(backend) for _ in range(workers)]
+    _run_full_checks(services, cycles)
+    _stop(services)
+    return {
+        'workers': workers,
+        'exceedances': exceedances,
+        **_outcome(backend),
+        'claims_won': sum(service.dedup_index.claims_won for service in services),
+        'claims_lost': sum(service.dedup_index.claims_lost for service in services),
+        'claims_pending': sum(service.dedup_index.claims_pending for service in services)
+    }
+
+def simulate_commit_failure(workers: int = 3, exceedances: int = 50) -> Dict[str, Any]:
+    """The first notification commit fails while the other workers lose claims to it: nothing is flagged or pushed
+    for the released claims, and the next cycles send each notification once"""
+    fleet = _make_exceedances(exceedances)
+    backend = FakeBackend(fleet['recordings'], {'tasks': fleet['tasks'], 'mechanics': fleet['mechanics']})
+    services = [_make_worker(backend) for _ in range(workers)]
+
+    # Inject the failure at the first batch commit, after every notification of that worker's cycle was claimed
+    make_batch = backend.firestore_client.batch
+    failures = {'remaining': 1}
+    failures_lock = threading.Lock()
+
+    def failing_batch():
+        batch = make_batch()
+        with failures_lock:
+            fail = failures['remaining'] > 0
+            failures['remaining'] -= fail
+        if fail:
+            def commit():
+                raise RuntimeError("Injected Firestore commit failure")
+            batch.commit = commit
+        return batch
+
+    backend.firestore_client.batch = failing_batch
+    _run_full_checks(services, 1)
+    after_failure = {
+        **_outcome(backend),
+        'released': sum(service.dedup_index.releases for service in services),
+        'pending': sum(service.dedup_index.claims_pending for service in services)
+    }
+
+    _run_full_checks(services, 2)
+    _stop(services)
+    return {'workers': workers, 'exceedances': exceedances, 'after_failure': after_failure, 'after_retry': _outcome(backend)}
+
+def simulate_crash(workers: int = 3, exceedances: int = 50, claim_lease: float = 1) -> Dict[str, Any]:
+    """A worker crashed between claiming and committing: its claims hold everyone off until the lease runs out,
+    then exactly one worker takes each over and sends it"""
+    fleet = _make_exceedances(exceedances)
+    backend = FakeBackend(fleet['recordings'], {'tasks': fleet['tasks'], 'mechanics': fleet['mechanics']})
+    crashed = NotificationDedupIndex(backend.firestore_client, worker_id='crashed-worker')
+    for mechanic_id, recording in fleet['recordings'].items():
+        key = notification_key(mechanic_id, recording['taskId'], recording['startedAt'])
+        crashed.claim(mechanic_id, key, {'taskId': recording['taskId'], 'startedAt': recording['startedAt'], 'threshold': 1.0})
+
+    services = [_make_worker(backend, claim_lease) for _ in range(workers)]
+    _run_full_checks(services, 1)
+    within_lease = _outcome(backend)
+
+    time.sleep(claim_lease)
+    _run_full_checks(services, 2)
+    _stop(services)
+    return {
+        'workers': workers,
+        'exceedances': exceedances,
+        'within_lease': within_lease,
+        'after_lease': _outcome(backend),
+        'takeovers': sum(service.dedup_index.takeovers for service in services)
+    }
+
+def main():
+    """Run the simulations, print their results and fail if a notification was lost or repeated"""
+    parser = argparse.ArgumentParser(description="Notification dedup simulation against the in-memory backend")
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--exceedances', type=int, default=50)
+    args = parser.parse_args()
+
+    race = simulate_race(args.workers, args.exceedances)
+    failure = simulate_commit_failure(args.workers, args.exceedances)
+    crash = simulate_crash(args.workers, args.exceedances)
+    for name, result in (('race', race), ('commit_failure', failure), ('crash', crash)):
+        for key, value in result.items():
+            print(f"{name}.{key}: {value}")
+
+    n = args.exceedances
+    sent_once = {'claims': n, 'committed_claims': n, 'notification_records': n, 'flagged': n, 'pushes': n, 'pushed_more_than_once': []}
+    after_failure = failure['after_failure']
+    ok = (
+        _outcome_of(race) == sent_once
+        and after_failure['released'] > 0 and after_failure['flagged'] == after_failure['notification_records'] == after_failure['pushes']
+        and failure['after_retry'] == sent_once
+        and crash['within_lease'] == {'claims': n, 'committed_claims': 0, 'notification_records': 0, 'flagged': 0, 'pushes': 0, 'pushed_more_than_once': []}
+        and crash['after_lease'] == sent_once and crash['takeovers'] == n
+    )
+    print("OK" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+def _outcome_of(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The _outcome fields of a simulation result"""
+    return {key: result[key] for key in ('claims', 'committed_claims', 'notification_records', 'flagged', 'pushes', 'pushed_more_than_once')}
+
+if __name__ == "__main__":
+    main()
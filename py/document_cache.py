@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+MechLink Document Cache
+Bounded LRU/TTL cache of Firestore documents, optionally kept fresh by an on_snapshot watch
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+class DocumentCache:
+    def __init__(self, max_entries: int = 5000, ttl: Optional[float] = 300):
+        """Initialize the cache (ttl=None keeps entries until evicted or invalidated)"""
+        self.entries: 'OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.watch = None
+
+        # Configuration
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.watch_updates = 0
+
+    def get(self, document_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Look up a document; returns (found, data) where data is None for documents known not to exist"""
+        with self.lock:
+            entry = self.entries.get(document_id)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            data, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[document_id]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self.entries.move_to_end(document_id)
+            self.hits += 1
+            return True, data
+
+    def peek(self, document_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Like get(), but for bookkeeping: counts no hit or miss and leaves the LRU order alone"""
+        with self.lock:
+            entry = self.entries.get(document_id)
+            if entry is None or entry[1] < time.monotonic():
+                return False, None
+            return True, entry[0]
+
+    def put(self, document_id: str, data: Optional[Dict[str, Any]], ttl: Optional[float] = None):
+        """Store a document (None records that it doesn't exist); ttl overrides the cache's TTL for this entry"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float('inf')
+        with self.lock:
+            self.entries[document_id] = (data, expires_at)
+            self.entries.move_to_end(document_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, document_id: str):
+        """Drop a document so the next lookup reads it again"""
+        with self.lock:
+            if self.entries.pop(document_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every document"""
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def start_watch(self, query):
+        """Keep cached documents in sync with a Firestore query through on_snapshot"""
+        if self.watch is None:
+            self.watch = query.on_snapshot(self._on_snapshot)
+
+    def stop_watch(self):
+        """Stop the on_snapshot watch"""
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
+
+    def _on_snapshot(self, documents, changes, read_time):
+        """Apply document changes pushed by the watch"""
+        for change in changes:
+            with self.lock:
+                self.watch_updates += 1
+            if change.type.name == 'REMOVED':
+                # Left the watched query (e.g. no longer in progress) - read it again if still needed
+                self.invalidate(change.document.id)
+            else:
+                self.put(change.document.id, change.document.to_dict())
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'watching': self.watch is not None,
+                'watch_updates': self.watch_updates
+            }
@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""
+MechLink Fake Firebase Backend
+In-memory stand-ins for the Firebase Admin SDK (Realtime Database, Firestore and messaging) so the services can run offline
+"""
+
+import copy
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from google.api_core.exceptions import AlreadyExists
+
+def _split_path(path: str) -> List[str]:
+    """Split a database path into its segments"""
+    return [segment for segment in (path or '').split('/') if segment]
+
+def _etag(value: Any) -> str:
+    """Content hash standing in for the ETag the Realtime Database REST API returns"""
+    return hashlib.md5(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _join_path(segments: List[str]) -> str:
+    """Join path segments into a database path"""
+    return '/' + '/'.join(segments)
+
+class LatencyModel:
+    def __init__(self, base: float = 0.0, jitter: float = 0.0):
+        """Simulated round trip of base seconds plus up to jitter seconds per backend call"""
+        self.base = base
+        self.jitter = jitter
+
+    def wait(self):
+        """Block for one simulated round trip"""
+        delay = self.base + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+class FakeEvent:
+    def __init__(self, event_type: str, path: str, data: Any):
+        """Event with the same attributes as firebase_admin.db.Event"""
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class FakeListenerRegistration:
+    def __init__(self, database: 'FakeDatabase', listener: Dict[str, Any]):
+        """Handle returned by FakeReference.listen"""
+        self._database = database
+        self._listener = listener
+
+    def close(self):
+        """Stop receiving events"""
+        self._database.remove_listener(self._listener)
+
+class FakeDatabase:
+    def __init__(self, data: Optional[Dict[str, Any]] = None, latency: Optional[LatencyModel] = None):
+        """In-memory Realtime Database tree (latency delays every counted call)"""
+        self.data: Dict[str, Any] = copy.deepcopy(data) if data else {}
+        self.lock = threading.RLock()
+        self.listeners: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self.latency = latency
+
+    def reference(self, path: str = '/') -> 'FakeReference':
+        """Get a reference to a path, like firebase_admin.db.reference"""
+        return FakeReference(self, path)
+
+    def count_call(self, name: str):
+        """Count a backend call by method name and wait out its simulated latency"""
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            self.latency.wait()
+
+    def read(self, segments: List[str]) -> Any:
+        """Read a deep copy of the value at a path"""
+        with self.lock:
+            node = self.data
+            for segment in segments:
+                if not isinstance(node, dict) or segment not in node:
+                    return None
+                node = node[segment]
+            return copy.deepcopy(node)
+
+    def write(self, segments: List[str], value: Any):
+        """Write a value at a path and notify listeners"""
+        with self.lock:
+            self._write(segments, copy.deepcopy(value))
+            listeners = list(self.listeners)
+
+        for listener in listeners:
+            self._dispatch(listener, segments, 'put', value)
+
+    def update(self, segments: List[str], updates: Dict[str, Any]):
+        """Apply a multi-path update atomically and notify listeners"""
+        with self.lock:
+            for relative_path, child_value in updates.items():
+                self._write(segments + _split_path(relative_path), copy.deepcopy(child_value))
+            listeners = list(self.listeners)
+
+        for listener in listeners:
+            self._dispatch(listener, segments, 'patch', updates)
+
+    def call_counts(self) -> Dict[str, int]:
+        """Get a copy of the backend call counters"""
+        with self.lock:
+            return dict(self.calls)
+
+    def transaction(self, segments: List[str], transaction_update: Callable[[Any], Any]) -> Any:
+        """Replace the value at a path with transaction_update(current value), atomically"""
+        with self.lock:
+            value = transaction_update(self.read(segments))
+            self._write(segments, copy.deepcopy(value))
+            listeners = list(self.listeners)
+
+        for listener in listeners:
+            self._dispatch(listener, segments, 'put', value)
+        return value
+
+    def add_listener(self, segments: List[str], callback: Callable) -> FakeListenerRegistration:
+        """Register a listener and deliver the initial snapshot"""
+        listener = {'segments': segments, 'callback': callback}
+        with self.lock:
+            self.listeners.append(listener)
+            initial = self.read(segments)
+        callback(FakeEvent('put', '/', initial))
+        return FakeListenerRegistration(self, listener)
+
+    def remove_listener(self, listener: Dict[str, Any]):
+        """Unregister a listener"""
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _write(self, segments: List[str], value: Any):
+        """Replace the value at a path, pruning empty parents"""
+        if not segments:
+            self.data = value if isinstance(value, dict) else {}
+            return
+
+        parents = [self.data]
+        node = self.data
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+                node[segment] = child
+            node = child
+            parents.append(node)
+
+        if value is None:
+            node.pop(segments[-1], None)
+        else:
+            node[segments[-1]] = value
+
+        # Empty nodes do not exist in the Realtime Database
+        for depth in range(len(segments) - 1, 0, -1):
+            if parents[depth]:
+                break
+            del parents[depth - 1][segments[depth - 1]]
+
+    def _dispatch(self, listener: Dict[str, Any], segments: List[str], event_type: str, data: Any):
+        """Deliver a write event to a listener if it falls within its path"""
+        listen_segments = listener['segments']
+        if segments[:len(listen_segments)] == listen_segments:
+            relative = segments[len(listen_segments):]
+            listener['callback'](FakeEvent(event_type, _join_path(relative), copy.deepcopy(data)))
+        elif listen_segments[:len(segments)] == segments:
+            # A write above the listened path replaces the whole listened value
+            listener['callback'](FakeEvent('put', '/', self.read(listen_segments)))
+
+class FakeReference:
+    def __init__(self, database: FakeDatabase, path: str = '/'):
+        """Reference with the subset of the firebase_admin.db.Reference API the services use"""
+        self._database = database
+        self._segments = _split_path(path)
+
+    @property
+    def path(self) -> str:
+        """Path of this reference"""
+        return _join_path(self._segments)
+
+    @property
+    def key(self) -> Optional[str]:
+        """Last segment of this reference's path"""
+        return self._segments[-1] if self._segments else None
+
+    def child(self, path: str) -> 'FakeReference':
+        """Get a reference to a child path"""
+        return FakeReference(self._database, _join_path(self._segments + _split_path(path)))
+
+    def get(self, etag: bool = False, shallow: bool = False) -> Any:
+        """Read the value at this reference (a (value, etag) tuple when etag is set)"""
+        if etag and shallow:
+            raise ValueError('etag and shallow cannot both be set to True.')
+        self._database.count_call('get')
+        value = self._database.read(self._segments)
+        if shallow and isinstance(value, dict):
+            value = {key: True for key in value}
+        return (value, _etag(value)) if etag else value
+
+    def get_if_changed(self, etag: str) -> Tuple[bool, Any, Optional[str]]:
+        """Read the value only if its ETag differs: (changed, value, new_etag), or (False, None, None)"""
+        self._database.count_call('get_if_changed')
+        value = self._database.read(self._segments)
+        current = _etag(value)
+        if current == etag:
+            return False, None, None
+        return True, value, current
+
+    def set(self, value: Any):
+        """Replace the value at this reference"""
+        self._database.count_call('set')
+        self._database.write(self._segments, value)
+
+    def update(self, value: Dict[str, Any]):
+        """Multi-path update relative to this reference"""
+        self._database.count_call('update')
+        self._database.update(self._segments, value)
+
+    def delete(self):
+        """Delete the value at this reference"""
+        self._database.count_call('delete')
+        self._database.write(self._segments, None)
+
+    def transaction(self, transaction_update: Callable[[Any], Any]) -> Any:
+        """Atomically replace the value with transaction_update(current value) and return the new value"""
+        if not callable(transaction_update):
+            raise ValueError('transaction_update must be a function.')
+        self._database.count_call('transaction')
+        return self._database.transaction(self._segments, transaction_update)
+
+    def listen(self, callback: Callable) -> FakeListenerRegistration:
+        """Stream put/patch events for this reference"""
+        self._database.count_call('listen')
+        return self._database.add_listener(self._segments, callback)
+
+_QUERY_OPERATORS = {
+    '==': lambda field, value: field == value,
+    '!=': lambda field, value: field != value,
+    '<': lambda field, value: field is not None and field < value,
+    '<=': lambda field, value: field is not None and field <= value,
+    '>': lambda field, value: field is not None and field > value,
+    '>=': lambda field, value: field is not None and field >= value,
+    'in': lambda field, value: field in value,
+}
+
+class FakeChangeType:
+    def __init__(self, name: str):
+        """Document change type with the same name attribute as google.cloud.firestore's ChangeType"""
+        self.name = name
+
+class FakeDocumentChange:
+    def __init__(self, change_type: str, document: 'FakeDocumentSnapshot'):
+        """Change delivered to on_snapshot callbacks"""
+        self.type = FakeChangeType(change_type)
+        self.document = document
+
+class FakeWatch:
+    def __init__(self, firestore_client: 'FakeFirestore', watcher: Dict[str, Any]):
+        """Handle returned by FakeQuery.on_snapshot"""
+        self._firestore = firestore_client
+        self._watcher = watcher
+
+    def unsubscribe(self):
+        """Stop receiving snapshots"""
+        with self._firestore.lock:
+            if self._watcher in self._firestore.watchers:
+                self._firestore.watchers.remove(self._watcher)
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: 'FakeDocumentReference', data: Optional[Dict[str, Any]]):
+        """Snapshot of a document at read time"""
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        """Get a copy of the document data"""
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        """Get a single field"""
+        return (self._data or {}).get(field)
+
+class FakeDocumentReference:
+    def __init__(self, firestore_client: 'FakeFirestore', collection: str, document_id: str):
+        """Reference to a document in a FakeFirestore collection"""
+        self._firestore = firestore_client
+        self.collection_name = collection
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection_name}/{self.id}"
+
+    def get(self, transaction: Optional['FakeTransaction'] = None) -> FakeDocumentSnapshot:
+        """Read the document (inside a transaction, the transaction holds the store until it ends)"""
+        self._firestore.count_call('document_get')
+        return FakeDocumentSnapshot(self, self._firestore.read(self.collection_name, self.id))
+
+    def create(self, data: Dict[str, Any]):
+        """Create the document, raising AlreadyExists if it exists (like google.cloud.firestore)"""
+        self._firestore.count_call('document_create')
+        self._firestore.create(self.collection_name, self.id, data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        """Create or replace the document"""
+        self._firestore.count_call('document_set')
+        self._firestore.write(self.collection_name, self.id, data, merge=merge)
+
+    def update(self, data: Dict[str, Any]):
+        """Update fields of an existing document"""
+        self._firestore.count_call('document_update')
+        if self._firestore.read(self.collection_name, self.id) is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self._firestore.write(self.collection_name, self.id, data, merge=True)
+
+    def delete(self):
+        """Delete the document"""
+        self._firestore.count_call('document_delete')
+        self._firestore.write(self.collection_name, self.id, None)
+
+class FakeAggregationResult:
+    def __init__(self, alias: str, value: int):
+        """Aggregation value with the same attributes as google.cloud.firestore's AggregationResult"""
+        self.alias = alias
+        self.value = value
+
+class FakeAggregationQuery:
+    def __init__(self, query: 'FakeQuery', alias: Optional[str]):
+        """count() over a FakeQuery"""
+        self._query = query
+        self._alias = alias or 'field_1'
+
+    def get(self) -> List[List[FakeAggregationResult]]:
+        """Count matching documents server-side (no documents are returned)"""
+        self._query._firestore.count_call('aggregation_get')
+        with self._query._firestore.lock:
+            documents = list(self._query._firestore.collections.get(self._query.collection_name, {}).values())
+        return [[FakeAggregationResult(self._alias, sum(1 for data in documents if self._query.matches(data)))]]
+
+class FakeQuery:
+    def __init__(self, firestore_client: 'FakeFirestore', collection: str, filters: Optional[List[Tuple]] = None):
+        """Query over a FakeFirestore collection"""
+        self._firestore = firestore_client
+        self.collection_name = collection
+        self._filters = filters or []
+
+    def where(self, field: str, op: str, value: Any) -> 'FakeQuery':
+        """Add a field filter"""
+        return FakeQuery(self._firestore, self.collection_name, self._filters + [(field, op, value)])
+
+    def matches(self, data: Optional[Dict[str, Any]]) -> bool:
+        """Check whether document data passes every filter"""
+        if data is None:
+            return False
+        return all(_QUERY_OPERATORS[op](data.get(field), value) for field, op, value in self._filters)
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        """Run the query"""
+        self._firestore.count_call('query_get')
+        with self._firestore.lock:
+            documents = dict(self._firestore.collections.get(self.collection_name, {}))
+        return [
+            FakeDocumentSnapshot(FakeDocumentReference(self._firestore, self.collection_name, document_id), copy.deepcopy(data))
+            for document_id, data in documents.items() if self.matches(data)
+        ]
+
+    def stream(self):
+        """Iterate over the query results"""
+        return iter(self.get())
+
+    def count(self, alias: Optional[str] = None) -> FakeAggregationQuery:
+        """Aggregation query counting the matching documents"""
+        return FakeAggregationQuery(self, alias)
+
+    def on_snapshot(self, callback: Callable) -> FakeWatch:
+        """Watch the query; matching documents are delivered as ADDED first"""
+        self._firestore.count_call('on_snapshot')
+        watcher = {'query': self, 'callback': callback}
+        with self._firestore.lock:
+            self._firestore.watchers.append(watcher)
+        documents = self.get()
+        callback(documents, [FakeDocumentChange('ADDED', document) for document in documents], None)
+        return FakeWatch(self._firestore, watcher)
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, firestore_client: 'FakeFirestore', collection: str):
+        """Reference to a FakeFirestore collection"""
+        super().__init__(firestore_client, collection)
+        self.id = collection
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        """Get a document reference (auto-generated ID if none given)"""
+        return FakeDocumentReference(self._firestore, self.collection_name, document_id or uuid.uuid4().hex[:20])
+
+class FakeWriteBatch:
+    def __init__(self, firestore_client: 'FakeFirestore'):
+        """Write batch applied atomically on commit"""
+        self._firestore = firestore_client
+        self._writes: List[Tuple[str, FakeDocumentReference, Optional[Dict[str, Any]]]] = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(('merge' if merge else 'set', reference, data))
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append(('update', reference, data))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append(('delete', reference, None))
+
+    def commit(self):
+        """Apply every queued write (at most 500, like Firestore)"""
+        self._firestore.count_call('batch_commit')
+        if len(self._writes) > 500:
+            raise ValueError("A write batch can contain at most 500 writes")
+
+        with self._firestore.lock:
+            for operation, reference, data in self._writes:
+                if operation == 'update' and self._firestore.read(reference.collection_name, reference.id) is None:
+                    raise KeyError(f"No document to update: {reference.path}")
+            for operation, reference, data in self._writes:
+                self._firestore.write(reference.collection_name, reference.id, data, merge=operation in ('merge', 'update'))
+        self._writes = []
+
+class FakeTransaction:
+    def __init__(self, firestore_client: 'FakeFirestore', max_attempts: int = 5):
+        """Transaction driven by google.cloud.firestore.transactional: the store stays locked from begin to commit"""
+        self._firestore = firestore_client
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._writes: List[Tuple[str, FakeDocumentReference, Optional[Dict[str, Any]]]] = []
+
+    def _begin(self, retry_id: Any = None):
+        self._firestore.count_call('transaction')
+        self._firestore.lock.acquire()
+        self._id = uuid.uuid4().hex
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _commit(self):
+        try:
+            for operation, reference, data in self._writes:
+                if operation == 'update' and self._firestore.read(reference.collection_name, reference.id) is None:
+                    raise KeyError(f"No document to update: {reference.path}")
+            for operation, reference, data in self._writes:
+                self._firestore.write(reference.collection_name, reference.id, data, merge=operation in ('merge', 'update'))
+        finally:
+            self._end()
+
+    def _rollback(self):
+        self._end()
+
+    def _end(self):
+        if self._id is not None:
+            self._clean_up()
+            self._firestore.lock.release()
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(('merge' if merge else 'set', reference, data))
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append(('update', reference, data))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append(('delete', reference, None))
+
+class FakeFirestore:
+    def __init__(self, collections: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None, latency: Optional[LatencyModel] = None):
+        """In-memory Firestore holding {collection: {document_id: data}} (latency delays every counted call)"""
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = copy.deepcopy(collections) if collections else {}
+        self.lock = threading.RLock()
+        self.watchers: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self.latency = latency
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        """Get a collection reference"""
+        return FakeCollectionReference(self, name)
+
+    def count_call(self, name: str):
+        """Count a backend call by method name and wait out its simulated latency"""
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            self.latency.wait()
+
+    def call_counts(self) -> Dict[str, int]:
+        """Get a copy of the backend call counters"""
+        with self.lock:
+            return dict(self.calls)
+
+    def batch(self) -> FakeWriteBatch:
+        """Start a write batch"""
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5) -> FakeTransaction:
+        """Start a transaction (run it with google.cloud.firestore.transactional)"""
+        return FakeTransaction(self, max_attempts)
+
+    def get_all(self, references: List[FakeDocumentReference], transaction: Optional[FakeTransaction] = None):
+        """Read several documents in one call (inside a transaction, the transaction holds the store until it ends)"""
+        self.count_call('get_all')
+        for reference in references:
+            yield FakeDocumentSnapshot(reference, self.read(reference.collection_name, reference.id))
+
+    def read(self, collection: str, document_id: str) -> Optional[Dict[str, Any]]:
+        """Read a copy of a document's data"""
+        with self.lock:
+            return copy.deepcopy(self.collections.get(collection, {}).get(document_id))
+
+    def create(self, collection: str, document_id: str, data: Dict[str, Any]):
+        """Write a document only if it doesn't exist yet"""
+        with self.lock:
+            if document_id in self.collections.get(collection, {}):
+                raise AlreadyExists(f"Document already exists: {collection}/{document_id}")
+            self.write(collection, document_id, data)
+
+    def write(self, collection: str, document_id: str, data: Optional[Dict[str, Any]], merge: bool = False):
+        """Write (or delete, with None) a document and notify watchers"""
+        with self.lock:
+            documents = self.collections.setdefault(collection, {})
+            previous = documents.get(document_id)
+            if data is None:
+                documents.pop(document_id, None)
+            elif merge and previous is not None:
+                documents[document_id] = {**previous, **copy.deepcopy(data)}
+            else:
+                documents[document_id] = copy.deepcopy(data)
+            current = documents.get(document_id)
+            watchers = [watcher for watcher in self.watchers if watcher['query'].collection_name == collection]
+
+        reference = FakeDocumentReference(self, collection, document_id)
+        for watcher in watchers:
+            query = watcher['query']
+            was_match, is_match = query.matches(previous), query.matches(current)
+            if is_match:
+                change_type = 'MODIFIED' if was_match else 'ADDED'
+            elif was_match:
+                change_type = 'REMOVED'
+            else:
+                continue
+            snapshot = FakeDocumentSnapshot(reference, copy.deepcopy(current) if is_match else copy.deepcopy(previous))
+            watcher['callback']([snapshot], [FakeDocumentChange(change_type, snapshot)], None)
+
+class FakeMessagingError(Exception):
+    def __init__(self, code: str, message: str = ''):
+        """Error carrying a FirebaseError-style code (e.g. 'UNAVAILABLE', 'NOT_FOUND')"""
+        super().__init__(message or code)
+        self.code = code
+
+class UnregisteredError(FakeMessagingError):
+    def __init__(self, message: str = ''):
+        """Token no longer registered (named like firebase_admin.messaging.UnregisteredError)"""
+        super().__init__('NOT_FOUND', message or 'Requested entity was not found')
+
+class SenderIdMismatchError(FakeMessagingError):
+    def __init__(self, message: str = ''):
+        """Token belongs to another sender (named like firebase_admin.messaging.SenderIdMismatchError)"""
+        super().__init__('PERMISSION_DENIED', message or 'SenderId mismatch')
+
+# FCM error codes the SDK raises as a dedicated exception type instead of a plain FirebaseError
+FCM_TOKEN_ERRORS = {'UNREGISTERED': UnregisteredError, 'SENDER_ID_MISMATCH': SenderIdMismatchError}
+
+class FakeSendResponse:
+    def __init__(self, message_id: Optional[str] = None, exception: Optional[Exception] = None):
+        """Per-message result with the same attributes as firebase_admin.messaging.SendResponse"""
+        self.message_id = message_id
+        self.exception = exception
+
+    @property
+    def success(self) -> bool:
+        return self.exception is None
+
+class FakeBatchResponse:
+    def __init__(self, responses: List[FakeSendResponse]):
+        """Result of send_each with the same attributes as firebase_admin.messaging.BatchResponse"""
+        self.responses = responses
+        self.success_count = sum(1 for response in responses if response.success)
+        self.failure_count = len(responses) - self.success_count
+
+class FakeMessagingTransport:
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        """Records messages instead of sending them; failures can be injected per token or per call"""
+        self.sent: List[Any] = []
+        self.sent_at: List[float] = []  # time.time() of each delivery in sent
+        self.token_errors: Dict[str, str] = {}  # token -> error code returned for every send ('UNREGISTERED' for a dead token)
+        self.transient_errors: Dict[str, int] = {}  # token -> number of sends that fail with UNAVAILABLE
+        self.failing_calls = 0  # Number of upcoming send_each calls that raise
+        self.calls: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.latency = latency
+
+    def call_counts(self) -> Dict[str, int]:
+        """Get a copy of the call counters"""
+        with self.lock:
+            return dict(self.calls)
+
+    def send_each(self, messages: List[Any]) -> FakeBatchResponse:
+        """Deliver a batch of messages"""
+        if self.latency:
+            self.latency.wait()
+        with self.lock:
+            self.calls['send_each'] = self.calls.get('send_each', 0) + 1
+            if self.failing_calls > 0:
+                self.failing_calls -= 1
+                raise FakeMessagingError('UNAVAILABLE', 'Injected transport failure')
+
+            responses = []
+            for message in messages:
+                token = getattr(message, 'token', None)
+                if token in self.token_errors:
+                    code = self.token_errors[token]
+                    error = FCM_TOKEN_ERRORS[code]() if code in FCM_TOKEN_ERRORS else FakeMessagingError(code)
+                    responses.append(FakeSendResponse(exception=error))
+                elif self.transient_errors.get(token, 0) > 0:
+                    self.transient_errors[token] -= 1
+                    responses.append(FakeSendResponse(exception=FakeMessagingError('UNAVAILABLE')))
+                else:
+                    self.sent.append(message)
+                    self.sent_at.append(time.time())
+                    responses.append(FakeSendResponse(message_id=f"projects/fake/messages/{len(self.sent)}"))
+            return FakeBatchResponse(responses)
+
+class FakeDatabaseManager(BaseManager):
+    """Serves one FakeDatabase to several processes; wrap the proxy in FakeReference (listen is not supported across processes)"""
+
+FakeDatabaseManager.register('FakeDatabase', FakeDatabase, exposed=('read', 'write', 'update', 'count_call', 'call_counts'))
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+MechLink Firebase Setup
+Initializes the Firebase Admin SDK once per process and hands out the shared clients
+"""
+
+import os
+from typing import Any, Optional, Tuple
+import firebase_admin
+from firebase_admin import credentials, db, firestore
+
+# Defaults for the production project; override with MECHLINK_FIREBASE_CREDENTIALS / MECHLINK_DATABASE_URL
+CREDENTIAL_PATH = 'py/mechlink-34628-firebase-adminsdk-fbsvc-6d305dc93a.json'
+DATABASE_URL = 'https://mechlink-34628-default-rtdb.asia-southeast1.firebasedatabase.app'
+
+def initialize_firebase(credential_path: Optional[str] = None, database_url: Optional[str] = None) -> Tuple[Any, Any, Any]:
+    """Get (app, root db reference, Firestore client), initializing the default app on first use
+
+    Every caller in the process shares one app, and with it one RTDB HTTP session and one Firestore channel.
+    """
+    try:
+        app = firebase_admin.get_app()
+    except ValueError:
+        cred = credentials.Certificate(credential_path or os.environ.get('MECHLINK_FIREBASE_CREDENTIALS', CREDENTIAL_PATH))
+        app = firebase_admin.initialize_app(cred, {
+            'databaseURL': database_url or os.environ.get('MECHLINK_DATABASE_URL', DATABASE_URL)
+        })
+
+    return app, db.reference('/', app=app), firestore.client(app=app)
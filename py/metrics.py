@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+MechLink Metrics
+Prometheus-style counters, gauges and histograms for both services, with a text endpoint and callback sinks
+"""
+
+import contextlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Iterator, List, Optional, Sequence, Tuple
+from structured_logging import get_logger
+
+logger = get_logger('metrics')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+PAYLOAD_SAMPLE_SIZE = 64  # Children of a large payload serialized to estimate its size
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Render a label set in exposition format"""
+    if not labels:
+        return ''
+    escaped = (f'{name}="{_escape_label_value(str(value))}"' for name, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+def _escape_label_value(value: str) -> str:
+    """Escape backslashes, quotes and newlines in a label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    """Render a sample value"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Sequence[str] = ()):
+        """Base for metrics with a fixed set of label names"""
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """Label values in labelnames order"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        """Label dict for a key"""
+        return dict(zip(self.labelnames, key))
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Sequence[str] = ()):
+        """Monotonically increasing total"""
+        super().__init__(registry, name, help_text, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Add to the total"""
+        key = self._key(labels)
+        with self.lock:
+            value = self.values[key] = self.values.get(key, 0) + amount
+        self.registry.emit(self.name, labels, value)
+
+    def get(self, **labels) -> float:
+        """Current total"""
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Exposition samples"""
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Sequence[str] = ()):
+        """Value that goes up and down"""
+        super().__init__(registry, name, help_text, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        """Set the current value"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+        self.registry.emit(self.name, labels, value)
+
+    def get(self, **labels) -> float:
+        """Current value"""
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Exposition samples"""
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Distribution of observed values in cumulative buckets"""
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels):
+        """Record one observation"""
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+        self.registry.emit(self.name, labels, value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get(self, **labels) -> Dict[str, float]:
+        """Count and sum of observations"""
+        with self.lock:
+            series = self.series.get(self._key(labels)) or {'sum': 0.0, 'count': 0}
+            return {'count': series['count'], 'sum': series['sum']}
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Exposition samples (cumulative buckets, sum and count)"""
+        with self.lock:
+            items = [(key, list(series['counts']), series['sum'], series['count']) for key, series in self.series.items()]
+        for key, counts, total, count in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, 'le': _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class MetricsRegistry:
+    def __init__(self):
+        """Collection of named metrics plus sinks notified of every update"""
+        self.metrics: Dict[str, _Metric] = {}
+        self.sinks: List[Callable[[str, Dict[str, Any], float], None]] = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Get or create a gauge"""
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def _get_or_create(self, metric_class, name: str, help_text: str, labelnames: Sequence[str], **kwargs) -> Any:
+        """Return the registered metric of that name, registering it on first use"""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(self, name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def add_sink(self, sink: Callable[[str, Dict[str, Any], float], None]):
+        """Call sink(name, labels, value) on every update (e.g. to collect metrics in tests)"""
+        with self.lock:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink: Callable[[str, Dict[str, Any], float], None]):
+        """Stop calling a sink"""
+        with self.lock:
+            if sink in self.sinks:
+                self.sinks.remove(sink)
+
+    def emit(self, name: str, labels: Dict[str, Any], value: float):
+        """Forward an update to the sinks"""
+        if not self.sinks:
+            return
+        for sink in list(self.sinks):
+            try:
+                sink(name, labels, value)
+            except Exception as e:
+                logger.exception("Error in metrics sink: %s", e)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, port: int, host: str = '127.0.0.1'):
+        """Serve render() at /metrics from a background thread"""
+        if self.server:
+            return
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info("Serving metrics", extra={'url': f"http://{host}:{self.server.server_port}/metrics"})
+
+    def stop_http_server(self):
+        """Stop the metrics endpoint"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# Process-wide registry and the metrics both services report
+REGISTRY = MetricsRegistry()
+
+TICK_SECONDS = REGISTRY.histogram('mechlink_tick_seconds', "Duration of one service tick", ['service'])
+TICK_OVERRUNS = REGISTRY.counter('mechlink_tick_overruns_total', "Ticks that took longer than the service's interval", ['service'])
+BACKEND_CALLS = REGISTRY.counter('mechlink_backend_calls_total', "Calls to RTDB, Firestore and FCM", ['backend', 'method'])
+BACKEND_ERRORS = REGISTRY.counter('mechlink_backend_errors_total', "Backend calls that raised", ['backend', 'method'])
+BACKEND_CALL_SECONDS = REGISTRY.histogram('mechlink_backend_call_seconds', "Latency of backend calls", ['backend', 'method'])
+PAYLOAD_BYTES = REGISTRY.counter('mechlink_payload_bytes_total', "Estimated JSON size of data read and written", ['backend', 'method'])
+TRACKED_RECORDINGS = REGISTRY.gauge('mechlink_tracked_recordings', "Running recordings tracked by the monitoring service")
+BACKGROUND_RECORDINGS = REGISTRY.gauge('mechlink_background_recordings', "Recordings the service is counting for sleeping apps")
+NOTIFICATIONS_SENT = REGISTRY.counter('mechlink_notifications_sent_total', "Push notifications FCM accepted")
+NOTIFICATIONS_FAILED = REGISTRY.counter('mechlink_notifications_failed_total', "Push notifications given up on or pruned", ['reason'])
+NOTIFICATION_LAG_SECONDS = REGISTRY.histogram('mechlink_notification_lag_seconds', "Time from a task's exceedance to its push being accepted",
+                                              buckets=LAG_BUCKETS)
+FCM_QUEUE_DEPTH = REGISTRY.gauge('mechlink_fcm_queue_depth', "Messages waiting in the FCM dispatcher")
+INDEXED_DEADLINES = REGISTRY.gauge('mechlink_indexed_deadlines', "Exceedance deadlines waiting to fire")
+
+def payload_size(value: Any) -> int:
+    """Approximate wire size of a JSON payload in bytes
+
+    Only the first PAYLOAD_SAMPLE_SIZE children of a larger dict or list are serialized and the rest extrapolated
+    from them, so sizing a whole recordings tree stays cheap inside a tick.
+    """
+    try:
+        if isinstance(value, (dict, list)) and len(value) > PAYLOAD_SAMPLE_SIZE:
+            sample = dict(itertools.islice(value.items(), PAYLOAD_SAMPLE_SIZE)) if isinstance(value, dict) else value[:PAYLOAD_SAMPLE_SIZE]
+            return round(len(json.dumps(sample, separators=(',', ':'), default=str)) * len(value) / PAYLOAD_SAMPLE_SIZE)
+        return len(json.dumps(value, separators=(',', ':'), default=str))
+    except (TypeError, ValueError):
+        return 0
+
+@contextlib.contextmanager
+def track_call(backend: str, method: str):
+    """Count and time one backend call; errors are counted and re-raised"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        BACKEND_ERRORS.inc(backend=backend, method=method)
+        raise
+    finally:
+        BACKEND_CALLS.inc(backend=backend, method=method)
+        BACKEND_CALL_SECONDS.observe(time.perf_counter() - started, backend=backend, method=method)
+
+def record_payload(backend: str, method: str, value: Any):
+    """Add a payload's size to the bytes counter"""
+    PAYLOAD_BYTES.inc(payload_size(value), backend=backend, method=method)
+
+def observe_tick(service: str, seconds: float, interval: Optional[float] = None):
+    """Record a tick's duration and whether it overran its interval"""
+    TICK_SECONDS.observe(seconds, service=service)
+    if interval is not None and seconds > interval:
+        TICK_OVERRUNS.inc(service=service)
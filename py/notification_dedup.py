@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+MechLink Notification Dedup Index
+Claims each exceedance notification exactly once across workers with a Firestore create-if-absent write
+"""
+
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger('dedup')
+
+CLAIMS_COLLECTION = 'notificationClaims'
+
+# Outcomes of NotificationDedupIndex.claim
+CLAIM_WON = 'won'
+CLAIM_COMMITTED = 'committed'
+CLAIM_PENDING = 'pending'
+
+def notification_key(mechanic_id: str, task_id: str, started_at: Any, threshold: float = 1.0) -> str:
+    """Dedup key of one recording session's notification at a threshold (a fraction of estimatedTime)"""
+    key = f"{mechanic_id}_{task_id}_{started_at}"
+    # The estimate itself keeps the plain session key, so claims made before thresholds existed still match
+    return key if threshold == 1.0 else f"{key}_p{round(threshold * 100)}"
+
+def is_session_key(key: str, session_key: str) -> bool:
+    """Whether a claim key belongs to the recording session with the given plain key"""
+    return key == session_key or key.startswith(f"{session_key}_p")
+
+class NotificationDedupIndex:
+    def __init__(self, firestore_client, worker_id: Optional[str] = None, retention_days: float = 7, claim_lease: float = 60):
+        """Index of claimed notifications: an in-memory map in front of notificationClaims documents
+
+        A claim is a document created with create(), which fails with AlreadyExists for every
+        worker but the first, so exactly one worker sends each notification. It starts uncommitted
+        and is marked committed in the same write batch as its notification record; a worker that
+        loses to an uncommitted claim older than claim_lease seconds (its owner crashed before
+        committing) takes it over in a transaction. Claims carry an expireAt for a Firestore TTL
+        policy on the collection.
+        """
+        self.firestore_client = firestore_client
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.retention = timedelta(days=retention_days)
+        self.claim_lease = timedelta(seconds=claim_lease)
+        self.lock = threading.Lock()
+
+        # Latest claim per mechanic that this worker won or saw committed - one recording session at a time,
+        # so this stays bounded by the fleet
+        self.claimed: Dict[str, str] = {}
+
+        # Statistics
+        self.fast_path_hits = 0
+        self.claims_won = 0
+        self.claims_lost = 0
+        self.claims_pending = 0
+        self.takeovers = 0
+        self.releases = 0
+
+    def is_claimed(self, mechanic_id: str, key: str) -> bool:
+        """Fast path: whether this process already knows the notification is claimed"""
+        with self.lock:
+            if self.claimed.get(mechanic_id) == key:
+                self.fast_path_hits += 1
+                return True
+            return False
+
+    def claim(self, mechanic_id: str, key: str, context: Optional[Dict[str, Any]] = None) -> str:
+        """Claim a notification: CLAIM_WON for the single caller allowed to send it, CLAIM_COMMITTED once
+        another claim's notification is committed, CLAIM_PENDING while another claim is still uncommitted
+
+        Other backend errors propagate, leaving the notification unclaimed for the next cycle.
+        """
+        if self.is_claimed(mechanic_id, key):
+            return CLAIM_COMMITTED
+
+        reference = self.firestore_client.collection(CLAIMS_COLLECTION).document(key)
+        claim_data = {**self._claim_fields(), 'mechanicId': mechanic_id, 'committed': False, **(context or {})}
+        try:
+            with metrics.track_call('firestore', 'create'):
+                reference.create(claim_data)
+        except AlreadyExists:
+            return self._claim_existing(mechanic_id, key, reference)
+
+        self.remember(mechanic_id, key)
+        with self.lock:
+            self.claims_won += 1
+        return CLAIM_WON
+
+    def _claim_existing(self, mechanic_id: str, key: str, reference) -> str:
+        """Another worker holds the claim: settled if committed, taken over if abandoned, otherwise pending"""
+        with metrics.track_call('firestore', 'get'):
+            snapshot = reference.get()
+        # Claims written before the committed field existed were only created once their notification was sent
+        claim_data = snapshot.to_dict() if snapshot.exists else None
+        if claim_data is not None and claim_data.get('committed') is not False:
+            self.remember(mechanic_id, key)
+            with self.lock:
+                self.claims_lost += 1
+            logger.info("Notification already claimed", extra={'mechanicId': mechanic_id, 'claimKey': key})
+            return CLAIM_COMMITTED
+
+        if claim_data is not None and self._is_abandoned(claim_data):
+            with metrics.track_call('firestore', 'transaction'):
+                taken_over = firestore.transactional(self._take_over)(self.firestore_client.transaction(), reference)
+            if taken_over:
+                self.remember(mechanic_id, key)
+                with self.lock:
+                    self.claims_won += 1
+                    self.takeovers += 1
+                logger.warning("Took over an abandoned notification claim", extra={'mechanicId': mechanic_id, 'claimKey': key})
+                return CLAIM_WON
+
+        # Its owner is still committing (or just released it) - retry at the next check without flagging anything
+        with self.lock:
+            self.claims_pending += 1
+        logger.info("Notification claim not committed yet", extra={'mechanicId': mechanic_id, 'claimKey': key})
+        return CLAIM_PENDING
+
+    def _take_over(self, transaction, reference) -> bool:
+        """Transaction body: move an abandoned uncommitted claim to this worker"""
+        snapshot = reference.get(transaction=transaction)
+        claim_data = snapshot.to_dict() if snapshot.exists else None
+        if claim_data is None or claim_data.get('committed') is not False or not self._is_abandoned(claim_data):
+            return False
+        transaction.update(reference, self._claim_fields())
+        return True
+
+    def _is_abandoned(self, claim_data: Dict[str, Any]) -> bool:
+        """Whether an uncommitted claim is older than the lease its owner had to commit it in"""
+        claimed_at = claim_data.get('claimedAt')
+        return claimed_at is None or datetime.now(timezone.utc) - claimed_at > self.claim_lease
+
+    def _claim_fields(self) -> Dict[str, Any]:
+        """Owner and timestamps of a claim made by this worker now"""
+        now = datetime.now(timezone.utc)
+        return {'workerId': self.worker_id, 'claimedAt': now, 'expireAt': now + self.retention}
+
+    def commit_write(self, key: str) -> Tuple[Any, Dict[str, Any]]:
+        """Reference and fields that mark a claim committed, for the write batch holding its notification record"""
+        reference = self.firestore_client.collection(CLAIMS_COLLECTION).document(key)
+        return reference, {'committed': True, 'committedAt': datetime.now(timezone.utc)}
+
+    def release(self, mechanic_id: str, key: str):
+        """Give a claim back (its notification was never committed) so the next cycle can claim it again"""
+        with self.lock:
+            if self.claimed.get(mechanic_id) == key:
+                del self.claimed[mechanic_id]
+            self.releases += 1
+        try:
+            with metrics.track_call('firestore', 'delete'):
+                self.firestore_client.collection(CLAIMS_COLLECTION).document(key).delete()
+        except Exception as e:
+            # The claim stays; the notification is lost rather than risking a second send
+            logger.exception("Error releasing notification claim: %s", e, extra={'mechanicId': mechanic_id, 'claimKey': key})
+
+    def claimed_key(self, mechanic_id: str) -> Optional[str]:
+        """Latest claim this process knows of for a mechanic"""
+        with self.lock:
+            return self.claimed.get(mechanic_id)
+
+    def remember(self, mechanic_id: str, key: str):
+        """Record a known claim in the fast path (e.g. restored from a checkpoint)"""
+        with self.lock:
+            self.claimed[mechanic_id] = key
+
+    def forget(self, mechanic_id: str):
+        """Drop a mechanic's claim from the fast path once its recording session ended"""
+        with self.lock:
+            self.claimed.pop(mechanic_id, None)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get dedup index statistics"""
+        with self.lock:
+            return {
+                'known_claims': len(self.claimed),
+                'fast_path_hits': self.fast_path_hits,
+                'claims_won': self.claims_won,
+                'claims_lost': self.claims_lost,
+                'claims_pending': self.claims_pending,
+                'takeovers': self.takeovers,
+                'releases': self.releases
+            }
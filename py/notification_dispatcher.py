@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+MechLink Notification Dispatcher
+Outbound FCM queue delivering messages in send_each batches with retry/backoff and dead-token pruning
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional, Set
+from firebase_admin import messaging
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger('fcm')
+
+# FirebaseError codes worth retrying, and the messaging error types meaning the device token will never work again
+RETRYABLE_ERROR_CODES = {'UNAVAILABLE', 'INTERNAL', 'RESOURCE_EXHAUSTED', 'DEADLINE_EXCEEDED', 'UNKNOWN'}
+DEAD_TOKEN_ERRORS = {'UnregisteredError', 'SenderIdMismatchError'}
+
+class FcmTransport:
+    def __init__(self, app=None):
+        """Deliver message batches through the Firebase Admin SDK"""
+        self.app = app
+
+    def send_each(self, messages: List[messaging.Message]) -> messaging.BatchResponse:
+        """Send up to 500 messages in one call"""
+        return messaging.send_each(messages, app=self.app)
+
+class NotificationDispatcher:
+    def __init__(self, transport=None, on_dead_token: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        """Initialize the dispatcher (transport defaults to FCM; pass fake_firebase.FakeMessagingTransport for tests)"""
+        self.transport = transport or FcmTransport()
+        self.on_dead_token = on_dead_token
+        self.queue: List[Any] = []  # Heap of (not_before, sequence, item)
+        self.dead_tokens: Set[str] = set()
+        self.condition = threading.Condition()
+        self.worker_thread = None
+        self.running = False
+        self._sequence = itertools.count()
+
+        # Configuration
+        self.batch_size = 500  # send_each accepts at most 500 messages
+        self.linger = 0.2  # Wait this long for a burst to fill a batch (seconds)
+        self.max_attempts = 5
+        self.base_backoff = 1.0  # First retry delay, doubled per attempt (seconds)
+        self.max_backoff = 60.0
+
+        # Counters
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.pruned = 0
+        self.batches = 0
+        self.total_send_seconds = 0.0
+
+    def enqueue(self, message: messaging.Message, context: Optional[Dict[str, Any]] = None) -> bool:
+        """Queue a message for delivery; returns False if its token is known to be dead"""
+        token = getattr(message, 'token', None)
+        with self.condition:
+            if token in self.dead_tokens:
+                self.pruned += 1
+                return False
+            item = {'message': message, 'context': context or {}, 'attempts': 0, 'enqueued_at': time.monotonic()}
+            heapq.heappush(self.queue, (time.monotonic(), next(self._sequence), item))
+            self.enqueued += 1
+            self.condition.notify()
+        return True
+
+    def is_dead_token(self, token: str) -> bool:
+        """Check whether FCM has reported a token as unregistered"""
+        with self.condition:
+            return token in self.dead_tokens
+
+    def start(self):
+        """Start delivering in a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+
+    def stop(self, drain: bool = True):
+        """Stop the background thread, optionally sending what is ready first"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.worker_thread:
+            self.worker_thread.join(timeout=10)
+            self.worker_thread = None
+        if drain:
+            while self.flush():
+                pass
+
+    def flush(self) -> int:
+        """Send one batch of ready messages on the calling thread; returns how many were attempted"""
+        batch = self._take_ready_batch()
+        if batch:
+            self._send_batch(batch)
+        with self.condition:
+            metrics.FCM_QUEUE_DEPTH.set(len(self.queue))
+        return len(batch)
+
+    def _worker_loop(self):
+        """Wait for ready messages and send them in batches"""
+        while True:
+            with self.condition:
+                while self.running and not self._has_ready():
+                    timeout = self.queue[0][0] - time.monotonic() if self.queue else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+
+            # Give a burst a moment to accumulate into one send_each call
+            time.sleep(self.linger)
+            self.flush()
+
+    def _has_ready(self) -> bool:
+        """Check whether the earliest queued message may be sent now (condition held)"""
+        return bool(self.queue) and self.queue[0][0] <= time.monotonic()
+
+    def _take_ready_batch(self) -> List[Dict[str, Any]]:
+        """Pop up to batch_size messages whose backoff has elapsed"""
+        batch = []
+        with self.condition:
+            while self.queue and len(batch) < self.batch_size and self._has_ready():
+                batch.append(heapq.heappop(self.queue)[2])
+        return batch
+
+    def _send_batch(self, batch: List[Dict[str, Any]]):
+        """Deliver a batch and route each result"""
+        started = time.perf_counter()
+        try:
+            with metrics.track_call('fcm', 'send_each'):
+                response = self.transport.send_each([item['message'] for item in batch])
+        except Exception as e:
+            # The whole call failed (network, auth) - every message is retried
+            logger.warning("Error sending notifications: %s", e, extra={'messages': len(batch)})
+            for item in batch:
+                self._retry_or_fail(item, e)
+            return
+        finally:
+            with self.condition:
+                self.batches += 1
+                self.total_send_seconds += time.perf_counter() - started
+
+        for item, result in zip(batch, response.responses):
+            if result.success:
+                with self.condition:
+                    self.sent += 1
+                metrics.NOTIFICATIONS_SENT.inc()
+                if 'deadlineAt' in item['context']:
+                    metrics.NOTIFICATION_LAG_SECONDS.observe(max(0.0, time.time() - item['context']['deadlineAt']))
+            elif self._is_dead_token_error(result.exception):
+                self._prune_token(item)
+            elif self._is_retryable_error(result.exception):
+                self._retry_or_fail(item, result.exception)
+            else:
+                self._fail(item, result.exception)
+
+    def _retry_or_fail(self, item: Dict[str, Any], error: Exception):
+        """Requeue with exponential backoff, or give up after max_attempts"""
+        item['attempts'] += 1
+        if item['attempts'] >= self.max_attempts:
+            self._fail(item, error)
+            return
+
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (item['attempts'] - 1)))
+        delay *= random.uniform(0.5, 1.0)  # Jitter so retries from a burst don't line up
+        with self.condition:
+            self.retried += 1
+            heapq.heappush(self.queue, (time.monotonic() + delay, next(self._sequence), item))
+            self.condition.notify()
+
+    def _fail(self, item: Dict[str, Any], error: Exception):
+        """Drop a message that cannot be delivered"""
+        with self.condition:
+            self.failed += 1
+        metrics.NOTIFICATIONS_FAILED.inc(reason='gave_up')
+        logger.error("Giving up on notification: %s", error, extra={'context': item['context'] or 'unknown recipient'})
+
+    def _prune_token(self, item: Dict[str, Any]):
+        """Remember a dead token and drop everything still queued for it"""
+        token = getattr(item['message'], 'token', None)
+        with self.condition:
+            self.dead_tokens.add(token)
+            remaining = [entry for entry in self.queue if getattr(entry[2]['message'], 'token', None) != token]
+            pruned = 1 + len(self.queue) - len(remaining)
+            self.pruned += pruned
+            self.queue = remaining
+            heapq.heapify(self.queue)
+        metrics.NOTIFICATIONS_FAILED.inc(pruned, reason='dead_token')
+
+        logger.info("Pruned dead device token", extra={'context': item['context'] or 'unknown recipient', 'pruned': pruned})
+        if self.on_dead_token:
+            try:
+                self.on_dead_token(token, item['context'])
+            except Exception as e:
+                logger.exception("Error handling dead token: %s", e)
+
+    @staticmethod
+    def _is_retryable_error(error: Optional[Exception]) -> bool:
+        """Transient FCM errors"""
+        return getattr(error, 'code', None) in RETRYABLE_ERROR_CODES
+
+    @staticmethod
+    def _is_dead_token_error(error: Optional[Exception]) -> bool:
+        """Errors meaning the token is unregistered or belongs to another sender"""
+        return type(error).__name__ in DEAD_TOKEN_ERRORS
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get delivery statistics"""
+        with self.condition:
+            return {
+                'queued': len(self.queue),
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'pruned': self.pruned,
+                'dead_tokens': len(self.dead_tokens),
+                'batches': self.batches,
+                'average_send_ms': round(self.total_send_seconds / self.batches * 1000, 2) if self.batches else 0
+            }
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+MechLink Notification Thresholds
+Crossing times of every notification threshold (a fraction of estimatedTime) and the per-recording notified bitmask
+"""
+
+import os
+from typing import Any, Iterable, Optional, Tuple
+
+def thresholds_from_env(default: Tuple[float, ...] = (1.0,)) -> Tuple[float, ...]:
+    """Thresholds from MECHLINK_NOTIFICATION_THRESHOLDS (e.g. "0.8,1,1.5"), or the default"""
+    configured = os.environ.get('MECHLINK_NOTIFICATION_THRESHOLDS')
+    if not configured:
+        return default
+    return tuple(float(threshold) for threshold in configured.split(',') if threshold.strip())
+
+class ThresholdSchedule:
+    def __init__(self, thresholds: Iterable[float]):
+        """Notification thresholds in ascending order; bit i of a notified mask means threshold i was notified
+
+        The mask is kept in RTDB as notifiedThresholds. isNotified still means the estimate itself (1.0) was
+        passed: it is set whenever a threshold >= 1.0 is notified, and a recording flagged by an older worker
+        counts as notified for every threshold up to 1.0. Bits index the configured thresholds, so
+        change the configuration only while no recording has a partially notified mask.
+        """
+        self.thresholds = tuple(sorted({float(threshold) for threshold in thresholds if threshold > 0}))
+        if not self.thresholds:
+            raise ValueError("At least one positive notification threshold is required")
+        self.all_mask = (1 << len(self.thresholds)) - 1
+        self.legacy_mask = self._mask_of(threshold <= 1.0 for threshold in self.thresholds)
+        self.exceeded_mask = self._mask_of(threshold >= 1.0 for threshold in self.thresholds)
+
+    def notified_mask(self, recording_data: Any) -> int:
+        """Thresholds already notified for a recording"""
+        if not isinstance(recording_data, dict):
+            return 0
+        mask = recording_data.get('notifiedThresholds') or 0
+        if recording_data.get('isNotified', False):
+            mask |= self.legacy_mask
+        return mask & self.all_mask
+
+    def is_pending(self, mask: int) -> bool:
+        """Whether any threshold is still to be notified"""
+        return mask != self.all_mask
+
+    def reached(self, mask: int, duration: float, estimated_time: float) -> Optional[int]:
+        """Highest not-yet-notified threshold the duration has reached (None if none has)
+
+        Lower thresholds passed at the same time are covered by its notification instead of sent one by one.
+        """
+        for index in range(len(self.thresholds) - 1, -1, -1):
+            if duration >= self.thresholds[index] * estimated_time:
+                return None if mask >> index & 1 else index
+        return None
+
+    def next_crossing(self, mask: int, estimated_time: float) -> Optional[float]:
+        """Duration at which the lowest not-yet-notified threshold is reached"""
+        for index, threshold in enumerate(self.thresholds):
+            if not mask >> index & 1:
+                return threshold * estimated_time
+        return None
+
+    def through(self, index: int) -> int:
+        """Mask of every threshold up to and including index"""
+        return (1 << (index + 1)) - 1
+
+    def is_exceeded(self, mask: int) -> bool:
+        """Whether the mask includes a threshold at or past the estimate (what isNotified reports)"""
+        return bool(mask & self.exceeded_mask)
+
+    @staticmethod
+    def _mask_of(flags: Iterable[bool]) -> int:
+        """Mask with bit i set for every true flag"""
+        return sum(1 << index for index, flag in enumerate(flags) if flag)
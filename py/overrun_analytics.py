@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+MechLink Overrun Analytics
+Streaming statistics of actual recorded duration versus estimatedTime, per mechanic and per task title
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from firebase_admin import firestore
+from recordings_mirror import effective_duration
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger('analytics')
+
+OVERRUN_STATS_COLLECTION = 'taskOverrunStats'
+RECENT_SESSIONS = 20  # Latest session keys kept on a mechanic's document to count each session once
+EXACT_QUANTILE_SAMPLES = 50  # Observations kept verbatim before a quantile switches to P-square markers
+
+class P2Quantile:
+    __slots__ = ('p', 'samples', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p: float, state: Optional[Dict[str, Any]] = None):
+        """Streaming estimate of the p-quantile in constant space (the P-square algorithm, Jain & Chlamtac 1985)
+
+        The first EXACT_QUANTILE_SAMPLES observations are kept verbatim and give the exact quantile; past that
+        they seed five markers at the minimum, p/2, p, (1+p)/2 quantiles and the maximum.
+        """
+        state = state or {}
+        self.p = p
+        self.samples: List[float] = list(state.get('samples', []))
+        self.heights: List[float] = list(state.get('heights', []))
+        self.positions: List[int] = list(state.get('positions', []))
+        self.desired: List[float] = list(state.get('desired', []))
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        if len(self.heights) < 5:
+            # State saved while the markers were still being seeded holds plain observations
+            self.samples, self.heights = sorted(self.samples + self.heights), []
+
+    def add(self, x: float):
+        """Add an observation"""
+        if not self.heights:
+            self.samples.append(x)
+            if len(self.samples) > EXACT_QUANTILE_SAMPLES:
+                self._seed_markers()
+            return
+        heights, positions = self.heights, self.positions
+
+        # Cell the observation falls in, stretching the extreme markers when it is a new min/max
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= x < heights[i + 1])
+
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions, one step at a time
+        for i in range(1, 4):
+            offset = self.desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _seed_markers(self):
+        """Place the five markers at their quantiles of the exact samples, then drop the samples"""
+        samples = sorted(self.samples)
+        n = len(samples)
+        self.desired = [1 + (n - 1) * fraction for fraction in self.increments]
+        self.positions = [1, 0, 0, 0, n]
+        for i in range(1, 4):
+            self.positions[i] = min(max(round(self.desired[i]), self.positions[i - 1] + 1), n - 4 + i)
+        self.heights = [samples[position - 1] for position in self.positions]
+        self.samples = []
+
+    def _parabolic(self, i: int, step: int) -> float:
+        """Piecewise-parabolic prediction of marker i's height after moving it by step"""
+        heights, positions = self.heights, self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        """Current estimate (exact, interpolated between ranks, while the samples are still kept)"""
+        if self.heights:
+            return self.heights[2]
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        rank = self.p * (len(samples) - 1)
+        lower = int(rank)
+        upper = min(lower + 1, len(samples) - 1)
+        return samples[lower] + (samples[upper] - samples[lower]) * (rank - lower)
+
+    def to_state(self) -> Dict[str, Any]:
+        """Samples or marker state, for resuming the estimate later"""
+        if not self.heights:
+            return {'samples': self.samples}
+        return {'heights': self.heights, 'positions': self.positions, 'desired': self.desired}
+
+class OverrunStats:
+    __slots__ = ('count', 'mean', 'm2', 'overruns', 'p90')
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        """Running count, mean and variance (Welford) and p90 of actual/estimated duration ratios"""
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.mean = state.get('mean', 0.0)
+        self.m2 = state.get('m2', 0.0)
+        self.overruns = state.get('overruns', 0)
+        self.p90 = P2Quantile(0.9, state.get('p90'))
+
+    def add(self, ratio: float):
+        """Add one finished recording's ratio"""
+        self.count += 1
+        delta = ratio - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (ratio - self.mean)
+        if ratio > 1:
+            self.overruns += 1
+        self.p90.add(ratio)
+
+    def to_document(self) -> Dict[str, Any]:
+        """Summary fields for dispatchers, plus the raw state to resume from"""
+        return {
+            'count': self.count,
+            'meanRatio': self.mean,
+            'stdDevRatio': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0,
+            'p90Ratio': self.p90.value(),
+            'overrunCount': self.overruns,
+            'overrunRate': self.overruns / self.count if self.count else 0.0,
+            'state': {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'overruns': self.overruns, 'p90': self.p90.to_state()}
+        }
+
+class RecordingSession:
+    __slots__ = ('task_id', 'started_at', 'title', 'estimated_seconds', 'duration')
+
+    def __init__(self, task_id: str, started_at: Any):
+        """What is known of one running recording session: its task's estimate and the latest duration seen"""
+        self.task_id = task_id
+        self.started_at = started_at
+        self.title: Optional[str] = None
+        self.estimated_seconds: Optional[float] = None
+        self.duration = 0
+
+class OverrunAnalytics:
+    def __init__(self, firestore_client, flush_interval: float = 300, min_duration: int = 60, chunk_size: int = 100):
+        """Fold finished recordings into per-mechanic and per-title overrun statistics
+
+        observe() is fed the recordings snapshot a full check already read; a session ends when its
+        recording disappears (or a new session replaces it), and its last seen duration over the cached
+        estimate is one observation. flush() merges them into the stored documents in transactions, so
+        statistics survive restarts and workers watching the same recordings share one document per
+        mechanic and title. A mechanic's document lists its latest sessions, so a session every worker
+        saw end is counted once.
+        """
+        self.firestore_client = firestore_client
+        self.lock = threading.Lock()
+
+        # Configuration
+        self.flush_interval = flush_interval  # Write statistics at most this often (seconds)
+        self.min_duration = min_duration  # Ignore sessions shorter than this (started by mistake)
+        self.chunk_size = chunk_size  # Sessions per transaction; each touches at most two documents
+
+        self.sessions: Dict[str, RecordingSession] = {}
+        self.pending: List[Tuple[str, str, Optional[str], float]] = []  # (mechanic ID, session key, title, ratio) not yet merged
+        self.last_flush = time.monotonic()
+
+        # Statistics
+        self.sessions_recorded = 0
+        self.sessions_skipped = 0
+        self.sessions_merged = 0
+        self.sessions_already_counted = 0
+        self.documents_written = 0
+
+    def observe(self, recordings: Dict[str, Any], owns: Callable[[str], bool], task_lookup: Callable[[str], Optional[Dict[str, Any]]]):
+        """Update sessions from a full recordings snapshot, recording the ones that ended
+
+        task_lookup returns cached task data (or None) and must not read Firestore.
+        """
+        for mechanic_id in list(self.sessions):
+            if mechanic_id not in recordings:
+                self._finish(mechanic_id, self.sessions.pop(mechanic_id))
+            elif not owns(mechanic_id):
+                # Moved to another worker's shard, not finished
+                del self.sessions[mechanic_id]
+
+        for mechanic_id, recording_data in recordings.items():
+            if not isinstance(recording_data, dict) or not recording_data.get('taskId') or not owns(mechanic_id):
+                continue
+            task_id = recording_data['taskId']
+            started_at = recording_data.get('startedAt')
+            session = self.sessions.get(mechanic_id)
+            if session is not None and (session.task_id != task_id or (session.started_at and started_at and session.started_at != started_at)):
+                self._finish(mechanic_id, session)
+                session = None
+            if session is None:
+                session = self.sessions[mechanic_id] = RecordingSession(task_id, started_at)
+            elif not session.started_at:
+                # Older app builds leave startedAt unset until a notification claim stamps it - same session
+                session.started_at = started_at
+
+            if session.estimated_seconds is None:
+                task_data = task_lookup(task_id)
+                if task_data and task_data.get('estimatedTime'):
+                    session.title = task_data.get('title')
+                    session.estimated_seconds = task_data['estimatedTime']  # in seconds, as the notification check reads it
+            session.duration = max(session.duration, effective_duration(recording_data))
+
+    def maybe_flush(self):
+        """Flush when flush_interval has passed since the last flush"""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Merge pending sessions into their statistics documents, one transaction per chunk"""
+        self.last_flush = time.monotonic()
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start:start + self.chunk_size]
+            try:
+                with metrics.track_call('firestore', 'transaction'):
+                    merged, written = firestore.transactional(self._merge)(self.firestore_client.transaction(), chunk)
+            except Exception as e:
+                # Nothing of the chunk was written, so its sessions wait for the next flush
+                logger.exception("Error writing overrun statistics: %s", e, extra={'sessions': len(chunk)})
+                with self.lock:
+                    self.pending.extend(chunk)
+                continue
+            with self.lock:
+                self.sessions_merged += merged
+                self.sessions_already_counted += len(chunk) - merged
+                self.documents_written += written
+
+        if pending:
+            logger.info("Flushed overrun statistics", extra={'sessions': len(pending)})
+
+    def _merge(self, transaction, sessions: List[Tuple[str, str, Optional[str], float]]) -> Tuple[int, int]:
+        """Transaction body: fold sessions into their stored statistics; returns sessions merged and documents written"""
+        stats_keys = list(dict.fromkeys(
+            stats_key for mechanic_id, _, title, _ in sessions
+            for stats_key in ((('mechanic', mechanic_id), ('title', title)) if title else (('mechanic', mechanic_id),))
+        ))
+        references = {stats_key: self._reference(stats_key) for stats_key in stats_keys}
+        with metrics.track_call('firestore', 'get_all'):
+            snapshots = {snapshot.id: snapshot for snapshot in self.firestore_client.get_all(list(references.values()), transaction=transaction)}
+        stored = {}
+        for stats_key in stats_keys:
+            snapshot = snapshots.get(self._document_id(stats_key))
+            stored[stats_key] = (snapshot.to_dict() if snapshot is not None and snapshot.exists else None) or {}
+
+        stats = {stats_key: OverrunStats(stored[stats_key].get('state')) for stats_key in stats_keys}
+        recent = {stats_key: list(stored[stats_key].get('recentSessions', [])) for stats_key in stats_keys if stats_key[0] == 'mechanic'}
+        changed = set()
+        merged = 0
+        for mechanic_id, session_key, title, ratio in sessions:
+            mechanic_key = ('mechanic', mechanic_id)
+            if session_key in recent[mechanic_key]:
+                continue
+            recent[mechanic_key] = (recent[mechanic_key] + [session_key])[-RECENT_SESSIONS:]
+            for stats_key in ((mechanic_key, ('title', title)) if title else (mechanic_key,)):
+                stats[stats_key].add(ratio)
+                changed.add(stats_key)
+            merged += 1
+
+        now = datetime.now(timezone.utc)
+        for stats_key in changed:
+            dimension, key = stats_key
+            document = {'dimension': dimension, 'key': key, **stats[stats_key].to_document(), 'updatedAt': now}
+            if dimension == 'mechanic':
+                document['recentSessions'] = recent[stats_key]
+            transaction.set(references[stats_key], document)
+            metrics.record_payload('firestore', 'transaction', document)
+        return merged, len(changed)
+
+    def _finish(self, mechanic_id: str, session: RecordingSession):
+        """Record an ended session's actual/estimated ratio"""
+        if not session.estimated_seconds or session.duration < self.min_duration:
+            self.sessions_skipped += 1
+            return
+        ratio = session.duration / session.estimated_seconds
+        title = session.title.strip() if session.title else None
+        with self.lock:
+            self.pending.append((mechanic_id, f"{session.task_id}_{session.started_at or ''}", title, ratio))
+            self.sessions_recorded += 1
+
+    def _reference(self, stats_key: Tuple[str, str]):
+        """Document reference of one statistic"""
+        return self.firestore_client.collection(OVERRUN_STATS_COLLECTION).document(self._document_id(stats_key))
+
+    def _document_id(self, stats_key: Tuple[str, str]) -> str:
+        """Document ID of one statistic; titles are hashed as they may contain '/'"""
+        dimension, key = stats_key
+        if dimension == 'title':
+            key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+        return f"{dimension}_{key}"
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get analytics statistics"""
+        with self.lock:
+            return {
+                'open_sessions': len(self.sessions),
+                'sessions_recorded': self.sessions_recorded,
+                'sessions_skipped': self.sessions_skipped,
+                'pending_sessions': len(self.pending),
+                'sessions_merged': self.sessions_merged,
+                'sessions_already_counted': self.sessions_already_counted,
+                'documents_written': self.documents_written
+            }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+MechLink Overrun Simulation
+Checks the overrun statistics against exact values: the streaming p90 against an exact percentile, and the
+stored statistics of several unsharded workers (one of them restarted) against every session counted once
+"""
+
+import argparse
+import random
+import statistics
+from typing import Dict, Any, List, Sequence
+
+from fake_firebase import FakeFirestore
+from overrun_analytics import OverrunAnalytics, P2Quantile, OVERRUN_STATS_COLLECTION
+
+def exact_quantile(values: List[float], p: float) -> float:
+    """p-quantile interpolated between ranks, the definition P2Quantile reports while it keeps its samples"""
+    ordered = sorted(values)
+    rank = p * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def check_p90(sizes: Sequence[int] = (1, 5, 8, 20, 50, 200, 2000, 20000), seed: int = 7) -> Dict[str, Any]:
+    """Streaming p90 of lognormal overrun ratios (resumed from saved state half-way) versus the exact p90"""
+    results = {}
+    for size in sizes:
+        rng = random.Random(seed + size)
+        ratios = [rng.lognormvariate(0, 0.3) for _ in range(size)]
+        quantile = P2Quantile(0.9)
+        for index, ratio in enumerate(ratios):
+            if index == size // 2:
+                quantile = P2Quantile(0.9, quantile.to_state())
+            quantile.add(ratio)
+        exact = exact_quantile(ratios, 0.9)
+        results[size] = {'p90': round(quantile.value(), 4), 'exact': round(exact, 4), 'error': round(quantile.value() / exact - 1, 4)}
+    return results
+
+def check_workers(workers: int = 3, mechanics: int = 20, sessions: int = 8, seed: int = 11) -> Dict[str, Any]:
+    """Unsharded workers all watch every recording; one restarts half-way and they flush at different times"""
+    rng = random.Random(seed)
+    firestore_client = FakeFirestore()
+    titles = ['Oil change', 'Brake pads']
+    tasks = {f"task_{title}_{n}": {'title': title, 'estimatedTime': 3600} for title in titles for n in range(mechanics * sessions)}
+    analytics = [OverrunAnalytics(firestore_client) for _ in range(workers)]
+    expected: Dict[str, List[float]] = {}
+
+    for session in range(sessions + 1):
+        if session == sessions // 2:
+            # Restart: a fresh worker with nothing in memory
+            analytics[0] = OverrunAnalytics(firestore_client)
+        recordings = {}
+        for m in range(mechanics):
+            mechanic_id = f"mechanic_{m:03d}"
+            if session < sessions:
+                title = titles[m % len(titles)]
+                duration = int(3600 * rng.lognormvariate(0, 0.3))
+                recordings[mechanic_id] = {'taskId': f"task_{title}_{m * sessions + session}", 'startedAt': 1000 * (session + 1),
+                                           'duration': duration, 'status': 'running'}
+        for worker in analytics:
+            worker.observe(recordings, lambda mechanic_id: True, tasks.get)
+        for mechanic_id, recording in recordings.items():
+            expected.setdefault(mechanic_id, []).append(recording['duration'] / 3600)
+        for index, worker in enumerate(analytics):
+            if (session + index) % 2 == 0:
+                worker.flush()
+    for worker in analytics:
+        worker.flush()
+
+    documents = {snapshot.id: snapshot.to_dict() for snapshot in firestore_client.collection(OVERRUN_STATS_COLLECTION).stream()}
+    mechanic_documents = {data['key']: data for data in documents.values() if data['dimension'] == 'mechanic'}
+    title_documents = {data['key']: data for data in documents.values() if data['dimension'] == 'title'}
+    return {
+        'sessions_ended': sum(len(ratios) for ratios in expected.values()),
+        'sessions_counted': sum(data['count'] for data in mechanic_documents.values()),
+        'title_sessions_counted': sum(data['count'] for data in title_documents.values()),
+        'mean_errors': max(abs(mechanic_documents[mechanic_id]['meanRatio'] - statistics.mean(ratios)) for mechanic_id, ratios in expected.items()),
+        'p90_errors': max(abs(mechanic_documents[mechanic_id]['p90Ratio'] - exact_quantile(ratios, 0.9)) for mechanic_id, ratios in expected.items()),
+        'already_counted': sum(worker.sessions_already_counted for worker in analytics)
+    }
+
+def main():
+    """Run the checks, print their results and fail if an estimate is off"""
+    parser = argparse.ArgumentParser(description="Overrun statistics checks")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="Allowed relative p90 error once past the exact samples")
+    args = parser.parse_args()
+
+    p90 = check_p90()
+    for size, result in p90.items():
+        print(f"p90.{size}: {result}")
+    workers = check_workers()
+    for key, value in workers.items():
+        print(f"workers.{key}: {value}")
+
+    # Exact while samples are kept, within tolerance once the P-square markers take over
+    ok = all(result['error'] == 0 if size <= 50 else abs(result['error']) <= args.tolerance for size, result in p90.items())
+    # Every ended session counted exactly once however many workers saw it end
+    ok = ok and workers['sessions_counted'] == workers['title_sessions_counted'] == workers['sessions_ended']
+    ok = ok and workers['mean_errors'] < 1e-9 and workers['p90_errors'] < 1e-9
+    print("OK" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+MechLink RTDB Write Buffer
+Coalesces Realtime Database leaf writes into single root-level multi-path update() calls
+"""
+
+import threading
+import time
+from typing import Dict, Any, Optional
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger('rtdb_writes')
+
+class RTDBWriteBuffer:
+    def __init__(self, db_ref, max_batch_size: int = 500, flush_interval: float = 1.0):
+        """Initialize the write buffer for a root database reference"""
+        self.db_ref = db_ref
+        self.pending: Dict[str, Any] = {}
+        self.in_flight: Dict[str, Any] = {}
+        self.first_pending_at: Optional[float] = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_thread = None
+        self.running = False
+
+        # Configuration
+        self.max_batch_size = max_batch_size  # Flush as soon as this many paths are pending
+        self.flush_interval = flush_interval  # Never hold a write longer than this (seconds)
+
+        # Counters
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.written_paths = 0
+        self.largest_batch = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def put(self, path: str, value: Any):
+        """Queue a write of value at path (relative to the root, None deletes)"""
+        with self.lock:
+            if not self.pending:
+                self.first_pending_at = time.monotonic()
+            self.pending[path] = value
+            full = len(self.pending) >= self.max_batch_size
+
+        if full:
+            self.flush()
+
+    def update(self, updates: Dict[str, Any]):
+        """Queue several path writes at once"""
+        for path, value in updates.items():
+            self.put(path, value)
+
+    def is_pending(self, path: str) -> bool:
+        """Check whether a write to path is still waiting to be flushed or being written"""
+        with self.lock:
+            return path in self.pending or path in self.in_flight
+
+    def flush(self) -> int:
+        """Write everything pending with one update() and return the number of paths written"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                updates = self.pending
+                self.pending = {}
+                self.in_flight = updates
+                self.first_pending_at = None
+
+            started = time.perf_counter()
+            try:
+                with metrics.track_call('rtdb', 'update'):
+                    self.db_ref.update(updates)
+                metrics.record_payload('rtdb', 'update', updates)
+            except Exception as e:
+                logger.exception("Error flushing RTDB writes: %s", e, extra={'writes': len(updates)})
+                with self.lock:
+                    self.in_flight = {}
+                    self.failed_flushes += 1
+                    # Keep them for the next flush, without overwriting anything newer
+                    self.pending = {**updates, **self.pending}
+                    if self.first_pending_at is None:
+                        self.first_pending_at = time.monotonic()
+                return 0
+
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.in_flight = {}
+                self.flush_count += 1
+                self.written_paths += len(updates)
+                self.largest_batch = max(self.largest_batch, len(updates))
+                self.total_flush_seconds += elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return len(updates)
+
+    def flush_if_due(self) -> int:
+        """Flush if the oldest pending write has waited flush_interval"""
+        with self.lock:
+            due = self.first_pending_at is not None and time.monotonic() - self.first_pending_at >= self.flush_interval
+        return self.flush() if due else 0
+
+    def start(self):
+        """Start a background thread that enforces the flush deadline"""
+        if self.running:
+            return
+        self.running = True
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+
+    def stop(self):
+        """Stop the background thread and write anything still pending"""
+        self.running = False
+        if self.flush_thread:
+            self.flush_thread.join(timeout=10)
+            self.flush_thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        """Background deadline loop"""
+        while self.running:
+            time.sleep(self.flush_interval / 4)
+            self.flush_if_due()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get batch size and flush latency counters"""
+        with self.lock:
+            return {
+                'flushes': self.flush_count,
+                'failed_flushes': self.failed_flushes,
+                'written_paths': self.written_paths,
+                'pending_paths': len(self.pending),
+                'average_batch_size': round(self.written_paths / self.flush_count, 2) if self.flush_count else 0,
+                'largest_batch': self.largest_batch,
+                'average_flush_ms': round(self.total_flush_seconds / self.flush_count * 1000, 2) if self.flush_count else 0,
+                'max_flush_ms': round(self.max_flush_seconds * 1000, 2)
+            }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+MechLink Shard Coordinator
+Splits mechanic IDs across monitoring workers with a consistent-hash ring built from lease records in Realtime Database
+"""
+
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger('shard')
+
+# Lease records live under a reserved root key; keys starting with '_' are never recordings
+LEASE_ROOT = '_shardLeases'
+
+def _hash(key: str) -> int:
+    """Stable 64-bit hash (Python's hash() differs between processes)"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    def __init__(self, members: Iterable[str] = (), virtual_nodes: int = 64):
+        """Consistent-hash ring; each member owns the keys hashing just before its virtual nodes"""
+        self.members = frozenset(members)
+        self.points: List[int] = []
+        self.owners: List[str] = []
+
+        for point, member in sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(virtual_nodes)):
+            self.points.append(point)
+            self.owners.append(member)
+
+    def owner(self, key: str) -> Optional[str]:
+        """Get the member that owns a key"""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+class ShardCoordinator:
+    def __init__(self, db_ref, worker_id: Optional[str] = None, lease_ttl: float = 15, renew_interval: float = 5):
+        """Initialize a worker's view of the shard ring (leases are written under LEASE_ROOT of db_ref)"""
+        self.lease_ref = db_ref.child(LEASE_ROOT)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.heartbeat_thread = None
+        self.running = False
+
+        # Configuration
+        self.lease_ttl = lease_ttl  # A worker that stops renewing for this long loses its shard (seconds)
+        self.renew_interval = renew_interval  # How often leases are renewed and the ring rebuilt (seconds)
+        # Wait before taking over keys: longer than a heartbeat, so their previous owner has seen the change and let go
+        self.handover_delay = 2 * renew_interval
+        self.virtual_nodes = 64
+
+        # Ring of live workers, and the ring in force before the last membership change
+        # (empty until the first heartbeat, so a joining worker takes nothing before its handover settles)
+        self.ring = HashRing()
+        self.previous_ring: Optional[HashRing] = None
+        self.changed_at = 0.0
+        self.renewed_at: Optional[float] = None  # Monotonic start of the last successful renewal
+        self.lease_expired = False
+        self.generation = 0  # Bumped whenever the set of owned keys may have changed
+
+        # Counters
+        self.heartbeats = 0
+        self.failed_heartbeats = 0
+        self.rebalances = 0
+
+    def owns(self, key: str) -> bool:
+        """Check whether this worker should process a key
+
+        While a handover is in progress a key is only owned if this worker owned it before and after the change,
+        so two workers never process the same mechanic at once. Nothing is owned once the lease may have expired.
+        """
+        with self.lock:
+            if self.renewed_at is None or time.monotonic() - self.renewed_at >= self.lease_ttl:
+                return False
+            if self.ring.owner(key) != self.worker_id:
+                return False
+            return self.previous_ring is None or self.previous_ring.owner(key) == self.worker_id
+
+    def heartbeat(self) -> bool:
+        """Renew this worker's lease and rebuild the ring from live leases; returns True if ownership changed"""
+        now_ms = int(time.time() * 1000)
+        renewal_started = time.monotonic()
+        try:
+            with metrics.track_call('rtdb', 'set'):
+                self.lease_ref.child(self.worker_id).set({
+                    'expiresAt': now_ms + int(self.lease_ttl * 1000),
+                    'renewedAt': now_ms
+                })
+            with metrics.track_call('rtdb', 'get'):
+                leases = self.lease_ref.get() or {}
+        except Exception as e:
+            logger.warning("Error renewing shard lease: %s", e, extra={'workerId': self.worker_id})
+            with self.lock:
+                self.failed_heartbeats += 1
+                if not self.lease_expired and self.renewed_at is not None and time.monotonic() - self.renewed_at >= self.lease_ttl:
+                    # Other workers have dropped this one from the ring by now - owns() already returns False
+                    logger.warning("Shard lease expired", extra={'workerId': self.worker_id})
+                    self.lease_expired = True
+                    self.generation += 1
+                    return True
+            return False
+
+        live = {self.worker_id}
+        for worker_id, lease in leases.items():
+            if isinstance(lease, dict) and lease.get('expiresAt', 0) > now_ms:
+                live.add(worker_id)
+            elif isinstance(lease, dict) and lease.get('expiresAt', 0) < now_ms - self.lease_ttl * 1000:
+                # Long dead - any worker may clean it up
+                self._delete_lease(worker_id)
+
+        with self.lock:
+            self.heartbeats += 1
+            self.renewed_at = renewal_started
+            if self.lease_expired:
+                # Rejoin like a new worker: others still hold the keys they took over, so take nothing until the handover settles
+                logger.info("Shard lease renewed after expiring", extra={'workerId': self.worker_id, 'members': sorted(live)})
+                self.lease_expired = False
+                self.previous_ring = HashRing()
+                self.ring = HashRing(live, self.virtual_nodes)
+                self.changed_at = time.monotonic()
+                self.generation += 1
+                self.rebalances += 1
+                return True
+            if live != self.ring.members:
+                logger.info("Shard membership changed", extra={'workerId': self.worker_id, 'members': sorted(live)})
+                # Mid-handover the last settled ring stays in force, so keys only move once both sides agree
+                if self.previous_ring is None:
+                    self.previous_ring = self.ring
+                self.ring = HashRing(live, self.virtual_nodes)
+                self.changed_at = time.monotonic()
+                self.generation += 1
+                self.rebalances += 1
+                return True
+
+            if self.previous_ring is not None and time.monotonic() - self.changed_at >= self.handover_delay:
+                # Handover settled - take over keys gained in the last change
+                self.previous_ring = None
+                self.generation += 1
+                return True
+        return False
+
+    def start(self):
+        """Take a lease and keep renewing it in a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self.heartbeat()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop(self):
+        """Stop renewing and release the lease so other workers take over immediately"""
+        if not self.running:
+            return
+        self.running = False
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=10)
+            self.heartbeat_thread = None
+        self._delete_lease(self.worker_id)
+
+    def _heartbeat_loop(self):
+        """Background lease renewal loop"""
+        while self.running:
+            time.sleep(self.renew_interval)
+            if self.running:
+                self.heartbeat()
+
+    def _delete_lease(self, worker_id: str):
+        """Remove a worker's lease record"""
+        try:
+            with metrics.track_call('rtdb', 'delete'):
+                self.lease_ref.child(worker_id).delete()
+        except Exception as e:
+            logger.warning("Error deleting shard lease: %s", e, extra={'workerId': worker_id})
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get ring membership and lease counters"""
+        with self.lock:
+            return {
+                'worker_id': self.worker_id,
+                'workers': len(self.ring.members),
+                'handover_pending': self.previous_ring is not None,
+                'lease_expired': self.lease_expired,
+                'generation': self.generation,
+                'heartbeats': self.heartbeats,
+                'failed_heartbeats': self.failed_heartbeats,
+                'rebalances': self.rebalances
+            }
+
+def open_shard(db_ref, enabled: bool = False, worker_id: Optional[str] = None) -> Optional[ShardCoordinator]:
+    """Join the shard ring when enabled (or MECHLINK_SHARD is set), or return None to process every mechanic
+
+    The worker ID (worker_id, then MECHLINK_WORKER_ID, then the host name) must survive restarts, so a restarted
+    worker takes back its own keys, and must be shared by the monitoring and notification processes of one worker.
+    """
+    if not (enabled or os.environ.get('MECHLINK_SHARD', '') not in ('', '0', 'false')):
+        return None
+    return ShardCoordinator(db_ref, worker_id=worker_id or os.environ.get('MECHLINK_WORKER_ID') or socket.gethostname())
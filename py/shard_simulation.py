@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+MechLink Shard Simulation
+Runs N sharded monitoring workers as local processes against one shared fake Realtime Database,
+kills one part-way through, and checks every sleeping recording was anchored exactly once
+"""
+
+import argparse
+import multiprocessing
+import time
+from typing import Dict, Any, Set
+
+from fake_firebase import FakeDatabaseManager, FakeReference
+from shard_coordinator import ShardCoordinator, LEASE_ROOT
+from task_monitoring_service import TaskMonitoringService
+
+def _run_worker(database, worker_id: str, renew_interval: float, lease_ttl: float, sleep_timeout: float):
+    """Worker process: a polling monitoring service restricted to its shard"""
+    db_ref = FakeReference(database, '/')
+    shard = ShardCoordinator(db_ref, worker_id=worker_id, lease_ttl=lease_ttl, renew_interval=renew_interval)
+    service = TaskMonitoringService(db_ref=db_ref, streaming=False, shard=shard)
+    service.sleep_detection_timeout = sleep_timeout
+    service.background_checkpoint_interval = 1
+    service.start_monitoring()
+    while True:
+        time.sleep(1)
+
+def simulate(workers: int = 3, recordings: int = 200, duration: float = 20, kill_after: float = 6,
+             renew_interval: float = 0.5, lease_ttl: float = 1.5, sleep_timeout: float = 2) -> Dict[str, Any]:
+    """Run the workers while half the apps keep recording and half fall asleep"""
+    manager = FakeDatabaseManager()
+    manager.start()
+    database = manager.FakeDatabase({
+        f"mechanic_{i:04d}": {'taskId': f"task_{i:04d}", 'duration': 0, 'status': 'running', 'deviceId': 'no_token', 'isNotified': False}
+        for i in range(recordings)
+    })
+    active = [f"mechanic_{i:04d}" for i in range(0, recordings, 2)]
+    sleeping = [f"mechanic_{i:04d}" for i in range(1, recordings, 2)]
+
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(database, f"worker-{n}", renew_interval, lease_ttl, sleep_timeout),
+                                name=f"worker-{n}", daemon=True)
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Watch every anchor ever written; exactly-once means one distinct anchor per sleeping recording
+    anchors: Dict[str, Set[int]] = {mechanic_id: set() for mechanic_id in active + sleeping}
+    started = time.monotonic()
+    next_increment = started
+    killed = None
+    while time.monotonic() - started < duration:
+        now = time.monotonic()
+        if now >= next_increment:
+            # Active apps write their own duration every second
+            database.update([], {f"{mechanic_id}/duration": int(now - started) + 1 for mechanic_id in active})
+            next_increment += 1
+        if killed is None and now - started >= kill_after:
+            killed = processes[0].name
+            processes[0].kill()
+        for mechanic_id, recording in (database.read([]) or {}).items():
+            if mechanic_id in anchors and isinstance(recording, dict) and recording.get('backgroundStartedAt'):
+                anchors[mechanic_id].add(recording['backgroundStartedAt'])
+        time.sleep(0.1)
+
+    final = database.read([])
+    for process in processes:
+        process.kill()
+    manager.shutdown()
+
+    return {
+        'workers': workers,
+        'killed': killed,
+        'live_leases': sorted((final.get(LEASE_ROOT) or {}).keys()),
+        'sleeping_anchored': sum(1 for mechanic_id in sleeping if anchors[mechanic_id]),
+        'sleeping_total': len(sleeping),
+        'anchored_more_than_once': sorted(mechanic_id for mechanic_id, values in anchors.items() if len(values) > 1),
+        'active_anchored': sorted(mechanic_id for mechanic_id in active if anchors[mechanic_id]),
+        'sleeping_durations': sorted({final[mechanic_id]['duration'] for mechanic_id in sleeping})
+    }
+
+def main():
+    """Run the simulation and print its result"""
+    parser = argparse.ArgumentParser(description="Sharded monitoring simulation against a fake RTDB")
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--recordings', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20, help="Seconds to run")
+    parser.add_argument('--kill-after', type=float, default=6, help="Kill the first worker after this many seconds")
+    args = parser.parse_args()
+
+    result = simulate(args.workers, args.recordings, args.duration, args.kill_after)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+MechLink State Checkpoint
+Append-only JSON-lines log of service state, replayed at startup so a restarted service resumes where it stopped
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Any, Iterator, Optional, Tuple
+from structured_logging import get_logger
+
+logger = get_logger('checkpoint')
+
+class StateCheckpoint:
+    def __init__(self, path: str, compact_ratio: float = 4.0, min_compact_records: int = 10000, fsync: bool = False):
+        """Open (and replay) the checkpoint log at path
+
+        State is a set of namespaces, each mapping keys to JSON values. Changes are buffered and
+        appended by flush() as one line per key ({"ns", "key", "value"}, value None = deleted), so a
+        key changed several times between flushes is written once. A torn last line from a crash is dropped.
+        """
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.pending: Dict[Tuple[str, str], Any] = {}
+        self.lock = threading.Lock()
+        self.file = None
+
+        # Configuration
+        self.compact_ratio = compact_ratio  # Rewrite the log once it holds this many records per live key
+        self.min_compact_records = min_compact_records  # ...but never for fewer records than this
+        self.fsync = fsync  # fsync every flush (survives power loss, not just a process crash)
+
+        # Statistics
+        self.log_records = 0
+        self.records_written = 0
+        self.compactions = 0
+        self.replayed = 0
+
+        self._replay()
+
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        """Current (key, value) pairs of a namespace"""
+        with self.lock:
+            return iter(list(self.state.get(namespace, {}).items()))
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Current value of a key (None if absent)"""
+        with self.lock:
+            return self.state.get(namespace, {}).get(key)
+
+    def put(self, namespace: str, key: str, value: Any):
+        """Set a key; written at the next flush"""
+        with self.lock:
+            self.state.setdefault(namespace, {})[key] = value
+            self.pending[(namespace, key)] = value
+
+    def delete(self, namespace: str, key: str):
+        """Remove a key; written at the next flush"""
+        with self.lock:
+            if self.state.get(namespace, {}).pop(key, None) is not None:
+                self.pending[(namespace, key)] = None
+
+    def flush(self):
+        """Append buffered changes to the log, compacting it when it has grown too large"""
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            try:
+                lines = ''.join(self._line(namespace, key, value) for (namespace, key), value in pending.items())
+                self.file.write(lines)
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+                self.log_records += len(pending)
+                self.records_written += len(pending)
+
+                live = sum(len(entries) for entries in self.state.values())
+                if self.log_records >= max(self.min_compact_records, live * self.compact_ratio):
+                    self._compact()
+            except Exception as e:
+                # Keep the records (newer changes win) so the next flush retries them
+                pending.update(self.pending)
+                self.pending = pending
+                logger.exception("Error writing checkpoint: %s", e, extra={'path': self.path})
+
+    def close(self):
+        """Flush and close the log"""
+        self.flush()
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def _replay(self):
+        """Load the log, truncating anything after the last complete record"""
+        valid_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as log:
+                for raw in log:
+                    try:
+                        if not raw.endswith(b'\n'):
+                            raise ValueError("incomplete record")
+                        record = json.loads(raw)
+                        namespace, key, value = record['ns'], record['key'], record['value']
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("Dropping torn checkpoint tail", extra={'path': self.path, 'offset': valid_bytes})
+                        break
+                    entries = self.state.setdefault(namespace, {})
+                    if value is None:
+                        entries.pop(key, None)
+                    else:
+                        entries[key] = value
+                    valid_bytes += len(raw)
+                    self.log_records += 1
+
+        self.file = open(self.path, 'a+', encoding='utf-8')
+        self.file.truncate(valid_bytes)
+        self.replayed = sum(len(entries) for entries in self.state.values())
+        if self.replayed:
+            logger.info("Replayed checkpoint", extra={'path': self.path, 'entries': self.replayed, 'records': self.log_records})
+
+    def _compact(self):
+        """Rewrite the log as one record per live key and swap it in atomically"""
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as compacted:
+            for namespace, entries in self.state.items():
+                compacted.write(''.join(self._line(namespace, key, value) for key, value in entries.items()))
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        self.file.close()
+        os.replace(temporary_path, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.log_records = sum(len(entries) for entries in self.state.values())
+        self.compactions += 1
+
+    @staticmethod
+    def _line(namespace: str, key: str, value: Any) -> str:
+        """Serialize one record"""
+        return json.dumps({'ns': namespace, 'key': key, 'value': value}, separators=(',', ':'), default=str) + '\n'
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get checkpoint statistics"""
+        with self.lock:
+            return {
+                'path': self.path,
+                'entries': sum(len(entries) for entries in self.state.values()),
+                'log_records': self.log_records,
+                'records_written': self.records_written,
+                'compactions': self.compactions,
+                'replayed': self.replayed
+            }
+
+def open_checkpoint(name: str) -> Optional[StateCheckpoint]:
+    """Open <MECHLINK_CHECKPOINT_DIR>/<name>.jsonl, or return None when checkpointing is not configured"""
+    directory = os.environ.get('MECHLINK_CHECKPOINT_DIR')
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return StateCheckpoint(os.path.join(directory, f"{name}.jsonl"))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+MechLink Structured Logging
+JSON log lines written from a background queue listener, with rate limiting for per-recording messages
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+# LogRecord attributes that are not structured fields
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName', 'rate_limit_key'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the mechlink namespace"""
+    return logging.getLogger(f"mechlink.{name}")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        """One JSON object per line: timestamp, level, logger, message and any extra fields"""
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval: float = 60.0, max_keys: int = 100000):
+        """Let through at most one record per rate_limit_key every interval seconds
+
+        Records without a rate_limit_key extra always pass. The next record let through for a key
+        carries how many were suppressed in between.
+        """
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.last_emitted: Dict[Tuple[str, Any], Tuple[float, int]] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Decide whether a record is emitted"""
+        key = getattr(record, 'rate_limit_key', None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, key)
+        with self.lock:
+            last, suppressed = self.last_emitted.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self.last_emitted[key] = (last, suppressed + 1)
+                return False
+            if len(self.last_emitted) >= self.max_keys and key not in self.last_emitted:
+                # Bound memory on huge fleets; dropping the state only lets a line through early
+                self.last_emitted.clear()
+            self.last_emitted[key] = (now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Keep extra fields and the traceback as separate fields instead of formatting them into the message"""
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configure_logging(level: Optional[str] = None, json_output: Optional[bool] = None, stream=None) -> logging.handlers.QueueListener:
+    """Route mechlink loggers through a queue to a background writer thread
+
+    level defaults to MECHLINK_LOG_LEVEL (INFO), json_output to MECHLINK_LOG_FORMAT != 'text'.
+    Calling it again replaces the previous configuration.
+    """
+    global _listener
+    level = (level or os.environ.get('MECHLINK_LOG_LEVEL', 'INFO')).upper()
+    if json_output is None:
+        json_output = os.environ.get('MECHLINK_LOG_FORMAT', 'json') != 'text'
+
+    with _configure_lock:
+        if _listener:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if json_output else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        # The monitor threads only enqueue; formatting and I/O happen on the listener thread
+        log_queue = queue.SimpleQueue()
+        handler = _StructuredQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter())
+
+        logger = logging.getLogger('mechlink')
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _configure_lock:
+        if _listener:
+            _listener.stop()
+            _listener = None
@@ -4,107 +4,265 @@ Simple MechLink Task Monitoring Service
 Monitors Firebase Realtime Database and continues recording when app goes to sleep
 """
 
+import argparse
 import json
+import sys
 import time
-from datetime import datetime
 from typing import Dict, Any, Optional
-import firebase_admin
-from firebase_admin import credentials, db, firestore, messaging
 import threading
+from recordings_mirror import RecordingsMirror, RecordingsSnapshotFetcher, background_duration
+from deadline_scheduler import DeadlineScheduler
+from adaptive_interval import AdaptiveInterval
+from rtdb_write_buffer import RTDBWriteBuffer
+from async_runtime import AsyncServiceRuntime
+from shard_coordinator import ShardCoordinator, open_shard
+from tracked_recording import TrackedRecording, BACKGROUND, ANCHORED
+from state_checkpoint import StateCheckpoint, open_checkpoint
+import firebase_setup
+import metrics
+from structured_logging import configure_logging, get_logger, shutdown_logging
+
+logger = get_logger('monitoring')
 
 class TaskMonitoringService:
-    def __init__(self):
-        """Initialize the task monitoring service"""
+    def __init__(self, db_ref=None, firestore_client=None, streaming: bool = False, write_buffer: Optional[RTDBWriteBuffer] = None,
+                 recordings_mirror: Optional[RecordingsMirror] = None, shard: Optional[ShardCoordinator] = None,
+                 checkpoint: Optional[StateCheckpoint] = None):
+        """Initialize the task monitoring service
+        
+        Pass db_ref (e.g. a fake_firebase.FakeReference) to run without connecting to Firebase,
+        and write_buffer to share one RTDB write buffer with the notification service.
+        Pass recordings_mirror to consume a mirror fed by a shared RecordingsFeed instead of polling/subscribing here.
+        Pass shard to track only the mechanics this worker owns on the shard ring.
+        Pass checkpoint to persist tracked state locally and pick it up again after a restart.
+        """
         self.firebase_app = None
-        self.db_ref = None
-        self.firestore_client = None
+        self.db_ref = db_ref
+        self.firestore_client = firestore_client
         self.monitoring = False
         self.monitor_thread = None
+        self.runtime: Optional[AsyncServiceRuntime] = None
+        
+        # Track recordings and their last known durations (slotted records with monotonic timestamps)
+        self.tracked_recordings: Dict[str, TrackedRecording] = {}
+        self.background_recordings = set()
+        
+        # One sleep-detection deadline per recording, so a tick only touches recordings that are due
+        self.sleep_scheduler = DeadlineScheduler()
+        
+        # Local copy of the recordings tree; streaming mode feeds it from RTDB events instead of polling the root
+        self.owns_recordings_feed = recordings_mirror is None
+        self.recordings_mirror = recordings_mirror or RecordingsMirror()
+        self.listener = None
+        self.snapshot_fetcher: Optional[RecordingsSnapshotFetcher] = None
         
-        # Track recordings and their last known durations
-        self.tracked_recordings: Dict[str, Dict[str, Any]] = {}
+        self.last_checkpoint_slot = None
+        
+        # Wait between ticks: check_interval while recordings change, longer while none do
+        self.tick_intervals: Optional[AdaptiveInterval] = None
+        self.last_tick_changes = 0
+        self.seen_mirror_version = 0
+        
+        # Sharded mode: other workers own the rest of the mechanics, and ownership moves when workers come and go
+        self.shard = shard
+        self.shard_generation = None
+        
+        # Tracked state from before a restart, claimed by each recording when it is first seen again
+        self.checkpoint = checkpoint
+        self.restored_recordings: Dict[str, TrackedRecording] = {}
+        self.restore_deadline = 0.0
         
         # Configuration
         self.check_interval = 1  # Check every second
+        self.max_idle_check_interval = 10  # Back off to this while no recording changes (thread loop only)
+        self.interval_jitter = 0.1  # Spread intervals by +/-10% so instances started together drift apart
         self.sleep_detection_timeout = 5  # 5 seconds without change = app is sleeping
+        self.use_streaming = streaming  # Subscribe once instead of downloading the whole tree every tick
+        self.use_background_anchor = True  # Derive background durations from a backgroundStartedAt anchor instead of +1 writes
+        self.background_checkpoint_interval = 30  # Write derived background durations every 30 seconds
+        self.use_asyncio = False  # Tick at a fixed rate on an asyncio runtime instead of sleeping between ticks (a tick has no calls to fan out)
+        self.use_snapshot_fetcher = True  # Polling mode: skip the download while the tree's ETag is unchanged (only idle polls - use streaming to cut traffic while apps record)
+        self.snapshot_per_node_reads = False  # Opt-in: one conditional read per recording (N+1 requests per poll) instead
+        self.checkpoint_interval = 5  # Persist an active recording's duration at most this often (seconds)
+        self.restore_window = 60  # Drop restored state not claimed by a recording within this many seconds
+        
+        if self.db_ref is None:
+            self._initialize_firebase()
         
-        self._initialize_firebase()
+        # Field writes collected during a tick and written with a single multi-path update()
+        self.write_buffer = write_buffer or RTDBWriteBuffer(self.db_ref)
     
     def _initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
         try:
-            # Initialize Firebase Admin SDK
-            cred = credentials.Certificate('py/mechlink-34628-firebase-adminsdk-fbsvc-6d305dc93a.json')
-            self.firebase_app = firebase_admin.initialize_app(cred, {
-                'databaseURL': 'https://mechlink-34628-default-rtdb.asia-southeast1.firebasedatabase.app'
-            })
+            # Initialize Firebase Admin SDK and database references
+            self.firebase_app, self.db_ref, self.firestore_client = firebase_setup.initialize_firebase()
             
-            # Initialize database references
-            self.db_ref = db.reference('/')
-            self.firestore_client = firestore.client()
-            
-            print("Firebase initialized successfully")
+            logger.info("Firebase initialized successfully")
             
         except Exception as e:
-            print(f"Failed to initialize Firebase: {e}")
+            logger.exception("Failed to initialize Firebase: %s", e)
             raise
     
     def start_monitoring(self):
         """Start monitoring task recordings"""
         if self.monitoring:
-            print("Monitoring already started")
+            logger.warning("Monitoring already started")
             return
         
         self.monitoring = True
-        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        self.monitor_thread.start()
-        print("Task monitoring service started")
+        self.tick_intervals = AdaptiveInterval(self.check_interval, self.max_idle_check_interval, jitter=self.interval_jitter)
+        
+        if self.checkpoint:
+            self._restore_checkpoint()
+        
+        if self.shard:
+            self.shard.start()
+        
+        if self.use_streaming and self.owns_recordings_feed:
+            # Initial snapshot arrives as a put on '/', later changes as incremental put/patch events
+            with metrics.track_call('rtdb', 'listen'):
+                self.listener = self.db_ref.listen(self.recordings_mirror.on_event)
+            logger.info("Subscribed to Realtime Database recording events")
+        
+        if self.use_asyncio:
+            # Fixed-rate ticks with drift correction; stop_monitoring cancels the tick task
+            self.runtime = AsyncServiceRuntime('task-monitoring')
+            self.runtime.start(self._check_recordings, self.check_interval)
+        else:
+            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self.monitor_thread.start()
+        logger.info("Task monitoring service started")
     
     def stop_monitoring(self):
         """Stop monitoring task recordings"""
         self.monitoring = False
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+        if self.runtime:
+            self.runtime.stop()
+            self.runtime = None
         if self.monitor_thread:
             self.monitor_thread.join(timeout=10)
-        print("Task monitoring service stopped")
+        if self.snapshot_fetcher:
+            self.snapshot_fetcher.close()
+        if self.shard:
+            self.shard.stop()
+        if self.checkpoint:
+            self.checkpoint.flush()
+        logger.info("Task monitoring service stopped")
     
     def _monitor_loop(self):
         """Main monitoring loop"""
-        print("Starting monitoring loop...")
+        logger.info("Starting monitoring loop")
         
         while self.monitoring:
             try:
                 self._check_recordings()
-                time.sleep(self.check_interval)
+                self._wait_for_next_tick()
             except Exception as e:
-                print(f"Error in monitoring loop: {e}")
+                logger.exception("Error in monitoring loop: %s", e)
                 time.sleep(self.check_interval)
     
+    def _wait_for_next_tick(self):
+        """Sleep at least check_interval, then until a recording changes or the adaptive interval runs out"""
+        wake_at = time.monotonic() + self._next_tick_interval()
+        time.sleep(self.check_interval)
+        while self.monitoring:
+            remaining = wake_at - time.monotonic()
+            # Short waits keep stop_monitoring responsive during long idle intervals
+            if remaining <= 0 or self.recordings_mirror.wait_for_change(self.seen_mirror_version, min(remaining, self.check_interval)):
+                return
+    
+    def _next_tick_interval(self) -> float:
+        """Wait until the next tick: short while recordings change, backing off while none do, never past a deadline"""
+        now = time.monotonic()
+        deadlines = [self.sleep_scheduler.next_deadline()]
+        if self.background_recordings and self.use_background_anchor:
+            # Start of the next background checkpoint slot
+            deadlines.append(now + self.background_checkpoint_interval - time.time() % self.background_checkpoint_interval)
+        if self.restored_recordings:
+            deadlines.append(self.restore_deadline)
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        
+        # Without anchors, sleeping recordings are advanced by one second per tick
+        busy = self.last_tick_changes > 0 or (bool(self.background_recordings) and not self.use_background_anchor)
+        return self.tick_intervals.next_interval(busy, min(deadlines) - now if deadlines else None)
+    
     def _check_recordings(self):
-        """Check all active recordings"""
+        """Check recordings that changed or whose sleep deadline is due"""
+        tick_started = time.perf_counter()
         try:
-            # Get all current recordings from Realtime Database
-            current_recordings = self.db_ref.get() or {}
-            current_time = datetime.now()
+            if not self.use_streaming and self.owns_recordings_feed:
+                self._poll_recordings()
+            
+            current_time = time.monotonic()
             
-            for mechanic_id, recording_data in current_recordings.items():
-                if isinstance(recording_data, dict) and recording_data.get('status') == 'running':
+            if self.shard and self.shard.generation != self.shard_generation:
+                self._rebalance_shard(current_time)
+            
+            # Only recordings that changed since the last tick need processing
+            self.seen_mirror_version = self.recordings_mirror.version
+            changes = self.recordings_mirror.drain_changes()
+            self.last_tick_changes = len(changes)
+            for mechanic_id, recording_data in changes.items():
+                if not self._owns(mechanic_id):
+                    continue
+                if recording_data is None:
+                    if mechanic_id in self.tracked_recordings:
+                        # Clean up recordings that are no longer in database
+                        logger.info("Recording removed from database", extra={'mechanicId': mechanic_id})
+                        self._forget_recording(mechanic_id)
+                elif isinstance(recording_data, dict) and recording_data.get('status') == 'running':
                     self._process_recording(mechanic_id, recording_data, current_time)
+                elif mechanic_id in self.background_recordings:
+                    # Paused while sleeping - write the final derived duration
+                    final_duration = self._finish_background_recording(mechanic_id, recording_data.get('duration', 0))
+                    self.tracked_recordings[mechanic_id].last_duration = final_duration
+            
+            # Continue recordings that were already sleeping before this tick
+            if self.use_background_anchor:
+                self._checkpoint_background_recordings()
+            else:
+                for mechanic_id in list(self.background_recordings):
+                    recording_data = self.recordings_mirror.get(mechanic_id)
+                    if isinstance(recording_data, dict) and recording_data.get('status') == 'running':
+                        self._continue_background_recording(mechanic_id, recording_data)
             
-            # Clean up recordings that are no longer in database
-            mechanics_to_remove = []
-            for mechanic_id in self.tracked_recordings:
-                if mechanic_id not in current_recordings:
-                    print(f"Recording removed from database: {mechanic_id}")
-                    mechanics_to_remove.append(mechanic_id)
+            # Recordings whose duration hasn't changed within sleep_detection_timeout
+            for mechanic_id in self.sleep_scheduler.pop_due(time.monotonic()):
+                self._handle_sleep_deadline(mechanic_id)
             
-            for mechanic_id in mechanics_to_remove:
-                del self.tracked_recordings[mechanic_id]
+            if self.restored_recordings and time.monotonic() >= self.restore_deadline:
+                self._drop_unclaimed_restored()
                 
         except Exception as e:
-            print(f"Error checking recordings: {e}")
+            logger.exception("Error checking recordings: %s", e)
+        finally:
+            self.write_buffer.flush()
+            if self.checkpoint:
+                self.checkpoint.flush()
+            metrics.TRACKED_RECORDINGS.set(len(self.tracked_recordings))
+            metrics.BACKGROUND_RECORDINGS.set(len(self.background_recordings))
+            metrics.observe_tick('monitoring', time.perf_counter() - tick_started, self.check_interval)
     
-    def _process_recording(self, mechanic_id: str, recording_data: Dict[str, Any], current_time: datetime):
-        """Process a single recording"""
+    def _poll_recordings(self):
+        """Polling mode: bring the mirror up to date with what changed in the Realtime Database"""
+        if self.use_snapshot_fetcher:
+            if self.snapshot_fetcher is None:
+                self.snapshot_fetcher = RecordingsSnapshotFetcher(self.db_ref, per_node=self.snapshot_per_node_reads)
+            self.recordings_mirror.apply_changes(self.snapshot_fetcher.fetch().as_changes())
+            return
+        
+        # Download the whole tree and diff it against the mirror
+        with metrics.track_call('rtdb', 'get'):
+            recordings = self.db_ref.get() or {}
+        metrics.record_payload('rtdb', 'get', recordings)
+        self.recordings_mirror.replace(recordings)
+    
+    def _process_recording(self, mechanic_id: str, recording_data: Dict[str, Any], current_time: float):
+        """Process a single changed recording"""
         try:
             task_id = recording_data.get('taskId', '')
             duration = recording_data.get('duration', 0)
@@ -113,113 +271,307 @@ class TaskMonitoringService:
             
             # Check if this is a new recording or existing one
             if mechanic_id not in self.tracked_recordings:
-                # New recording detected
-                self.tracked_recordings[mechanic_id] = {
-                    'taskId': task_id,
-                    'lastDuration': duration,
-                    'lastUpdateTime': current_time,
-                    'isBackgroundRecording': False,
-                    'deviceId': device_id,
-                    'isNotified': is_notified
-                }
-                print(f"New recording detected: Mechanic {mechanic_id}, Task {task_id}")
+                # New recording detected (interned so the key is shared with the mirror and scheduler)
+                self.tracked_recordings[sys.intern(mechanic_id)] = TrackedRecording(task_id, device_id, duration, current_time, is_notified)
+                
+                restored = self.restored_recordings.pop(mechanic_id, None)
+                started_at = recording_data.get('backgroundStartedAt')
+                if self.use_background_anchor and started_at:
+                    # Already sleeping before this service started - keep counting from the stored anchor
+                    self._adopt_background_recording(mechanic_id, recording_data)
+                    return
+                
+                if restored and self._resume_restored_recording(mechanic_id, restored, recording_data, current_time):
+                    return
+                
+                self._schedule_sleep_check(mechanic_id)
+                self._checkpoint_recording(mechanic_id)
+                logger.info("New recording detected", extra={'mechanicId': mechanic_id, 'taskId': task_id, 'duration': duration})
                 return
             
             tracked = self.tracked_recordings[mechanic_id]
             
             # Check if duration has changed (app is active)
-            if duration != tracked['lastDuration']:
+            if duration != tracked.last_duration:
                 # App is active and updating
-                if tracked['isBackgroundRecording']:
-                    print(f"App resumed recording: Mechanic {mechanic_id}, Task {task_id}")
-                    tracked['isBackgroundRecording'] = False
+                if tracked.is_background:
+                    logger.info("App resumed recording", extra={'mechanicId': mechanic_id, 'taskId': task_id, 'duration': duration})
+                    # The app resumes from the last checkpoint, so correct it to the derived duration
+                    duration = self._finish_background_recording(mechanic_id, duration)
                 
-                tracked['lastDuration'] = duration
-                tracked['lastUpdateTime'] = current_time
+                # Persisting every second isn't needed - a restart extrapolates from the last checkpointed duration
+                persist = int(current_time // self.checkpoint_interval) != int(tracked.last_update // self.checkpoint_interval)
+                tracked.last_duration = duration
+                tracked.last_update = current_time
+                self._schedule_sleep_check(mechanic_id)
+                if persist:
+                    self._checkpoint_recording(mechanic_id)
                 return
             
-            # Duration hasn't changed - check if app might be sleeping
-            time_since_update = (current_time - tracked['lastUpdateTime']).total_seconds()
-            
-            if time_since_update >= self.sleep_detection_timeout and not tracked['isBackgroundRecording']:
-                # App appears to be sleeping, start background recording
-                print(f"App appears to be sleeping, starting background recording: Mechanic {mechanic_id}, Task {task_id}")
-                tracked['isBackgroundRecording'] = True
-                self._start_background_recording(mechanic_id, recording_data)
-            
-            elif tracked['isBackgroundRecording']:
-                # Continue background recording
-                self._continue_background_recording(mechanic_id, recording_data)
+            # Duration hasn't changed (e.g. resumed from pause) - make sure a sleep check is pending
+            if not tracked.is_background and mechanic_id not in self.sleep_scheduler:
+                self._schedule_sleep_check(mechanic_id)
             
             # Note: Task time exceeded notifications are now handled by task_notification_service.py
                 
         except Exception as e:
-            print(f"Error processing recording for mechanic {mechanic_id}: {e}")
+            logger.exception("Error processing recording: %s", e, extra={'mechanicId': mechanic_id})
+    
+    def _owns(self, mechanic_id: str) -> bool:
+        """Check whether this worker is responsible for a mechanic"""
+        return self.shard is None or self.shard.owns(mechanic_id)
+    
+    def _rebalance_shard(self, current_time: float):
+        """Release mechanics that moved to another worker and pick up the ones that moved here"""
+        self.shard_generation = self.shard.generation
+        
+        # Released recordings are dropped without writes - their anchors stay in RTDB for the new owner
+        released = [mechanic_id for mechanic_id in self.tracked_recordings if not self.shard.owns(mechanic_id)]
+        for mechanic_id in released:
+            self._forget_recording(mechanic_id)
+        
+        acquired = 0
+        for mechanic_id, recording_data in self.recordings_mirror.snapshot().items():
+            if (mechanic_id not in self.tracked_recordings and self.shard.owns(mechanic_id)
+                    and isinstance(recording_data, dict) and recording_data.get('status') == 'running'):
+                self._process_recording(mechanic_id, recording_data, current_time)
+                acquired += 1
+        
+        if released or acquired:
+            logger.info("Shard rebalanced", extra={'released': len(released), 'acquired': acquired})
+    
+    def _schedule_sleep_check(self, mechanic_id: str):
+        """(Re)arm the sleep-detection deadline for a recording"""
+        self.sleep_scheduler.schedule(mechanic_id, time.monotonic() + self.sleep_detection_timeout)
+    
+    def _handle_sleep_deadline(self, mechanic_id: str):
+        """Duration hasn't changed for sleep_detection_timeout - the app is probably sleeping"""
+        try:
+            tracked = self.tracked_recordings.get(mechanic_id)
+            recording_data = self.recordings_mirror.get(mechanic_id)
+            
+            if not tracked or tracked.is_background:
+                return
+            if not isinstance(recording_data, dict) or recording_data.get('status') != 'running':
+                # Paused recordings are re-armed when they start running again
+                return
+            
+            # App appears to be sleeping, start background recording
+            logger.info("App appears to be sleeping, starting background recording",
+                        extra={'mechanicId': mechanic_id, 'taskId': tracked.task_id, 'duration': tracked.last_duration})
+            tracked.is_background = True
+            self.background_recordings.add(mechanic_id)
+            self._start_background_recording(mechanic_id, recording_data)
+            self._checkpoint_recording(mechanic_id)
+            
+        except Exception as e:
+            logger.exception("Error handling sleep deadline: %s", e, extra={'mechanicId': mechanic_id})
+    
+    def _forget_recording(self, mechanic_id: str):
+        """Stop tracking a recording"""
+        self.tracked_recordings.pop(mechanic_id, None)
+        self.background_recordings.discard(mechanic_id)
+        self.sleep_scheduler.cancel(mechanic_id)
+        if self.checkpoint:
+            self.checkpoint.delete('tracked', mechanic_id)
     
     def _start_background_recording(self, mechanic_id: str, recording_data: Dict[str, Any]):
         """Start background recording when app goes to sleep"""
         try:
-            print(f"Starting background recording for mechanic {mechanic_id}")
-            # The background recording will be handled by _continue_background_recording
+            if self.use_background_anchor:
+                # Anchor at the app's last update - duration is derived from wall-clock time from here on
+                tracked = self.tracked_recordings[mechanic_id]
+                tracked.set_anchor(tracked.last_update_epoch_ms(), tracked.last_duration)
+                
+                self.write_buffer.put(f"{mechanic_id}/backgroundStartedAt", tracked.background_started_at)
+                self.write_buffer.put(f"{mechanic_id}/backgroundBaseDuration", tracked.background_base_duration)
+            # Otherwise the background recording will be handled by _continue_background_recording
             
         except Exception as e:
-            print(f"Error starting background recording: {e}")
+            logger.exception("Error starting background recording: %s", e, extra={'mechanicId': mechanic_id})
+    
+    def _adopt_background_recording(self, mechanic_id: str, recording_data: Dict[str, Any]):
+        """Track a recording whose background anchor was written before this service started"""
+        tracked = self.tracked_recordings[mechanic_id]
+        tracked.is_background = True
+        tracked.set_anchor(recording_data['backgroundStartedAt'], recording_data.get('backgroundBaseDuration', tracked.last_duration))
+        self.background_recordings.add(mechanic_id)
+        self._checkpoint_recording(mechanic_id)
+        logger.info("Resuming background recording from stored anchor",
+                    extra={'mechanicId': mechanic_id, 'taskId': tracked.task_id, 'backgroundStartedAt': tracked.background_started_at})
+    
+    def _checkpoint_background_recordings(self):
+        """Write derived durations of sleeping recordings once per checkpoint interval"""
+        # Checkpoints are aligned to wall-clock slots so every sleeping recording lands in the same update()
+        slot = int(time.time() // self.background_checkpoint_interval)
+        if slot == self.last_checkpoint_slot:
+            return
+        self.last_checkpoint_slot = slot
+        
+        for mechanic_id in list(self.background_recordings):
+            recording_data = self.recordings_mirror.get(mechanic_id)
+            if isinstance(recording_data, dict) and recording_data.get('status') == 'running':
+                self._continue_background_recording(mechanic_id, recording_data)
     
     def _continue_background_recording(self, mechanic_id: str, recording_data: Dict[str, Any]):
         """Continue recording in background"""
         try:
-            current_duration = recording_data.get('duration', 0)
-            new_duration = current_duration + 1
+            tracked = self.tracked_recordings[mechanic_id]
             
-            # Update duration in Realtime Database
-            self.db_ref.child(mechanic_id).child('duration').set(new_duration)
+            if self.use_background_anchor:
+                new_duration = self.get_recording_duration(mechanic_id)
+                if new_duration == tracked.last_duration:
+                    return
+                self.write_buffer.put(f"{mechanic_id}/duration", new_duration)
+            else:
+                current_duration = recording_data.get('duration', 0)
+                new_duration = current_duration + 1
+                
+                # Update duration in Realtime Database
+                self.write_buffer.put(f"{mechanic_id}/duration", new_duration)
             
             # Update our tracking
-            self.tracked_recordings[mechanic_id]['lastDuration'] = new_duration
-            self.tracked_recordings[mechanic_id]['lastUpdateTime'] = datetime.now()
+            previous_duration = tracked.last_duration
+            tracked.last_duration = new_duration
+            tracked.last_update = time.monotonic()
             
-            if new_duration % 300 == 0:  # Log every 5 minutes
-                print(f"Background recording: Mechanic {mechanic_id}, Duration: {new_duration}s")
+            if new_duration // 300 != previous_duration // 300:  # Log every 5 minutes
+                logger.info("Background recording", extra={'mechanicId': mechanic_id, 'taskId': tracked.task_id, 'duration': new_duration})
                 
         except Exception as e:
-            print(f"Error continuing background recording: {e}")
+            logger.exception("Error continuing background recording: %s", e, extra={'mechanicId': mechanic_id})
+    
+    def _finish_background_recording(self, mechanic_id: str, reported_duration: int) -> int:
+        """Stop background recording and return the duration the recording should continue from"""
+        tracked = self.tracked_recordings[mechanic_id]
+        derived_duration = self.get_recording_duration(mechanic_id)
+        
+        tracked.is_background = False
+        self.background_recordings.discard(mechanic_id)
+        
+        if not tracked.has_anchor:
+            return reported_duration
+        
+        tracked.clear_anchor()
+        self._checkpoint_recording(mechanic_id)
+        self.write_buffer.put(f"{mechanic_id}/backgroundStartedAt", None)
+        self.write_buffer.put(f"{mechanic_id}/backgroundBaseDuration", None)
+        
+        final_duration = max(derived_duration, reported_duration)
+        if final_duration != reported_duration:
+            self.write_buffer.put(f"{mechanic_id}/duration", final_duration)
+        return final_duration
+    
+    def _checkpoint_recording(self, mechanic_id: str):
+        """Persist a tracked recording's current state (written when the tick ends)"""
+        if self.checkpoint:
+            self.checkpoint.put('tracked', mechanic_id, self.tracked_recordings[mechanic_id].to_checkpoint())
+    
+    def _restore_checkpoint(self):
+        """Load tracked state saved before a restart; recordings claim it as they are first seen"""
+        for mechanic_id, data in self.checkpoint.items('tracked'):
+            try:
+                self.restored_recordings[sys.intern(mechanic_id)] = TrackedRecording.from_checkpoint(data)
+            except (KeyError, TypeError) as e:
+                logger.warning("Skipping unreadable checkpoint entry: %s", e, extra={'mechanicId': mechanic_id})
+                self.checkpoint.delete('tracked', mechanic_id)
+        self.restore_deadline = time.monotonic() + self.restore_window
+        if self.restored_recordings:
+            logger.info("Restored tracked recordings from checkpoint", extra={'recordings': len(self.restored_recordings)})
+    
+    def _resume_restored_recording(self, mechanic_id: str, restored: TrackedRecording, recording_data: Dict[str, Any],
+                                   current_time: float) -> bool:
+        """Continue tracking a recording from its checkpoint instead of as new; False if the checkpoint no longer applies"""
+        duration = recording_data.get('duration', 0)
+        if restored.task_id != recording_data.get('taskId', '') or duration < restored.last_duration:
+            return False
+        
+        # The app adds one second per second while awake, so its duration tells how long after the checkpoint it last wrote
+        restored.last_update = min(current_time, restored.last_update + (duration - restored.last_duration))
+        restored.last_duration = duration
+        restored.device_id = recording_data.get('deviceId', '')
+        restored.flags &= ~(BACKGROUND | ANCHORED)  # No anchor in the database, so the app was awake at last_update
+        restored.background_started_at = 0
+        restored.background_base_duration = 0
+        self.tracked_recordings[mechanic_id] = restored
+        
+        # Sleep detection picks up where it stopped - an app that went quiet before the restart is anchored this tick
+        self.sleep_scheduler.schedule(mechanic_id, restored.last_update + self.sleep_detection_timeout)
+        self._checkpoint_recording(mechanic_id)
+        return True
+    
+    def _drop_unclaimed_restored(self):
+        """Forget restored state whose recording never showed up (finished while the service was down, or another shard's)"""
+        for mechanic_id in self.restored_recordings:
+            if mechanic_id not in self.tracked_recordings:
+                self.checkpoint.delete('tracked', mechanic_id)
+        self.restored_recordings.clear()
+    
+    def get_recording_duration(self, mechanic_id: str) -> Optional[int]:
+        """Get the current duration of a tracked recording, derived from its anchor while sleeping"""
+        tracked = self.tracked_recordings.get(mechanic_id)
+        if not tracked:
+            return None
+        
+        if tracked.is_background and tracked.has_anchor:
+            return max(tracked.last_duration, background_duration(tracked.background_base_duration, tracked.background_started_at))
+        return tracked.last_duration
     
     def get_statistics(self) -> Dict[str, Any]:
         """Get monitoring statistics"""
-        background_recordings = sum(1 for r in self.tracked_recordings.values() if r.get('isBackgroundRecording', False))
-        
         return {
             'total_recordings': len(self.tracked_recordings),
-            'background_recordings': background_recordings,
+            'background_recordings': len(self.background_recordings),
+            'pending_sleep_checks': len(self.sleep_scheduler),
             'monitoring_status': self.monitoring,
-            'check_interval': self.check_interval
+            'check_interval': self.check_interval,
+            'tick_interval': self.tick_intervals.get_statistics() if self.tick_intervals and not self.runtime else None,
+            'streaming': self.use_streaming,
+            'stream_events': self.recordings_mirror.event_count,
+            'snapshot_fetcher': self.snapshot_fetcher.get_statistics() if self.snapshot_fetcher else None,
+            'rtdb_writes': self.write_buffer.get_statistics(),
+            'runtime': self.runtime.get_statistics() if self.runtime else 'thread',
+            'shard': self.shard.get_statistics() if self.shard else None,
+            'checkpoint': self.checkpoint.get_statistics() if self.checkpoint else None
         }
 
-def main():
-    """Main function to run the monitoring service"""
-    print("Starting Simple MechLink Task Monitoring Service...")
+def main(streaming: bool = False, shard: bool = False, worker_id: Optional[str] = None):
+    """Main function to run the monitoring service (with shard, only for the mechanics this worker owns)"""
+    configure_logging()
+    logger.info("Starting Simple MechLink Task Monitoring Service")
     
     try:
         # Create and start the monitoring service
-        service = TaskMonitoringService()
+        _, db_ref, firestore_client = firebase_setup.initialize_firebase()
+        service = TaskMonitoringService(db_ref=db_ref, firestore_client=firestore_client, streaming=streaming,
+                                        shard=open_shard(db_ref, shard, worker_id), checkpoint=open_checkpoint('monitoring'))
         service.start_monitoring()
         
-        print("Service started successfully. Press Ctrl+C to stop.")
+        logger.info("Service started successfully. Press Ctrl+C to stop.")
         
         # Keep the service running
         while True:
             time.sleep(300)  # Print stats every 5 minutes
             stats = service.get_statistics()
-            print(f"Service stats: {stats}")
+            logger.info("Service stats", extra={'stats': stats})
             
     except KeyboardInterrupt:
-        print("Received shutdown signal...")
+        logger.info("Received shutdown signal")
         service.stop_monitoring()
-        print("Service stopped gracefully")
+        logger.info("Service stopped gracefully")
     except Exception as e:
-        print(f"Service error: {e}")
+        logger.exception("Service error: %s", e)
         if 'service' in locals():
             service.stop_monitoring()
+    finally:
+        if 'service' in locals() and service.checkpoint:
+            service.checkpoint.close()
+        shutdown_logging()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="MechLink Task Monitoring Service")
+    parser.add_argument('--streaming', action='store_true', help="Subscribe to RTDB events instead of polling")
+    parser.add_argument('--shard', action='store_true', help="Split mechanics with the other sharded workers (also: MECHLINK_SHARD=1)")
+    parser.add_argument('--worker-id', help="Stable shard worker ID, the same after a restart (default: $MECHLINK_WORKER_ID or the host name)")
+    args = parser.parse_args()
+    main(streaming=args.streaming, shard=args.shard, worker_id=args.worker_id)
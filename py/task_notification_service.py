@@ -4,161 +4,576 @@ MechLink Task Notification Service
 Monitors Realtime Database recordings and sends notifications when tasks exceed estimated time
 """
 
+import argparse
+import logging
 import time
 import threading
 from datetime import datetime
-from typing import Dict, Any, Optional
-import firebase_admin
-from firebase_admin import credentials, firestore, messaging, db
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+from firebase_admin import messaging
+from recordings_mirror import RecordingsMirror, effective_duration, is_recording_key
+from rtdb_write_buffer import RTDBWriteBuffer
+from document_cache import DocumentCache
+from deadline_scheduler import DeadlineScheduler
+from adaptive_interval import AdaptiveInterval
+from notification_dispatcher import NotificationDispatcher
+from async_runtime import AsyncServiceRuntime
+from shard_coordinator import ShardCoordinator, open_shard
+from state_checkpoint import StateCheckpoint, open_checkpoint
+from notification_dedup import NotificationDedupIndex, notification_key, is_session_key, CLAIM_WON, CLAIM_COMMITTED, CLAIM_PENDING
+from notification_thresholds import ThresholdSchedule, thresholds_from_env
+from overrun_analytics import OverrunAnalytics
+import firebase_setup
+import metrics
+from structured_logging import configure_logging, get_logger, shutdown_logging
+
+logger = get_logger('notification')
+
+# Task fields the notification path reads, and all that the state checkpoint keeps per task
+TASK_CHECKPOINT_FIELDS = ('id', 'title', 'estimatedTime')
 
 class TaskNotificationService:
-    def __init__(self):
-        """Initialize the task notification service"""
+    def __init__(self, db_ref=None, firestore_client=None, write_buffer: Optional[RTDBWriteBuffer] = None, messaging_transport=None,
+                 recordings_mirror: Optional[RecordingsMirror] = None, shard: Optional[ShardCoordinator] = None,
+                 checkpoint: Optional[StateCheckpoint] = None):
+        """Initialize the task notification service
+        
+        Pass db_ref, firestore_client and messaging_transport (e.g. fake_firebase stand-ins) to run without
+        connecting to Firebase, and write_buffer to share one RTDB write buffer with the monitoring service.
+        Pass recordings_mirror to read recordings from a shared RecordingsFeed instead of Realtime Database.
+        Pass shard to notify only the mechanics this worker owns on the shard ring.
+        """
         self.firebase_app = None
-        self.firestore_client = None
-        self.db_ref = None
+        self.firestore_client = firestore_client
+        self.db_ref = db_ref
+        self.recordings_mirror = recordings_mirror
+        self.shard = shard
         self.monitoring = False
         self.monitor_thread = None
+        self.runtime: Optional[AsyncServiceRuntime] = None
+        self.next_full_check = 0
+        self.full_check_intervals: Optional[AdaptiveInterval] = None
+        self.last_running = 0
         
         # Configuration
-        self.check_interval = 30  # Check every 30 seconds
+        self.check_interval = 30  # Re-read all recordings every 30 seconds
+        self.deadline_tick_interval = 1  # Fire due exceedance deadlines every second
+        self.max_idle_check_interval = 120  # Back full checks off to this while no recording is running
+        self.interval_jitter = 0.1  # Spread intervals by +/-10% so instances started together drift apart
+        self.use_deadline_index = True  # Notify when a precomputed deadline passes instead of at the next full check
+        self.duration_jump_tolerance = 5  # Re-key a deadline when a recording drifts this many seconds from wall-clock
+        self.task_cache_ttl = 600  # Task title/estimatedTime rarely change while a recording runs
+        self.document_cache_size = 100000  # Must exceed the number of concurrent recordings or prefetched documents get evicted
+        self.watch_tasks = False  # Keep cached tasks fresh with an on_snapshot watch on in-progress tasks
+        self.get_all_chunk_size = 100  # Documents per batched get_all() call
+        self.firestore_batch_size = 500  # Firestore allows at most 500 writes per batch
+        self.mark_tasks_notified = False  # Also set isNotified/notifiedAt on the Firestore task
+        self.notification_thresholds = thresholds_from_env()  # Fractions of estimatedTime to notify at once each, e.g. (0.8, 1.0, 1.5)
+        self.use_asyncio = False  # Run ticks on an asyncio runtime with concurrent, thread-pooled I/O
+        self.statistics_ttl = 300  # Re-count tasks with aggregation queries at most this often (seconds)
+        self.track_overruns = True  # Keep actual-vs-estimated statistics per mechanic and task title from full checks
+        
+        # Task metadata by task ID, so steady-state polling does no Firestore reads for tasks already seen
+        self.task_cache = DocumentCache(max_entries=self.document_cache_size, ttl=self.task_cache_ttl)
+        self.mechanic_cache = DocumentCache(max_entries=self.document_cache_size, ttl=self.task_cache_ttl)
+        
+        # Notification claims and cached task fields, persisted for restarts
+        self.checkpoint = checkpoint
+        
+        # When each running recording will reach its next notification threshold, keyed by mechanic ID
+        self.threshold_schedule = ThresholdSchedule(self.notification_thresholds)
+        self.exceedance_scheduler = DeadlineScheduler()
+        self.indexed_recordings: Dict[str, Dict[str, Any]] = {}
+        self.notified_masks: Dict[str, int] = {}  # Thresholds already notified, per candidate recording
+        
+        if self.db_ref is None:
+            self._initialize_firebase()
+        
+        # Notified flags set during a cycle are written with a single multi-path update()
+        self.write_buffer = write_buffer or RTDBWriteBuffer(self.db_ref)
         
-        self._initialize_firebase()
+        # Each recording session's notification is claimed before it is prepared, so overlapping workers never both send it
+        self.dedup_index = NotificationDedupIndex(self.firestore_client, worker_id=shard.worker_id if shard else None)
+        
+        # Finished recordings folded into overrun statistics, written to Firestore every few minutes
+        self.overrun_analytics = OverrunAnalytics(self.firestore_client)
+        
+        # Push delivery runs on its own thread so the monitor loop never waits on FCM
+        self.notification_dispatcher = NotificationDispatcher(messaging_transport)
+        
+        # Notification writes collected during a cycle and committed together by _commit_notifications
+        self.pending_firestore_writes: List[Tuple[str, Any, Dict[str, Any]]] = []
+        self.pending_notified_recordings: Dict[str, Tuple[str, int]] = {}  # Mechanic ID -> (claim key, notified mask)
+        self.pending_pushes: List[Tuple[Any, Dict[str, Any], str]] = []
+        self.held_pushes: List[Tuple[Any, Dict[str, Any], str]] = []
+        
+        # Statistics: task counts from count() aggregations, cached; the rest counted from the service's own events
+        self.task_counts: Optional[Dict[str, int]] = None
+        self.task_counts_at = 0.0
+        self.notifications_committed = 0
     
     def _initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
         try:
-            # Initialize Firebase Admin SDK
-            cred = credentials.Certificate('py/mechlink-34628-firebase-adminsdk-fbsvc-6d305dc93a.json')
-            self.firebase_app = firebase_admin.initialize_app(cred, {
-                'databaseURL': 'https://mechlink-34628-default-rtdb.asia-southeast1.firebasedatabase.app'
-            })
+            # Initialize Firebase Admin SDK, Firestore client and Realtime Database
+            self.firebase_app, self.db_ref, self.firestore_client = firebase_setup.initialize_firebase()
             
-            # Initialize Firestore client and Realtime Database
-            self.firestore_client = firestore.client()
-            self.db_ref = db.reference('/')
-            
-            print("Firebase initialized successfully for Task Notification Service")
+            logger.info("Firebase initialized successfully for Task Notification Service")
             
         except Exception as e:
-            print(f"Failed to initialize Firebase: {e}")
+            logger.exception("Failed to initialize Firebase: %s", e)
             raise
     
     def start_monitoring(self):
         """Start monitoring tasks for notifications"""
         if self.monitoring:
-            print("Task notification monitoring already started")
+            logger.warning("Task notification monitoring already started")
             return
         
         self.monitoring = True
-        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        self.monitor_thread.start()
-        print("Task notification service started")
+        self.threshold_schedule = ThresholdSchedule(self.notification_thresholds)
+        
+        if self.checkpoint:
+            self._restore_checkpoint()
+        
+        if self.watch_tasks:
+            # Pushed changes replace TTL expiry as the way cached tasks are refreshed
+            self.task_cache.ttl = None
+            self.task_cache.start_watch(self.firestore_client.collection('tasks').where('status', '==', 'inProgress'))
+        
+        if self.shard:
+            self.shard.start()
+        
+        self.notification_dispatcher.start()
+        self.next_full_check = 0
+        self.full_check_intervals = AdaptiveInterval(self.check_interval, self.max_idle_check_interval, jitter=self.interval_jitter)
+        
+        if self.use_asyncio:
+            # Fixed-rate ticks with drift correction; stop_monitoring cancels the tick task
+            self.runtime = AsyncServiceRuntime('task-notification')
+            self.runtime.start(self._tick, self.deadline_tick_interval if self.use_deadline_index else self.check_interval)
+        else:
+            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self.monitor_thread.start()
+        logger.info("Task notification service started")
     
     def stop_monitoring(self):
         """Stop monitoring tasks"""
         self.monitoring = False
+        self.task_cache.stop_watch()
+        if self.runtime:
+            self.runtime.stop()
+            self.runtime = None
         if self.monitor_thread:
             self.monitor_thread.join(timeout=10)
-        print("Task notification service stopped")
+        self.notification_dispatcher.stop()
+        if self.track_overruns:
+            self.overrun_analytics.flush()
+        if self.shard:
+            self.shard.stop()
+        if self.checkpoint:
+            self.checkpoint.flush()
+        logger.info("Task notification service stopped")
     
     def _monitor_loop(self):
         """Main monitoring loop"""
-        print("Starting task notification monitoring loop...")
+        logger.info("Starting task notification monitoring loop")
         
         while self.monitoring:
             try:
-                self._check_all_recordings()
-                time.sleep(self.check_interval)
+                mirror_version = self.recordings_mirror.version if self.recordings_mirror is not None else None
+                self._tick()
+                self._wait_for_next_tick(mirror_version)
             except Exception as e:
-                print(f"Error in task notification monitoring loop: {e}")
+                logger.exception("Error in task notification monitoring loop: %s", e)
                 time.sleep(self.check_interval)
     
+    def _wait_for_next_tick(self, mirror_version: Optional[int]):
+        """Sleep until the next full check or indexed deadline, whichever comes first
+        
+        While no recording is running, a change in the shared mirror (e.g. a recording starting or resuming)
+        brings the next full check forward. Running recordings change every second, so they don't wake the loop.
+        """
+        wake_at = self.next_full_check
+        if self.use_deadline_index:
+            next_deadline = self.exceedance_scheduler.next_deadline()
+            if next_deadline is not None:
+                wake_at = min(wake_at, next_deadline)
+        wake_at = max(wake_at, time.monotonic() + self.deadline_tick_interval)
+        
+        idle = self.last_running == 0 and mirror_version is not None
+        while self.monitoring:
+            # Short waits keep stop_monitoring responsive during long idle intervals
+            remaining = min(wake_at - time.monotonic(), self.deadline_tick_interval)
+            if remaining <= 0:
+                return
+            if not idle:
+                time.sleep(remaining)
+            elif self.recordings_mirror.wait_for_change(mirror_version, remaining):
+                self.next_full_check = 0
+                return
+    
+    def _tick(self):
+        """One loop iteration: full check when due, then due exceedance deadlines"""
+        tick_started = time.perf_counter()
+        if time.monotonic() >= self.next_full_check:
+            self._check_all_recordings()
+            self._schedule_full_check()
+            if self.track_overruns:
+                self.overrun_analytics.maybe_flush()
+        
+        if self.use_deadline_index:
+            self._fire_due_deadlines()
+        self._record_tick_metrics(time.perf_counter() - tick_started)
+    
+    def _schedule_full_check(self):
+        """Next full check: check_interval while any recording is running, backing off while none is"""
+        if self.full_check_intervals is None:
+            self.full_check_intervals = AdaptiveInterval(self.check_interval, self.max_idle_check_interval, jitter=self.interval_jitter)
+        # Held pushes are only released by a commit, so keep cycling until they are out
+        busy = self.last_running > 0 or bool(self.held_pushes)
+        self.next_full_check = time.monotonic() + self.full_check_intervals.next_interval(busy)
+    
+    def _record_tick_metrics(self, elapsed: float):
+        """Report a tick's duration and the deadline index size"""
+        metrics.observe_tick('notification', elapsed, self.deadline_tick_interval if self.use_deadline_index else self.check_interval)
+        metrics.INDEXED_DEADLINES.set(len(self.exceedance_scheduler))
+    
     def _check_all_recordings(self):
         """Check all active recordings in Realtime Database"""
         try:
-            print("Checking all active recordings...")
-            
-            # Get all current recordings from Realtime Database
-            current_recordings = self.db_ref.get() or {}
+            logger.debug("Checking all active recordings")
             
-            print(f"Found {len(current_recordings)} recordings in Realtime Database")
+            # Get all current recordings from the shared mirror or Realtime Database
+            current_recordings = self._read_recordings()
+            candidates = self._collect_candidates(current_recordings)
+            self._prune_claims(current_recordings)
             
-            checked_count = 0
-            for mechanic_id, recording_data in current_recordings.items():
-                if isinstance(recording_data, dict):
-                    # Extract recording data
-                    device_id = recording_data.get('deviceId', '')
-                    duration = recording_data.get('duration', 0)  # in seconds
-                    is_notified = recording_data.get('isNotified', False)
-                    job_id = recording_data.get('jobId', '')
-                    status = recording_data.get('status', '')
-                    task_id = recording_data.get('taskId', '')
-                    
-                    print(f"Recording {mechanic_id}: taskId={task_id}, duration={duration}s, isNotified={is_notified}, status={status}")
-                    
-                    # Only check running recordings that haven't been notified
-                    if task_id and status == 'running' and not is_notified:
-                        self._check_task_duration(task_id, duration, mechanic_id, device_id)
-                        checked_count += 1
-                    elif is_notified:
-                        print(f"  -> Already notified, skipping")
-                    elif status != 'running':
-                        print(f"  -> Not running (status: {status}), skipping")
-                    else:
-                        print(f"  -> No taskId, skipping")
+            # Fetch every task this cycle needs, then the mechanics of tasks about to be notified, with batched reads
+            self._prefetch_documents('tasks', [task_id for task_id, _, _, _ in candidates], self.task_cache)
+            self._checkpoint_tasks(candidates)
+            self._observe_overruns(current_recordings)
+            self._prefetch_documents('mechanics', self._exceeding_mechanics(candidates), self.mechanic_cache)
             
-            print(f"Checked {checked_count} active recordings")
+            self._process_candidates(candidates)
                 
         except Exception as e:
-            print(f"Error checking recordings: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error checking recordings: %s", e)
+        finally:
+            self._commit_notifications()
+    
+    def _observe_overruns(self, current_recordings: Dict[str, Any]):
+        """Feed the full check's snapshot to the overrun statistics, with task estimates from the cache only"""
+        if self.track_overruns:
+            self.overrun_analytics.observe(current_recordings, self._owns, self._cached_task)
+    
+    def _cached_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Cached task data, without falling back to Firestore"""
+        found, task_data = self.task_cache.peek(task_id)
+        return task_data if found else None
+    
+    def _read_recordings(self) -> Dict[str, Any]:
+        """Get all current recordings"""
+        if self.recordings_mirror is not None:
+            return self.recordings_mirror.snapshot()
+        with metrics.track_call('rtdb', 'get'):
+            recordings = self.db_ref.get() or {}
+        metrics.record_payload('rtdb', 'get', recordings)
+        return recordings
+    
+    def _read_recording(self, mechanic_id: str) -> Any:
+        """Get one mechanic's current recording"""
+        if self.recordings_mirror is not None:
+            return self.recordings_mirror.get(mechanic_id)
+        with metrics.track_call('rtdb', 'get'):
+            recording = self.db_ref.child(mechanic_id).get()
+        metrics.record_payload('rtdb', 'get', recording)
+        return recording
+    
+    def _collect_candidates(self, current_recordings: Dict[str, Any]) -> List[Tuple[str, int, str, str]]:
+        """Get (taskId, duration, mechanicId, deviceId) for every running recording with a threshold still to notify"""
+        logger.debug("Found recordings in Realtime Database", extra={'recordings': len(current_recordings)})
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        candidates = []
+        running = 0
+        self.notified_masks = {}
+        for mechanic_id, recording_data in current_recordings.items():
+            if not self._owns(mechanic_id):
+                # Another worker's shard (or a reserved bookkeeping key)
+                continue
+            if isinstance(recording_data, dict):
+                # Extract recording data
+                device_id = recording_data.get('deviceId', '')
+                duration = effective_duration(recording_data)  # in seconds, including background time not yet checkpointed
+                notified_mask = self.threshold_schedule.notified_mask(recording_data)
+                job_id = recording_data.get('jobId', '')
+                status = recording_data.get('status', '')
+                task_id = recording_data.get('taskId', '')
+                running += status == 'running'
+                
+                # Only check running recordings with a threshold left to notify (and no notified flag still being written)
+                if (task_id and status == 'running' and self.threshold_schedule.is_pending(notified_mask)
+                        and not self._is_notification_pending(mechanic_id)):
+                    claimed_mask = self._claimed_mask(mechanic_id, recording_data)
+                    if claimed_mask & ~notified_mask:
+                        # Already claimed (by this worker before a restart, or another worker) - repair the flag instead of notifying again
+                        notified_mask |= claimed_mask
+                        self._put_notified_flags(mechanic_id, notified_mask)
+                    if self.threshold_schedule.is_pending(notified_mask):
+                        self.notified_masks[mechanic_id] = notified_mask
+                        candidates.append((task_id, duration, mechanic_id, device_id))
+                        skip_reason = None
+                    else:
+                        skip_reason = 'already_claimed'
+                elif not self.threshold_schedule.is_pending(notified_mask):
+                    skip_reason = 'already_notified'
+                elif status != 'running':
+                    skip_reason = 'not_running'
+                else:
+                    skip_reason = 'no_task_id'
+                
+                if debug:
+                    # Per-recording detail, at most one line per mechanic per rate-limit interval
+                    logger.debug("Recording checked", extra={
+                        'mechanicId': mechanic_id, 'taskId': task_id, 'duration': duration, 'status': status,
+                        'notifiedThresholds': notified_mask, 'skipReason': skip_reason, 'rate_limit_key': mechanic_id
+                    })
+        
+        self.last_running = running
+        return candidates
+    
+    def _owns(self, mechanic_id: str) -> bool:
+        """Check whether this worker is responsible for a mechanic"""
+        return is_recording_key(mechanic_id) and (self.shard is None or self.shard.owns(mechanic_id))
+    
+    def _exceeding_mechanics(self, candidates: List[Tuple[str, int, str, str]]) -> List[str]:
+        """Mechanics whose (cached) task has already reached a threshold still to notify"""
+        return [
+            mechanic_id for task_id, duration, mechanic_id, _ in candidates
+            if self._reached_threshold(mechanic_id, self._get_task_data(task_id), duration) is not None
+        ]
+    
+    def _process_candidates(self, candidates: List[Tuple[str, int, str, str]]):
+        """Notify recordings that reached a threshold now and index the next crossing for the rest"""
+        for task_id, duration, mechanic_id, device_id in candidates:
+            task_data = self._get_task_data(task_id)
+            if self.use_deadline_index and task_data is not None and self._reached_threshold(mechanic_id, task_data, duration) is None:
+                # Not due yet - the deadline index fires it on time
+                self._index_deadline(mechanic_id, task_id, duration, device_id, task_data)
+            else:
+                self._unindex_deadline(mechanic_id)
+                self._check_task_duration(task_id, duration, mechanic_id, device_id)
+        
+        # Paused, notified and removed recordings no longer have a deadline
+        candidate_mechanics = {mechanic_id for _, _, mechanic_id, _ in candidates}
+        for mechanic_id in list(self.indexed_recordings):
+            if mechanic_id not in candidate_mechanics:
+                self._unindex_deadline(mechanic_id)
+        
+        logger.debug("Checked active recordings", extra={'candidates': len(candidates), 'indexedDeadlines': len(self.exceedance_scheduler)})
     
     def _check_task_duration(self, task_id: str, duration: int, mechanic_id: str, device_id: str):
-        """Check if task duration exceeds estimated time"""
+        """Check if task duration reached a notification threshold of its estimated time"""
         try:
-            # Get task data from Firestore
-            task_doc = self.firestore_client.collection('tasks').document(task_id).get()
-            if not task_doc.exists:
-                print(f"  -> Task {task_id} not found in Firestore")
+            # Get task data from the cache or Firestore
+            task_data = self._get_task_data(task_id)
+            if task_data is None:
+                logger.warning("Task not found in Firestore", extra={'mechanicId': mechanic_id, 'taskId': task_id})
                 return
             
-            task_data = task_doc.to_dict()
             task_title = task_data.get('title', 'Unknown Task')
             estimated_time_seconds = task_data.get('estimatedTime', 0)  # in seconds
             
-            print(f"  -> Task '{task_title}': duration={duration}s, estimatedTime={estimated_time_seconds}s")
-            
             # Skip if no estimated time is set
             if not estimated_time_seconds or estimated_time_seconds <= 0:
-                print(f"  -> No estimated time set, skipping")
+                logger.debug("No estimated time set", extra={'mechanicId': mechanic_id, 'taskId': task_id, 'rate_limit_key': mechanic_id})
                 return
             
-            # Check if duration exceeds estimated time
-            if duration >= estimated_time_seconds:
+            # Check if duration reached a threshold not notified yet
+            notified_mask = self.notified_masks.get(mechanic_id, 0)
+            index = self.threshold_schedule.reached(notified_mask, duration, estimated_time_seconds)
+            if index is not None:
+                threshold = self.threshold_schedule.thresholds[index]
                 duration_hours = round(duration / 3600, 1)
                 estimated_hours = round(estimated_time_seconds / 3600, 1)
                 
-                print(f"  -> ✅ EXCEEDED! Duration {duration_hours}h >= Estimated {estimated_hours}h")
+                logger.info("Task reached notification threshold", extra={
+                    'mechanicId': mechanic_id, 'taskId': task_id, 'taskTitle': task_title, 'threshold': threshold,
+                    'duration': duration, 'estimatedTime': estimated_time_seconds, 'durationHours': duration_hours, 'estimatedHours': estimated_hours
+                })
+                
+                # Claim it first - only the worker whose claim wins prepares the notification
+                notified_mask |= self.threshold_schedule.through(index)
+                claim_status, claim_key = self._claim_notification(mechanic_id, task_id, duration, threshold, notified_mask)
+                if claim_status == CLAIM_PENDING:
+                    # Another worker's claim isn't committed yet - leave the threshold open for the next full check
+                    return
+                
+                # Either way this threshold is taken - put the next crossing in the deadline index right away
+                self.notified_masks[mechanic_id] = notified_mask
+                if self.use_deadline_index and self.threshold_schedule.is_pending(notified_mask):
+                    self._index_deadline(mechanic_id, task_id, duration, device_id, task_data)
+                if claim_status != CLAIM_WON:
+                    return
                 
                 # Send notification
-                self._send_time_exceeded_notification(mechanic_id, task_data, device_id, duration)
+                self._send_time_exceeded_notification(mechanic_id, task_data, device_id, duration, threshold, claim_key)
                 
                 # Mark as notified in Realtime Database
-                self._mark_recording_as_notified(mechanic_id)
-                
-                print(f"  -> 📱 Notification sent and marked as notified")
+                self._mark_recording_as_notified(mechanic_id, claim_key, notified_mask)
+                if self.mark_tasks_notified and threshold >= 1.0:
+                    self._mark_task_as_notified(task_id)
             else:
-                print(f"  -> Within time limit")
+                logger.debug("Within time limit", extra={'mechanicId': mechanic_id, 'taskId': task_id, 'duration': duration, 'rate_limit_key': mechanic_id})
+                
+        except Exception as e:
+            logger.exception("Error checking task: %s", e, extra={'mechanicId': mechanic_id, 'taskId': task_id})
+    
+    def _index_deadline(self, mechanic_id: str, task_id: str, duration: int, device_id: str, task_data: Dict[str, Any]):
+        """Schedule when a recording will reach its next threshold, re-keying only on status, threshold or duration jumps"""
+        estimated_time_seconds = task_data.get('estimatedTime', 0)
+        notified_mask = self.notified_masks.get(mechanic_id, 0)
+        crossing = self.threshold_schedule.next_crossing(notified_mask, estimated_time_seconds) if estimated_time_seconds else None
+        if not crossing or crossing <= 0:
+            self._unindex_deadline(mechanic_id)
+            return
+        
+        now = time.monotonic()
+        indexed = self.indexed_recordings.get(mechanic_id)
+        if (indexed and indexed['taskId'] == task_id and indexed['estimatedTime'] == estimated_time_seconds
+                and indexed['notifiedMask'] == notified_mask):
+            # Running recordings advance with wall-clock time; small differences aren't worth a re-key
+            expected_duration = indexed['duration'] + (now - indexed['observedAt'])
+            if abs(duration - expected_duration) <= self.duration_jump_tolerance:
+                return
+        
+        self.indexed_recordings[mechanic_id] = {
+            'taskId': task_id,
+            'deviceId': device_id,
+            'duration': duration,
+            'estimatedTime': estimated_time_seconds,
+            'notifiedMask': notified_mask,
+            'observedAt': now
+        }
+        self.exceedance_scheduler.schedule(mechanic_id, now + (crossing - duration))
+    
+    def _unindex_deadline(self, mechanic_id: str):
+        """Drop a recording from the deadline index"""
+        if self.indexed_recordings.pop(mechanic_id, None) is not None:
+            self.exceedance_scheduler.cancel(mechanic_id)
+    
+    def _fire_due_deadlines(self):
+        """Notify recordings whose exceedance deadline has passed"""
+        due = self._pop_due_deadlines()
+        if not due:
+            return
+        
+        try:
+            # Confirm against the recordings themselves - they may have been paused or notified since the last full check
+            recordings = self._map_calls('rtdb', self._read_recording, [mechanic_id for mechanic_id, _ in due])
+            confirmed = [self._confirm_due_deadline(mechanic_id, indexed, recording_data) for (mechanic_id, indexed), recording_data in zip(due, recordings)]
+            ready = [entry for entry in confirmed if entry]
+            
+            self._prefetch_documents('mechanics', [mechanic_id for _, _, mechanic_id, _ in ready], self.mechanic_cache)
+            self._notify_ready(ready)
                 
         except Exception as e:
-            print(f"Error checking task {task_id}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error firing exceedance deadlines: %s", e)
+        finally:
+            self._commit_notifications()
+    
+    def _pop_due_deadlines(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Remove due recordings from the deadline index"""
+        due = []
+        for mechanic_id in self.exceedance_scheduler.pop_due(time.monotonic()):
+            indexed = self.indexed_recordings.pop(mechanic_id, None)
+            if indexed is not None:
+                due.append((mechanic_id, indexed))
+        return due
+    
+    def _confirm_due_deadline(self, mechanic_id: str, indexed: Dict[str, Any], recording_data: Any) -> Optional[Tuple[str, int, str, str]]:
+        """Check a due recording's current data; returns it ready to notify, or re-keys it if not yet exceeded"""
+        if (not self._owns(mechanic_id) or not isinstance(recording_data, dict) or recording_data.get('status') != 'running'
+                or recording_data.get('taskId') != indexed['taskId'] or self._is_notification_pending(mechanic_id)):
+            return None
+        
+        # Thresholds flagged in RTDB or claimed since the last full check
+        notified_mask = self.threshold_schedule.notified_mask(recording_data) | indexed['notifiedMask'] | self._claimed_mask(mechanic_id, recording_data)
+        if not self.threshold_schedule.is_pending(notified_mask):
+            return None
+        self.notified_masks[mechanic_id] = notified_mask
+        
+        duration = effective_duration(recording_data)
+        device_id = recording_data.get('deviceId', '')
+        task_data = self._get_task_data(indexed['taskId'])
+        if self._reached_threshold(mechanic_id, task_data, duration) is not None:
+            return (indexed['taskId'], duration, mechanic_id, device_id)
+        
+        if task_data is not None:
+            # Recording fell behind wall-clock (e.g. app asleep) - move the deadline
+            self._index_deadline(mechanic_id, indexed['taskId'], duration, device_id, task_data)
+        return None
+    
+    def _notify_ready(self, ready: List[Tuple[str, int, str, str]]):
+        """Run the duration check (and notification) for confirmed recordings"""
+        for task_id, duration, mechanic_id, device_id in ready:
+            self._check_task_duration(task_id, duration, mechanic_id, device_id)
+    
+    def _reached_threshold(self, mechanic_id: str, task_data: Optional[Dict[str, Any]], duration: int) -> Optional[int]:
+        """Index of the highest threshold a recording reached and wasn't notified for yet (None if none)"""
+        estimated_time_seconds = (task_data or {}).get('estimatedTime', 0)
+        if not estimated_time_seconds or estimated_time_seconds <= 0:
+            return None
+        return self.threshold_schedule.reached(self.notified_masks.get(mechanic_id, 0), duration, estimated_time_seconds)
+    
+    def _prefetch_documents(self, collection: str, document_ids: Iterable[str], cache: DocumentCache):
+        """Load uncached documents into a cache with one get_all() call per chunk"""
+        self._map_calls('firestore', lambda chunk: self._fetch_document_chunk(collection, chunk, cache),
+                        self._missing_document_chunks(document_ids, cache))
+    
+    def _map_calls(self, backend: str, function: Callable, items: List[Any]) -> List[Any]:
+        """Call function on every item: concurrently on the asyncio runtime, one after another otherwise"""
+        if self.runtime:
+            return self.runtime.map_blocking(backend, function, items)
+        return [function(item) for item in items]
+    
+    def _missing_document_chunks(self, document_ids: Iterable[str], cache: DocumentCache) -> List[List[str]]:
+        """Split the uncached document IDs into get_all() sized chunks"""
+        missing = [document_id for document_id in dict.fromkeys(document_ids) if not cache.peek(document_id)[0]]
+        return [missing[start:start + self.get_all_chunk_size] for start in range(0, len(missing), self.get_all_chunk_size)]
     
-    def _send_time_exceeded_notification(self, mechanic_id: str, task_data: Dict[str, Any], device_id: str, duration: int):
-        """Send FCM notification when task exceeds estimated time"""
+    def _fetch_document_chunk(self, collection: str, chunk: List[str], cache: DocumentCache):
+        """Read one chunk of documents with get_all() into a cache"""
+        try:
+            references = [self.firestore_client.collection(collection).document(document_id) for document_id in chunk]
+            found = {}
+            with metrics.track_call('firestore', 'get_all'):
+                for document in self.firestore_client.get_all(references):
+                    found[document.id] = document.to_dict() if document.exists else None
+            metrics.record_payload('firestore', 'get_all', found)
+            
+            for document_id in chunk:
+                cache.put(document_id, found.get(document_id))
+        except Exception as e:
+            # Whatever wasn't cached falls back to single reads
+            logger.warning("Error prefetching documents: %s", e, extra={'collection': collection, 'documents': len(chunk)})
+    
+    def _get_task_data(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get task data, reading Firestore only on a cache miss"""
+        found, task_data = self.task_cache.get(task_id)
+        if found:
+            return task_data
+        
+        with metrics.track_call('firestore', 'get'):
+            task_doc = self.firestore_client.collection('tasks').document(task_id).get()
+        task_data = task_doc.to_dict() if task_doc.exists else None
+        self.task_cache.put(task_id, task_data)
+        return task_data
+    
+    def _send_time_exceeded_notification(self, mechanic_id: str, task_data: Dict[str, Any], device_id: str, duration: int,
+                                         threshold: float = 1.0, claim_key: str = ''):
+        """Send FCM notification when task reaches a threshold (fraction) of its estimated time"""
         try:
             task_id = task_data.get('id', '')
             task_title = task_data.get('title', 'Task')
@@ -172,10 +587,22 @@ class TaskNotificationService:
             mechanic_info = self._get_mechanic_info(mechanic_id)
             mechanic_name = mechanic_info.get('name', 'Mechanic') if mechanic_info else 'Mechanic'
             
+            # Early warnings before the estimate, overruns past it
+            percent = round(threshold * 100)
+            if threshold < 1.0:
+                push_title, record_title, notification_type = "⏳ Task nearing estimated time", "⏳ Task Time Warning", f"task_time_warning_{percent}"
+                body = f"'{task_title}' has used {percent}% of its estimated time of {estimated_hours}h (current: {duration_hours}h)."
+            elif threshold == 1.0:
+                push_title, record_title, notification_type = "⏰ Task has exceeded estimated time", "⏰ Task Time Exceeded", 'task_time_exceeded'
+                body = f"'{task_title}' has exceeded its estimated time of {estimated_hours}h (current: {duration_hours}h)."
+            else:
+                push_title, record_title, notification_type = "⏰ Task is well over estimated time", "⏰ Task Time Overrun", f"task_time_overrun_{percent}"
+                body = f"'{task_title}' has reached {percent}% of its estimated time of {estimated_hours}h (current: {duration_hours}h)."
+            
             # Create notification
             notification = messaging.Notification(
-                title="⏰ Task has exceeded estimated time",
-                body=f"'{task_title}' has exceeded its estimated time of {estimated_hours}h (current: {duration_hours}h)."
+                title=push_title,
+                body=body
             )
             
             # Create data payload
@@ -187,6 +614,7 @@ class TaskNotificationService:
                 'duration': str(duration),
                 'estimatedTimeHours': str(estimated_hours),
                 'durationHours': str(duration_hours),
+                'thresholdPercent': str(percent),
                 'timestamp': str(int(time.time()))
             }
             
@@ -199,50 +627,214 @@ class TaskNotificationService:
                     token=device_id
                 )
                 
-                # Send notification
-                response = messaging.send(message)
-                print(f"FCM notification sent: {response}")
+                # Pushed only after the notification record and notified flag are committed
+                # deadlineAt (when the task crossed the threshold) lets the dispatcher report notification lag
+                deadline_at = time.time() - max(0, duration - threshold * estimated_time_seconds)
+                context = {'mechanicId': mechanic_id, 'taskId': task_id, 'deadlineAt': deadline_at, 'threshold': threshold}
+                self.pending_pushes.append((message, context, f"{mechanic_id}/notifiedThresholds"))
             else:
-                print(f"Skipping FCM (invalid token): {device_id}")
+                logger.warning("Skipping FCM (invalid token)", extra={'mechanicId': mechanic_id, 'deviceId': device_id})
             
             # Create notification record in Firestore
             notification_id = self._create_notification_record(
                 mechanic_id,
-                "⏰ Task Time Exceeded",
-                f"'{task_title}' has exceeded its estimated time of {estimated_hours}h (current: {duration_hours}h).",
-                'task_time_exceeded',
-                task_id  # Include task_id for reference
+                record_title,
+                body,
+                notification_type,
+                task_id,  # Include task_id for reference
+                claim_key
             )
             
-            print(f"  -> 📱 Notification sent and marked as notified")
-            
         except Exception as e:
-            print(f"Error sending time exceeded notification: {e}")
+            logger.exception("Error sending time exceeded notification: %s", e, extra={'mechanicId': mechanic_id, 'taskId': task_id})
     
-    def _mark_recording_as_notified(self, mechanic_id: str):
-        """Mark recording as notified in Realtime Database"""
-        try:
-            self.db_ref.child(mechanic_id).child('isNotified').set(True)
-            
-        except Exception as e:
-            print(f"Error marking recording {mechanic_id} as notified: {e}")
+    def _mark_recording_as_notified(self, mechanic_id: str, claim_key: str = '', notified_mask: Optional[int] = None):
+        """Mark recording as notified in Realtime Database (written once the cycle's records are committed)"""
+        if notified_mask is None:
+            notified_mask = self.threshold_schedule.all_mask
+        self.pending_notified_recordings[mechanic_id] = (claim_key, notified_mask)
+        if claim_key:
+            # The claim turns committed together with the notification record, so losing workers know it was sent
+            self.pending_firestore_writes.append(('update', *self.dedup_index.commit_write(claim_key)))
+    
+    def _put_notified_flags(self, mechanic_id: str, notified_mask: int):
+        """Buffer a recording's notified thresholds, plus isNotified once the estimate itself was passed"""
+        self.write_buffer.put(f"{mechanic_id}/notifiedThresholds", notified_mask)
+        if self.threshold_schedule.is_exceeded(notified_mask):
+            self.write_buffer.put(f"{mechanic_id}/isNotified", True)
     
     def _mark_task_as_notified(self, task_id: str):
-        """Mark task as notified in Firestore"""
+        """Mark task as notified in Firestore (added to the cycle's write batch)"""
+        task_ref = self.firestore_client.collection('tasks').document(task_id)
+        self.pending_firestore_writes.append(('update', task_ref, {
+            'isNotified': True,
+            'notifiedAt': datetime.now()
+        }))
+    
+    def _is_notification_pending(self, mechanic_id: str) -> bool:
+        """Check whether a recording's notified flag is still waiting to be written"""
+        return mechanic_id in self.pending_notified_recordings or self.write_buffer.is_pending(f"{mechanic_id}/notifiedThresholds")
+    
+    def _commit_notifications(self):
+        """Commit this cycle's notifications: Firestore records, then RTDB flags, then pushes
+        
+        Records have deterministic IDs, so committing them again after a crash overwrites instead of duplicating.
+        Pushes go last, so a crash can lose a push but never repeat one.
+        """
+        writes, self.pending_firestore_writes = self.pending_firestore_writes, []
+        notified_recordings, self.pending_notified_recordings = self.pending_notified_recordings, {}
+        self.held_pushes.extend(self.pending_pushes)
+        self.pending_pushes = []
+        
         try:
-            self.firestore_client.collection('tasks').document(task_id).update({
-                'isNotified': True,
-                'notifiedAt': datetime.now()
-            })
-            
+            for start in range(0, len(writes), self.firestore_batch_size):
+                batch = self.firestore_client.batch()
+                for operation, reference, data in writes[start:start + self.firestore_batch_size]:
+                    getattr(batch, operation)(reference, data)
+                    metrics.record_payload('firestore', 'batch_commit', data)
+                with metrics.track_call('firestore', 'batch_commit'):
+                    batch.commit()
+            if writes:
+                logger.info("Committed notification writes to Firestore", extra={'writes': len(writes)})
         except Exception as e:
-            print(f"Error marking task {task_id} as notified: {e}")
+            # Nothing is flagged or pushed, so the next cycle retries these notifications from scratch
+            logger.exception("Error committing notification writes: %s", e, extra={'writes': len(writes)})
+            for mechanic_id, (claim_key, _) in notified_recordings.items():
+                if claim_key:
+                    self.dedup_index.release(mechanic_id, claim_key)
+            dropped_flags = {f"{mechanic_id}/notifiedThresholds" for mechanic_id in notified_recordings}
+            self.held_pushes = [push for push in self.held_pushes if push[2] not in dropped_flags]
+            self.write_buffer.flush()
+            return
+        
+        self.notifications_committed += len(notified_recordings)
+        if self.checkpoint:
+            for mechanic_id, (claim_key, _) in notified_recordings.items():
+                if claim_key:
+                    self.checkpoint.put('notified', mechanic_id, claim_key)
+        for mechanic_id, (_, notified_mask) in notified_recordings.items():
+            self._put_notified_flags(mechanic_id, notified_mask)
+        self.write_buffer.flush()
+        if self.checkpoint:
+            self.checkpoint.flush()
+        
+        # Release pushes whose notified flag is safely in the Realtime Database
+        still_held = []
+        for message, context, flag_path in self.held_pushes:
+            if self.write_buffer.is_pending(flag_path):
+                still_held.append((message, context, flag_path))
+            elif not self.notification_dispatcher.enqueue(message, context):
+                logger.warning("Skipping FCM (unregistered token)", extra={'mechanicId': context.get('mechanicId')})
+        self.held_pushes = still_held
+    
+    def _recording_key(self, mechanic_id: str, recording_data: Any) -> Optional[str]:
+        """Dedup key of a recording's current session (None until the session has a startedAt)"""
+        if not isinstance(recording_data, dict) or not recording_data.get('startedAt'):
+            return None
+        return notification_key(mechanic_id, recording_data.get('taskId', ''), recording_data['startedAt'])
+    
+    def _claimed_mask(self, mechanic_id: str, recording_data: Any) -> int:
+        """Fast path: thresholds of this recording session already known to be claimed
+        
+        Thresholds are claimed in ascending order, so the latest claim covers every threshold below it.
+        """
+        session_key = self._recording_key(mechanic_id, recording_data)
+        claimed_key = self.dedup_index.claimed_key(mechanic_id)
+        if session_key is None or claimed_key is None or not is_session_key(claimed_key, session_key):
+            return 0
+        task_id, started_at = recording_data.get('taskId', ''), recording_data['startedAt']
+        for index, threshold in enumerate(self.threshold_schedule.thresholds):
+            if notification_key(mechanic_id, task_id, started_at, threshold) == claimed_key:
+                return self.threshold_schedule.through(index)
+        return 0
+    
+    def _claim_notification(self, mechanic_id: str, task_id: str, duration: int, threshold: float = 1.0,
+                            notified_mask: Optional[int] = None) -> Tuple[str, str]:
+        """Claim a recording session's notification at a threshold; returns the claim outcome and key
+        
+        notified_mask is what the recording's flags become once this threshold is notified.
+        """
+        started_at = self._recording_start(mechanic_id, duration)
+        key = notification_key(mechanic_id, task_id, started_at, threshold)
+        claim_status = self.dedup_index.claim(mechanic_id, key, {'taskId': task_id, 'startedAt': started_at, 'threshold': threshold})
+        if claim_status == CLAIM_COMMITTED:
+            # Committed by another worker or before a restart - the flag may be all that's missing
+            self._put_notified_flags(mechanic_id, self.threshold_schedule.all_mask if notified_mask is None else notified_mask)
+        return claim_status, key
+    
+    def _recording_start(self, mechanic_id: str, duration: int) -> int:
+        """startedAt of a recording (epoch ms), stamped once by whichever worker gets there first if the app didn't set it"""
+        recording_data = self._read_recording(mechanic_id)
+        if isinstance(recording_data, dict) and recording_data.get('startedAt'):
+            return recording_data['startedAt']
+        
+        # Older app builds don't write startedAt; estimate it, and let a transaction keep the first stamp
+        estimate = int((time.time() - duration) * 1000)
+        def stamp(current):
+            if isinstance(current, dict) and not current.get('startedAt'):
+                current['startedAt'] = estimate
+            return current
+        with metrics.track_call('rtdb', 'transaction'):
+            stamped = self.db_ref.child(mechanic_id).transaction(stamp)
+        return stamped['startedAt'] if isinstance(stamped, dict) and stamped.get('startedAt') else estimate
     
-    def _create_notification_record(self, mechanic_id: str, title: str, message: str, notification_type: str, task_id: str = ''):
-        """Create a notification record in Firestore with document ID included"""
+    def _prune_claims(self, current_recordings: Dict[str, Any]):
+        """Forget claims whose recording session ended, so the fast path stays bounded by the fleet"""
+        for mechanic_id, key in list(self.dedup_index.claimed.items()):
+            session_key = self._recording_key(mechanic_id, current_recordings.get(mechanic_id))
+            if session_key is None or not is_session_key(key, session_key):
+                self.dedup_index.forget(mechanic_id)
+                if self.checkpoint:
+                    self.checkpoint.delete('notified', mechanic_id)
+    
+    def _checkpoint_tasks(self, candidates: List[Tuple[str, int, str, str]]):
+        """Persist the fields notifications need from each cached task, so a restart doesn't re-read them"""
+        if not self.checkpoint:
+            return
+        now = time.time()
+        needed = {task_id for task_id, _, _, _ in candidates}
+        for task_id, saved in self.checkpoint.items('tasks'):
+            if task_id not in needed and now - saved['fetchedAt'] >= self.task_cache_ttl:
+                self.checkpoint.delete('tasks', task_id)
+        
+        for task_id in needed:
+            saved = self.checkpoint.get('tasks', task_id)
+            if saved and now - saved['fetchedAt'] < self.task_cache_ttl / 2:
+                continue
+            found, task_data = self.task_cache.peek(task_id)
+            if found and task_data is not None:
+                fields = {field: task_data[field] for field in TASK_CHECKPOINT_FIELDS if field in task_data}
+                self.checkpoint.put('tasks', task_id, {'fetchedAt': now, 'data': fields})
+    
+    def _restore_checkpoint(self):
+        """Load committed notifications and unexpired task fields saved before a restart"""
+        restored_claims = 0
+        for mechanic_id, claim_key in self.checkpoint.items('notified'):
+            self.dedup_index.remember(mechanic_id, claim_key)
+            restored_claims += 1
+        
+        now = time.time()
+        restored_tasks = 0
+        for task_id, saved in self.checkpoint.items('tasks'):
+            remaining = self.task_cache_ttl - (now - saved.get('fetchedAt', 0))
+            if remaining > 0:
+                self.task_cache.put(task_id, saved.get('data'), ttl=remaining)
+                restored_tasks += 1
+            else:
+                self.checkpoint.delete('tasks', task_id)
+        logger.info("Restored notification state from checkpoint", extra={'claims': restored_claims, 'tasks': restored_tasks})
+    
+    def _create_notification_record(self, mechanic_id: str, title: str, message: str, notification_type: str, task_id: str = '',
+                                    claim_key: str = ''):
+        """Create a notification record in Firestore with document ID included (added to the cycle's write batch)"""
         try:
-            # Generate a new document reference to get the ID
-            doc_ref = self.firestore_client.collection('notifications').document()
+            # One record per claimed recording session and threshold, so a retried commit can't create a duplicate
+            # and a later session of the same task gets its own record
+            collection = self.firestore_client.collection('notifications')
+            if claim_key:
+                doc_ref = collection.document(f"{notification_type}_{claim_key}")
+            else:
+                doc_ref = collection.document(f"{notification_type}_{mechanic_id}_{task_id}") if task_id else collection.document()
             notification_id = doc_ref.id
             
             notification_data = {
@@ -259,82 +851,121 @@ class TaskNotificationService:
                 notification_data['taskId'] = task_id
             
             # Set the document with the generated ID
-            doc_ref.set(notification_data)
-            print(f"Notification record created for mechanic {mechanic_id}")
-            print(f"  -> Notification ID: {notification_id}")
+            self.pending_firestore_writes.append(('set', doc_ref, notification_data))
+            logger.info("Notification record prepared", extra={'mechanicId': mechanic_id, 'taskId': task_id, 'notificationId': notification_id})
             
             return notification_id
             
         except Exception as e:
-            print(f"Error creating notification record: {e}")
+            logger.exception("Error creating notification record: %s", e, extra={'mechanicId': mechanic_id})
             return None
     
     def _get_mechanic_info(self, mechanic_id: str) -> Optional[Dict[str, Any]]:
         """Get mechanic information from Firestore"""
         try:
-            mechanic_doc = self.firestore_client.collection('mechanics').document(mechanic_id).get()
-            if mechanic_doc.exists:
-                return mechanic_doc.to_dict()
-            return None
+            found, mechanic_data = self.mechanic_cache.get(mechanic_id)
+            if found:
+                return mechanic_data
+            
+            with metrics.track_call('firestore', 'get'):
+                mechanic_doc = self.firestore_client.collection('mechanics').document(mechanic_id).get()
+            mechanic_data = mechanic_doc.to_dict() if mechanic_doc.exists else None
+            self.mechanic_cache.put(mechanic_id, mechanic_data)
+            return mechanic_data
         except Exception as e:
-            print(f"Error getting mechanic info: {e}")
+            logger.exception("Error getting mechanic info: %s", e, extra={'mechanicId': mechanic_id})
             return None
     
     def get_statistics(self) -> Dict[str, Any]:
         """Get monitoring statistics"""
         try:
-            # Count total active tasks
-            active_tasks = (self.firestore_client.collection('tasks')
-                          .where('status', '==', 'inProgress')
-                          .get())
-            
-            # Count tasks that might need notification (manually check since compound queries are limited)
-            pending_count = 0
-            for task_doc in active_tasks:
-                task_data = task_doc.to_dict()
-                is_notified = task_data.get('isNotified', False)
-                if not is_notified:
-                    pending_count += 1
+            task_counts = self._get_task_counts()
             
             return {
                 'monitoring_status': self.monitoring,
                 'check_interval': self.check_interval,
-                'active_tasks': len(active_tasks),
-                'pending_notifications': pending_count
+                'active_tasks': task_counts['active_tasks'],
+                'pending_notifications': task_counts['pending_notifications'],
+                'notifications_committed': self.notifications_committed,
+                'rtdb_writes': self.write_buffer.get_statistics(),
+                'indexed_deadlines': len(self.exceedance_scheduler),
+                'full_check_interval': self.full_check_intervals.get_statistics() if self.full_check_intervals else None,
+                'fcm': self.notification_dispatcher.get_statistics(),
+                'runtime': self.runtime.get_statistics() if self.runtime else 'thread',
+                'task_cache': self.task_cache.get_statistics(),
+                'mechanic_cache': self.mechanic_cache.get_statistics(),
+                'shard': self.shard.get_statistics() if self.shard else None,
+                'checkpoint': self.checkpoint.get_statistics() if self.checkpoint else None,
+                'dedup': self.dedup_index.get_statistics(),
+                'overrun_analytics': self.overrun_analytics.get_statistics() if self.track_overruns else None
             }
         except Exception as e:
-            print(f"Error getting statistics: {e}")
+            logger.exception("Error getting statistics: %s", e)
             return {
                 'monitoring_status': self.monitoring,
                 'check_interval': self.check_interval,
                 'error': str(e)
             }
 
-def main():
-    """Main function to run the task notification service"""
-    print("Starting MechLink Task Notification Service...")
+    def _get_task_counts(self) -> Dict[str, int]:
+        """Active and not-yet-notified task counts, re-counted at most every statistics_ttl seconds"""
+        if self.task_counts is not None and time.monotonic() - self.task_counts_at < self.statistics_ttl:
+            return self.task_counts
+        
+        # count() aggregations are billed per 1000 index entries instead of one read per task document
+        active_tasks = self.firestore_client.collection('tasks').where('status', '==', 'inProgress')
+        active_count = self._count(active_tasks)
+        notified_count = self._count(active_tasks.where('isNotified', '==', True))
+        
+        self.task_counts = {
+            'active_tasks': active_count,
+            'pending_notifications': active_count - notified_count
+        }
+        self.task_counts_at = time.monotonic()
+        return self.task_counts
+    
+    def _count(self, query) -> int:
+        """Run a count() aggregation query"""
+        with metrics.track_call('firestore', 'count'):
+            result = query.count(alias='total').get()
+        return int(result[0][0].value)
+
+def main(shard: bool = False, worker_id: Optional[str] = None):
+    """Main function to run the task notification service (with shard, only for the mechanics this worker owns)"""
+    configure_logging()
+    logger.info("Starting MechLink Task Notification Service")
     
     try:
         # Create and start the notification service
-        service = TaskNotificationService()
+        _, db_ref, firestore_client = firebase_setup.initialize_firebase()
+        service = TaskNotificationService(db_ref=db_ref, firestore_client=firestore_client,
+                                          shard=open_shard(db_ref, shard, worker_id), checkpoint=open_checkpoint('notification'))
         service.start_monitoring()
         
-        print("Task notification service started successfully. Press Ctrl+C to stop.")
+        logger.info("Task notification service started successfully. Press Ctrl+C to stop.")
         
         # Keep the service running
         while True:
             time.sleep(300)  # Print stats every 5 minutes
             stats = service.get_statistics()
-            print(f"Task notification stats: {stats}")
+            logger.info("Task notification stats", extra={'stats': stats})
             
     except KeyboardInterrupt:
-        print("Received shutdown signal...")
+        logger.info("Received shutdown signal")
         service.stop_monitoring()
-        print("Task notification service stopped gracefully")
+        logger.info("Task notification service stopped gracefully")
     except Exception as e:
-        print(f"Service error: {e}")
+        logger.exception("Service error: %s", e)
         if 'service' in locals():
             service.stop_monitoring()
+    finally:
+        if 'service' in locals() and service.checkpoint:
+            service.checkpoint.close()
+        shutdown_logging()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="MechLink Task Notification Service")
+    parser.add_argument('--shard', action='store_true', help="Split mechanics with the other sharded workers (also: MECHLINK_SHARD=1)")
+    parser.add_argument('--worker-id', help="Stable shard worker ID, the same after a restart (default: $MECHLINK_WORKER_ID or the host name)")
+    args = parser.parse_args()
+    main(shard=args.shard, worker_id=args.worker_id)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+MechLink Tracked Recording
+Compact per-mechanic monitoring state: __slots__ fields, monotonic timestamps and packed status bits
+"""
+
+import time
+from typing import Dict, Any
+
+# Status bits packed into TrackedRecording.flags
+BACKGROUND = 1  # App is asleep and the service is counting for it
+NOTIFIED = 2  # Recording was already marked isNotified
+ANCHORED = 4  # background_started_at/background_base_duration are set
+
+class TrackedRecording:
+    __slots__ = ('task_id', 'device_id', 'last_duration', 'last_update', 'flags',
+                 'background_started_at', 'background_base_duration')
+
+    def __init__(self, task_id: str, device_id: str, last_duration: int, last_update: float, is_notified: bool = False):
+        """Monitoring state for one recording (last_update is a time.monotonic() value)"""
+        self.task_id = task_id
+        self.device_id = device_id
+        self.last_duration = last_duration
+        self.last_update = last_update
+        self.flags = NOTIFIED if is_notified else 0
+        self.background_started_at = 0  # Epoch milliseconds, valid while ANCHORED
+        self.background_base_duration = 0
+
+    @property
+    def is_background(self) -> bool:
+        """Whether the service is recording for a sleeping app"""
+        return bool(self.flags & BACKGROUND)
+
+    @is_background.setter
+    def is_background(self, value: bool):
+        self.flags = self.flags | BACKGROUND if value else self.flags & ~BACKGROUND
+
+    @property
+    def is_notified(self) -> bool:
+        """Whether the recording was already marked isNotified"""
+        return bool(self.flags & NOTIFIED)
+
+    @property
+    def has_anchor(self) -> bool:
+        """Whether a background anchor is set"""
+        return bool(self.flags & ANCHORED)
+
+    def set_anchor(self, started_at_ms: int, base_duration: int):
+        """Record the background anchor"""
+        self.background_started_at = started_at_ms
+        self.background_base_duration = base_duration
+        self.flags |= ANCHORED
+
+    def clear_anchor(self):
+        """Drop the background anchor"""
+        self.background_started_at = 0
+        self.background_base_duration = 0
+        self.flags &= ~ANCHORED
+
+    def last_update_epoch_ms(self) -> int:
+        """Wall-clock time of the last update, for anchors shared with other processes"""
+        return int((time.time() - (time.monotonic() - self.last_update)) * 1000)
+
+    def to_checkpoint(self) -> Dict[str, Any]:
+        """JSON form for the state checkpoint (timestamps as epoch milliseconds)"""
+        return {
+            'taskId': self.task_id,
+            'deviceId': self.device_id,
+            'duration': self.last_duration,
+            'updatedAt': self.last_update_epoch_ms(),
+            'flags': self.flags,
+            'backgroundStartedAt': self.background_started_at,
+            'backgroundBaseDuration': self.background_base_duration
+        }
+
+    @classmethod
+    def from_checkpoint(cls, data: Dict[str, Any]) -> 'TrackedRecording':
+        """Rebuild a record from to_checkpoint() output, mapping its wall-clock time back onto this process's monotonic clock"""
+        last_update = time.monotonic() - (time.time() - data['updatedAt'] / 1000)
+        tracked = cls(data['taskId'], data['deviceId'], data['duration'], last_update)
+        tracked.flags = data['flags']
+        tracked.background_started_at = data['backgroundStartedAt']
+        tracked.background_base_duration = data['backgroundBaseDuration']
+        return tracked